@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Serve it with an ASGI server, e.g.
+``uvicorn alx_travel_app.asgi:application --workers 4``, and set
+PAYMENT_VIEWS_ASYNC=1 so the payment endpoints run as async views and
+wait on Chapa without holding a thread. ``manage.py bench_asgi`` compares
+this mode with the threaded WSGI deployment.
 """
 
 import os
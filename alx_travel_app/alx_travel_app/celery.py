@@ -2,6 +2,11 @@ import os
 from celery import Celery
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
+# Celery runs Django's system checks when a worker boots, and the URL checks
+# import the whole API. Slim worker and beat processes skip them; run
+# `manage.py check` in CI instead.
+if os.environ.get('PROCESS_ROLE') in ('worker', 'beat'):
+    os.environ.setdefault('CELERY_SKIP_CHECKS', '1')
 
 app = Celery('alx_travel_app')
 app.config_from_object('django.conf:settings', namespace='CELERY')
@@ -0,0 +1,154 @@
+"""
+Archival of finished bookings, terminal payments and old Celery results.
+
+Rows are moved in primary-key chunks, each chunk in its own transaction,
+so the live tables are never locked for longer than one batch and an
+interrupted run simply picks up where it stopped.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedPayment, Booking, Payment, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_PAYMENT_STATUSES = (
+    Payment.Status.SUCCESS,
+    Payment.Status.FAILED,
+    Payment.Status.CANCELED,
+)
+
+
+def gateway_summaries(payment_ids):
+    """
+    Map payment id to a summary of its latest gateway event.
+
+    Built from the typed event columns only; compressed bodies are not read.
+    """
+    summaries = {}
+    events = (PaymentEvent.objects.filter(payment_id__in=payment_ids)
+              .order_by('payment_id', '-created_at', '-id')
+              .values('payment_id', 'kind', 'status', 'reference', 'amount',
+                      'currency', 'gateway_created_at', 'created_at'))
+    for event in events:
+        payment_id = event.pop('payment_id')
+        if payment_id in summaries:
+            continue
+        summaries[payment_id] = {
+            k: (str(v) if v is not None and not isinstance(v, str) else v)
+            for k, v in event.items()
+        }
+    return summaries
+
+
+def _move_in_chunks(queryset, archive_model, to_archive, batch_size):
+    """
+    Copy rows of ``queryset`` into ``archive_model``, then delete them.
+
+    ``to_archive`` maps a list of live instances to unsaved archive
+    instances. Each chunk is re-read through ``queryset`` under a row
+    lock, so a row that stopped matching after its pk was picked (a
+    payment retried, a stay extended) stays live. Returns the number of
+    rows moved.
+    """
+    model = queryset.model
+    moved = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return moved
+        with transaction.atomic():
+            rows = list(queryset.filter(pk__in=pks).select_for_update())
+            # ignore_conflicts keeps a re-run after a crash idempotent.
+            archive_model.objects.bulk_create(to_archive(rows), ignore_conflicts=True)
+            _, deleted = queryset.filter(pk__in=[row.pk for row in rows]).delete()
+        moved += deleted.get(model._meta.label, 0)
+        logger.info("Archived %s %s rows", moved, model._meta.model_name)
+
+
+def archive_payments(cutoff, batch_size):
+    """Archive SUCCESS/FAILED/CANCELED payments last updated before ``cutoff``."""
+    queryset = Payment.objects.filter(status__in=TERMINAL_PAYMENT_STATUSES, updated_at__lt=cutoff)
+
+    def to_archive(payments):
+        summaries = gateway_summaries([p.pk for p in payments])
+        return [ArchivedPayment(
+            tx_ref=p.tx_ref,
+            booking_reference=p.booking_reference,
+            amount=p.amount,
+            currency=p.currency,
+            amount_base=p.amount_base,
+            status=p.status,
+            processor_tx_id=p.processor_tx_id,
+            customer_email=p.customer_email,
+            gateway_summary=summaries.get(p.pk, {}),
+            created_at=p.created_at,
+            updated_at=p.updated_at,
+        ) for p in payments]
+
+    return _move_in_chunks(queryset, ArchivedPayment, to_archive, batch_size)
+
+
+def archive_bookings(cutoff, batch_size):
+    """Archive bookings whose stay ended before ``cutoff``."""
+    queryset = Booking.objects.filter(end_date__lt=cutoff.date())
+    return _move_in_chunks(queryset, ArchivedBooking, lambda bookings: [ArchivedBooking(
+        booking_id=b.booking_id,
+        property_id=b.property_id_id,
+        user_id=b.user_id_id,
+        start_date=b.start_date,
+        end_date=b.end_date,
+        total_price=b.total_price,
+        currency=b.currency,
+        total_price_base=b.total_price_base,
+        status=b.status,
+        created_at=b.created_at,
+    ) for b in bookings], batch_size)
+
+
+def purge_task_results(cutoff, batch_size):
+    """Delete Celery task results finished before ``cutoff``."""
+    from django_celery_results.models import TaskResult
+
+    purged = 0
+    while True:
+        pks = list(TaskResult.objects.filter(date_done__lt=cutoff)
+                   .order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return purged
+        TaskResult.objects.filter(pk__in=pks).delete()
+        purged += len(pks)
+
+
+def archive_history(days=None, result_days=None, batch_size=None):
+    """Run every archival step; returns the number of rows handled per step."""
+    now = timezone.now()
+    days = settings.ARCHIVE_AFTER_DAYS if days is None else days
+    result_days = settings.TASK_RESULT_RETENTION_DAYS if result_days is None else result_days
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    cutoff = now - timedelta(days=days)
+    return {
+        'payments': archive_payments(cutoff, batch_size),
+        'bookings': archive_bookings(cutoff, batch_size),
+        'task_results': purge_task_results(now - timedelta(days=result_days), batch_size),
+    }
+
+
+def find_payment(tx_ref):
+    """Look ``tx_ref`` up in the live table first, then in the archive."""
+    payment = Payment.objects.filter(tx_ref=tx_ref).first()
+    if payment is None:
+        payment = ArchivedPayment.objects.filter(tx_ref=tx_ref).first()
+    return payment
+
+
+async def afind_payment(tx_ref):
+    """Async ``find_payment``."""
+    payment = await Payment.objects.filter(tx_ref=tx_ref).afirst()
+    if payment is None:
+        payment = await ArchivedPayment.objects.filter(tx_ref=tx_ref).afirst()
+    return payment
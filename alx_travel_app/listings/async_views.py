@@ -0,0 +1,330 @@
+"""
+Async versions of the Chapa payment views.
+
+Under an ASGI server a request waiting on Chapa costs an event-loop task
+instead of a worker thread. Responses, throttles and authentication match
+the DRF views in ``views.py``; ``PAYMENT_VIEWS_ASYNC`` selects which set
+is routed.
+
+Django 4.2 runs every ORM, cache and session call in a thread, so the
+views batch that work: one hop authenticates and throttles, single reads
+use the async ORM, and each write path (which needs a transaction) is one
+hop. The gateway call itself holds no thread when httpx is installed.
+"""
+import json
+import logging
+import uuid
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import fx, gateway
+from .archive import afind_payment
+from .models import ArchivedPayment, Booking, Payment, PaymentEvent
+from .renderers import FastJSONRenderer
+from .throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
+
+logger = logging.getLogger(__name__)
+
+
+def json_response(data, status=200, headers=None):
+    """The same bytes DRF would render for ``data``."""
+    return HttpResponse(FastJSONRenderer().render(data), status=status,
+                        content_type='application/json', headers=headers)
+
+
+def gateway_busy_response(exc):
+    """503 telling the client when to retry after load shedding."""
+    return json_response(
+        {"detail": "Payment gateway is busy. Please retry shortly."},
+        status=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _payment_summary(payment):
+    return {
+        "status": payment.status,
+        "booking_reference": payment.booking_reference,
+        "amount": str(payment.amount),
+        "currency": payment.currency,
+        "processor_tx_id": payment.processor_tx_id,
+    }
+
+
+class AsyncPaymentView(View):
+    """
+    Base for the async payment views.
+
+    ``throttle_classes`` and ``throttle_scope`` work as on a DRF view, and
+    authentication uses DRF's default classes, so sessions still get CSRF
+    checks and Basic auth keeps working.
+    """
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = None
+    authenticate = True
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Like DRF, CSRF is enforced by SessionAuthentication, not the middleware.
+        # (Django 4.2's csrf_exempt() would hide that the view is a coroutine.)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = None
+        if self.authenticate:
+            response = await sync_to_async(self.check_request)(request)
+        if response is None:
+            response = await super().dispatch(request, *args, **kwargs)
+        # The headers APIView.finalize_response adds.
+        response.headers.setdefault('Allow', ', '.join(self._allowed_methods()))
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def check_request(self, request):
+        """Authenticate and apply the throttles; a response when the request is refused."""
+        drf_request = Request(request, authenticators=[auth() for auth in
+                                                       api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            drf_request.user  # runs the authenticators
+            view = SimpleNamespace(throttle_scope=self.throttle_scope)
+            waits = [throttle.wait() for throttle in (cls() for cls in self.throttle_classes)
+                     if not throttle.allow_request(drf_request, view)]
+            if waits:
+                waits = [wait for wait in waits if wait is not None]
+                raise exceptions.Throttled(max(waits) if waits else None)
+        except exceptions.APIException as exc:
+            status, headers = exc.status_code, {}
+            if getattr(exc, 'wait', None):
+                headers['Retry-After'] = '%d' % exc.wait
+            if status == 401:
+                # As in APIView: the first authenticator names the challenge, or it is a 403.
+                challenge = drf_request.authenticators[0].authenticate_header(drf_request)
+                if challenge:
+                    headers['WWW-Authenticate'] = challenge
+                else:
+                    status = 403
+            return json_response({"detail": exc.detail}, status=status, headers=headers)
+        return None
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        response = json_response({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+        if self.view_is_async:
+            async def func():
+                return response
+            return func()
+        return response
+
+    @staticmethod
+    def request_data(request):
+        """The parsed JSON or form body; raises ``ParseError`` on malformed JSON."""
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError as exc:
+                raise exceptions.ParseError(f"JSON parse error - {exc}")
+        return request.POST
+
+
+class InitiatePaymentView(AsyncPaymentView):
+    """
+    Initialize a payment for a booking using Chapa.
+    """
+    throttle_scope = 'payments'
+
+    async def post(self, request):
+        try:
+            data = self.request_data(request)
+        except exceptions.ParseError as exc:
+            return json_response({"detail": exc.detail}, status=400)
+        for field in ["booking_reference", "amount", "email"]:
+            if not data.get(field):
+                return json_response({"detail": f"{field} is required."}, status=400)
+
+        # The rate table is loaded in a worker thread only when this process's copy has expired.
+        table = fx.cached_rates()
+        if table is None:
+            table = await sync_to_async(fx.rates)()
+        try:
+            amount, currency = fx.parse_amount(data["amount"], data.get("currency", fx.base_currency()), table)
+        except fx.FxError as exc:
+            return json_response({"detail": str(exc)}, status=400)
+
+        booking_reference = str(data["booking_reference"])
+        email = data["email"]
+        first_name = data.get("first_name", "")
+        last_name = data.get("last_name", "")
+        return_url = data.get("return_url") or settings.CHAPA_RETURN_URL
+        callback_url = settings.CHAPA_CALLBACK_URL
+
+        tx_ref = f"{booking_reference}-{uuid.uuid4().hex[:10]}"
+        try:
+            booking_id = await (Booking.objects.filter(pk=uuid.UUID(booking_reference))
+                                .values_list('pk', flat=True).afirst())
+        except ValueError:
+            booking_id = None
+
+        payload = {
+            "amount": f"{amount:f}",
+            "currency": currency,
+            "email": email,
+            "first_name": first_name,
+            "last_name": last_name,
+            "tx_ref": tx_ref,
+            "return_url": return_url,
+        }
+        if callback_url:
+            payload["callback_url"] = callback_url
+
+        payment = await Payment.objects.acreate(
+            booking_id=booking_id,
+            booking_reference=booking_reference,
+            tx_ref=tx_ref,
+            amount=amount,
+            currency=currency,
+            status=Payment.Status.PENDING,
+            customer_email=email,
+            customer_first_name=first_name,
+            customer_last_name=last_name,
+        )
+
+        try:
+            status_code, data_resp = await gateway.ainitialize_transaction(payload)
+        except gateway.GatewayBusy as exc:
+            await sync_to_async(payment.mark_failed)({"error": str(exc), "when": "initialize_shed"})
+            return gateway_busy_response(exc)
+        except Exception as exc:
+            await sync_to_async(payment.mark_failed)({"error": str(exc), "when": "initialize_exception"})
+            return json_response({"detail": "Failed to contact payment gateway."}, status=502)
+
+        if status_code == 200 and data_resp.get("status") == "success":
+            checkout_url = data_resp.get("data", {}).get("checkout_url")
+            await sync_to_async(self.record_checkout)(payment, checkout_url, data_resp)
+            return json_response({
+                "message": "Payment initialized.",
+                "tx_ref": tx_ref,
+                "checkout_url": checkout_url
+            }, status=201)
+
+        await sync_to_async(payment.mark_failed)(data_resp)
+        return json_response({"detail": "Payment initialization failed.", "gateway": data_resp}, status=400)
+
+    @staticmethod
+    def record_checkout(payment, checkout_url, data_resp):
+        payment.checkout_url = checkout_url
+        payment.save(update_fields=["checkout_url", "updated_at"])
+        payment.record_event(PaymentEvent.Kind.INITIALIZED, data_resp)
+
+
+class VerifyPaymentView(AsyncPaymentView):
+    """
+    Verify a payment using Chapa.
+    """
+    throttle_scope = 'payments'
+
+    async def get(self, request):
+        return await self.verify(request.GET.get("tx_ref"))
+
+    async def verify(self, tx_ref):
+        if not tx_ref:
+            return json_response({"detail": "tx_ref is required."}, status=400)
+
+        payment = await afind_payment(tx_ref)
+        if payment is None:
+            return json_response({"detail": "Payment not found."}, status=404)
+        if isinstance(payment, ArchivedPayment):
+            # Archived payments are terminal; there is nothing left to verify.
+            return json_response({"message": "Payment already settled.", **_payment_summary(payment)})
+
+        try:
+            status_code, data_resp = await gateway.averify_transaction(tx_ref)
+        except gateway.GatewayBusy as exc:
+            return gateway_busy_response(exc)
+        except Exception as exc:
+            return json_response({"detail": "Verification error.", "error": str(exc)}, status=502)
+
+        if gateway.is_successful(status_code, data_resp):
+            await sync_to_async(self.record_success)(payment, data_resp)
+            return json_response({"message": "Payment verified successfully.", **_payment_summary(payment)})
+
+        await sync_to_async(payment.mark_failed)(data_resp)
+        return json_response({
+            "message": "Payment not successful.",
+            "status": payment.status,
+            "gateway": data_resp
+        }, status=400)
+
+    @staticmethod
+    def record_success(payment, data_resp):
+        payment.mark_success(data_resp)
+        gateway.notify_payment_success(payment)
+
+
+class PaymentStatusView(AsyncPaymentView):
+    """
+    Cheap payment status read for polling clients.
+
+    Terminal payments are answered from the cache or the database. Chapa
+    is only consulted for PENDING payments, and at most once per
+    PAYMENT_VERIFY_MIN_INTERVAL seconds for a given tx_ref.
+    """
+    throttle_scope = 'payment-status'
+
+    async def get(self, request):
+        tx_ref = request.GET.get("tx_ref")
+        if not tx_ref:
+            return json_response({"detail": "tx_ref is required."}, status=400)
+
+        cache_key = Payment.status_cache_key(tx_ref)
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            return json_response({**cached, "checked_gateway": False})
+
+        payment = await afind_payment(tx_ref)
+        if payment is None:
+            return json_response({"detail": "Payment not found."}, status=404)
+
+        checked_gateway = False
+        if payment.status == Payment.Status.PENDING:
+            # cache.add is atomic: only the first poller in each interval wins the gateway call.
+            if await cache.aadd(f"payment-verify-gate:{tx_ref}", True,
+                                timeout=settings.PAYMENT_VERIFY_MIN_INTERVAL):
+                checked_gateway = True
+                try:
+                    await gateway.arefresh_payment(payment)
+                except Exception as exc:
+                    logger.warning("Status refresh for %s failed: %s", tx_ref, exc)
+
+        body = {"tx_ref": payment.tx_ref, **_payment_summary(payment)}
+        if payment.status != Payment.Status.PENDING:
+            await cache.aset(cache_key, body, timeout=settings.PAYMENT_STATUS_CACHE_TTL)
+        return json_response({**body, "checked_gateway": checked_gateway})
+
+
+class ChapaWebhookView(VerifyPaymentView):
+    """
+    Optional webhook for Chapa callback.
+    """
+    http_method_names = ['post', 'options']
+    authenticate = False
+
+    async def post(self, request):
+        try:
+            data = self.request_data(request)
+        except exceptions.ParseError as exc:
+            return json_response({"detail": exc.detail}, status=400)
+        tx_ref = data.get("tx_ref") or (data.get("data") or {}).get("tx_ref")
+        if not tx_ref:
+            return json_response({"detail": "tx_ref missing."}, status=400)
+        return await self.verify(tx_ref)
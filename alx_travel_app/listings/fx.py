@@ -0,0 +1,212 @@
+"""
+Exchange rates and base-currency amounts.
+
+FxRate holds, per currency and day, how many units of FX_BASE_CURRENCY
+one unit of that currency buys. Rates are loaded with ``loaddata
+fx_rates`` or from FX_RATES_FILE by the ``refresh_fx_rates`` beat task,
+and each process keeps the whole table in memory for FX_CACHE_TTL
+seconds, so a conversion is a dict lookup and a bisect.
+
+Payments and bookings store their amount in the base currency when they
+are written (``amount_base``, ``total_price_base``), so revenue across
+currencies is a single ``Sum`` in the database. A stored base amount
+keeps the rate of the day it was written; ``backfill_base_amounts``
+fills rows written before the columns existed, at the rate of their
+creation date.
+"""
+import bisect
+import json
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+CENTS = Decimal('0.01')
+
+_lock = threading.Lock()
+_rates = {}
+_expires = 0.0
+
+
+class FxError(ValueError):
+    """An amount or currency that cannot be converted."""
+
+
+class UnknownCurrency(FxError):
+    pass
+
+
+def base_currency():
+    return settings.FX_BASE_CURRENCY
+
+
+def cached_rates():
+    """The in-memory table if it is still fresh, else None; never queries the database."""
+    return _rates if time.monotonic() < _expires else None
+
+
+def rates():
+    """``{currency: ([as_of, ...], [rate, ...])}`` in date order, reloaded once per FX_CACHE_TTL."""
+    global _rates, _expires
+    table = cached_rates()
+    if table is not None:
+        return table
+    from .models import FxRate
+
+    with _lock:
+        if time.monotonic() < _expires:
+            return _rates
+        loaded = {}
+        for currency, as_of, rate in FxRate.objects.order_by('currency', 'as_of').values_list(
+                'currency', 'as_of', 'rate'):
+            dates, values = loaded.setdefault(currency, ([], []))
+            dates.append(as_of)
+            values.append(rate)
+        _rates, _expires = loaded, time.monotonic() + settings.FX_CACHE_TTL
+        return _rates
+
+
+def invalidate():
+    """Drop this process's cached table; other processes reload when their TTL runs out."""
+    global _expires
+    _expires = 0.0
+
+
+def rate(currency, on=None, table=None):
+    """
+    Base units per unit of ``currency`` on date ``on`` (default: the latest rate).
+
+    Before the first known rate of a currency its earliest rate is used.
+    """
+    currency = currency.upper()
+    if currency == settings.FX_BASE_CURRENCY:
+        return Decimal(1)
+    entry = (rates() if table is None else table).get(currency)
+    if entry is None:
+        raise UnknownCurrency(f"No exchange rate for {currency}.")
+    dates, values = entry
+    if on is None:
+        return values[-1]
+    return values[max(bisect.bisect_right(dates, on) - 1, 0)]
+
+
+def to_base(amount, currency, on=None, table=None):
+    """``amount`` of ``currency`` in the base currency, rounded to cents."""
+    return (Decimal(amount) * rate(currency, on, table)).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def _fits(value, field):
+    """Whether ``value``, already rounded to cents, fits a DecimalField with two decimal places."""
+    return value.adjusted() < field.max_digits - field.decimal_places
+
+
+def parse_amount(amount, currency, table=None):
+    """
+    Validate a client-supplied amount and currency code.
+
+    Returns ``(Decimal amount, upper-case currency)``; raises FxError for
+    a non-positive or sub-cent amount, or one too large for
+    ``Payment.amount`` or ``Payment.amount_base``, and UnknownCurrency for
+    a currency without a rate.
+    """
+    from .models import Payment
+
+    invalid = FxError("amount must be a positive number with at most 2 decimal places.")
+    too_large = FxError("amount is too large.")
+    try:
+        value = Decimal(str(amount).strip())
+    except InvalidOperation:
+        raise invalid
+    if not value.is_finite() or value <= 0:
+        raise invalid
+    try:
+        rounded = value.quantize(CENTS)
+    except InvalidOperation:  # more digits than the decimal context holds
+        raise too_large
+    if rounded != value:
+        raise invalid
+    currency = str(currency or '').strip().upper()
+    table = rates() if table is None else table
+    if currency != settings.FX_BASE_CURRENCY and currency not in table:
+        raise UnknownCurrency(f"Unsupported currency: {currency or '(empty)'}.")
+    if not (_fits(rounded, Payment._meta.get_field('amount'))
+            and _fits(to_base(rounded, currency, table=table), Payment._meta.get_field('amount_base'))):
+        raise too_large
+    return rounded, currency
+
+
+def load_rates(document):
+    """
+    Upsert rates from ``{"base": "ETB", "as_of": "2026-10-01", "rates": {"USD": "141.2", ...}}``.
+
+    Rates are base units per unit of each currency. Returns the number of
+    rates written.
+    """
+    from .models import FxRate
+
+    if document.get('base', settings.FX_BASE_CURRENCY).upper() != settings.FX_BASE_CURRENCY:
+        raise FxError(f"Rates are quoted in {document['base']}, not {settings.FX_BASE_CURRENCY}.")
+    as_of = parse_date(str(document.get('as_of') or '')) or timezone.localdate()
+    rows = []
+    for currency, value in (document.get('rates') or {}).items():
+        try:
+            value = Decimal(str(value))
+        except InvalidOperation:
+            raise FxError(f"Invalid rate for {currency}: {value!r}.")
+        if not value.is_finite() or value <= 0:
+            raise FxError(f"Invalid rate for {currency}: {value}.")
+        rows.append(FxRate(currency=currency.upper(), as_of=as_of, rate=value))
+    FxRate.objects.bulk_create(rows, update_conflicts=True, unique_fields=['currency', 'as_of'],
+                               update_fields=['rate', 'updated_at'])
+    invalidate()
+    return len(rows)
+
+
+def load_rates_file(path):
+    with open(path) as f:
+        return load_rates(json.load(f))
+
+
+def _backfill(model, amount_field, base_field, batch_size, table):
+    """Fill ``base_field`` where it is empty, walking the primary key; returns ``(filled, skipped)``."""
+    filled = skipped = 0
+    last = None
+    while True:
+        queryset = model.objects.filter(**{f'{base_field}__isnull': True}).order_by('pk')
+        if last is not None:
+            queryset = queryset.filter(pk__gt=last)
+        rows = list(queryset.values_list('pk', amount_field, 'currency', 'created_at')[:batch_size])
+        if not rows:
+            return filled, skipped
+        last = rows[-1][0]
+        updates = []
+        for pk, amount, currency, created_at in rows:
+            try:
+                value = to_base(amount, currency, timezone.localdate(created_at), table)
+            except UnknownCurrency:
+                skipped += 1
+                continue
+            updates.append(model(pk=pk, **{base_field: value}))
+        model.objects.bulk_update(updates, [base_field])
+        filled += len(updates)
+
+
+def backfill_base_amounts(batch_size=None):
+    """
+    Fill the base amounts of rows written before they existed, at the rate
+    of each row's creation date. Rows in a currency without a rate are
+    left empty and counted. Returns ``{table: (filled, skipped)}``.
+    """
+    from .models import ArchivedBooking, ArchivedPayment, Booking, Payment
+
+    batch_size = batch_size or settings.FX_BACKFILL_BATCH_SIZE
+    table = rates()
+    return {
+        'payments': _backfill(Payment, 'amount', 'amount_base', batch_size, table),
+        'bookings': _backfill(Booking, 'total_price', 'total_price_base', batch_size, table),
+        'archived payments': _backfill(ArchivedPayment, 'amount', 'amount_base', batch_size, table),
+        'archived bookings': _backfill(ArchivedBooking, 'total_price', 'total_price_base', batch_size, table),
+    }
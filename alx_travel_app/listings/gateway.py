@@ -0,0 +1,189 @@
+"""
+Chapa payment gateway calls shared by the payment views.
+
+Outbound calls are capped per process by PAYMENT_GATEWAY_MAX_INFLIGHT.
+When every slot is taken the call fails fast with ``GatewayBusy`` instead
+of queueing, so a slow gateway cannot tie up every worker thread.
+
+The ``a``-prefixed coroutines serve the async payment views. They use
+httpx when it is installed; otherwise the blocking call runs on a thread
+pool with one thread per slot, so the event loop is never blocked. The
+slot is taken before the hand-off, so the pool's queue never fills.
+
+requests and httpx are imported on first use and the Chapa URLs are built
+per call from settings, so importing this module costs web and worker
+processes nothing at startup.
+"""
+import asyncio
+import functools
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .profiling import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 20  # seconds
+
+_inflight = threading.BoundedSemaphore(settings.PAYMENT_GATEWAY_MAX_INFLIGHT)
+_async_clients = weakref.WeakKeyDictionary()
+_blocking_pool = ThreadPoolExecutor(settings.PAYMENT_GATEWAY_MAX_INFLIGHT, thread_name_prefix='chapa')
+
+
+class GatewayBusy(Exception):
+    """Raised instead of waiting when all gateway call slots are in use."""
+
+    def __init__(self, retry_after=None):
+        self.retry_after = retry_after or settings.PAYMENT_GATEWAY_RETRY_AFTER
+        super().__init__(f"Payment gateway is busy; retry in {self.retry_after}s.")
+
+
+@contextmanager
+def gateway_slot():
+    """Hold one in-flight gateway slot, or raise ``GatewayBusy`` immediately."""
+    if not _inflight.acquire(blocking=False):
+        raise GatewayBusy()
+    try:
+        yield
+    finally:
+        _inflight.release()
+
+
+def chapa_url(action):
+    """URL of a Chapa transaction endpoint, e.g. ``chapa_url("verify")``."""
+    return f"{settings.CHAPA_PUBLIC_BASE}/v1/transaction/{action}"
+
+
+@functools.lru_cache(maxsize=None)
+def httpx_module():
+    """The httpx module, or None when it is not installed."""
+    try:
+        import httpx
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return httpx
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+def _initialize(payload):
+    import requests
+
+    resp = requests.post(chapa_url("initialize"), json=payload, headers=_headers(), timeout=DEFAULT_TIMEOUT)
+    return resp.status_code, resp.json()
+
+
+def _verify(tx_ref):
+    import requests
+
+    resp = requests.get(f"{chapa_url('verify')}/{tx_ref}", headers=_headers(), timeout=DEFAULT_TIMEOUT)
+    return resp.status_code, resp.json()
+
+
+def initialize_transaction(payload):
+    """POST ``payload`` to Chapa; returns ``(http_status, body)``."""
+    with span('gateway'), gateway_slot():
+        return _initialize(payload)
+
+
+def verify_transaction(tx_ref):
+    """Ask Chapa for the state of ``tx_ref``; returns ``(http_status, body)``."""
+    with span('gateway'), gateway_slot():
+        return _verify(tx_ref)
+
+
+def _async_client():
+    """One pooled httpx client per event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx_module().AsyncClient(timeout=DEFAULT_TIMEOUT)
+    return client
+
+
+async def _in_pool(func, *args):
+    """
+    Run a blocking call on the pool under a slot taken here, so a call over
+    the cap raises ``GatewayBusy`` instead of waiting in the pool's queue.
+    """
+    # The pool thread does not see this request's profile, so time it here.
+    with span('gateway'), gateway_slot():
+        return await asyncio.get_running_loop().run_in_executor(_blocking_pool, func, *args)
+
+
+async def ainitialize_transaction(payload):
+    """Async ``initialize_transaction``."""
+    if httpx_module() is None:
+        return await _in_pool(_initialize, payload)
+    with span('gateway'), gateway_slot():
+        resp = await _async_client().post(chapa_url("initialize"), json=payload, headers=_headers())
+    return resp.status_code, resp.json()
+
+
+async def averify_transaction(tx_ref):
+    """Async ``verify_transaction``."""
+    if httpx_module() is None:
+        return await _in_pool(_verify, tx_ref)
+    with span('gateway'), gateway_slot():
+        resp = await _async_client().get(f"{chapa_url('verify')}/{tx_ref}", headers=_headers())
+    return resp.status_code, resp.json()
+
+
+def is_successful(status_code, body):
+    """True when a verify response reports a completed payment."""
+    return (
+        status_code == 200
+        and body.get("status") == "success"
+        and (body.get("data") or {}).get("status") == "success"
+    )
+
+
+def is_failed(status_code, body):
+    """True when a verify response reports a payment that can no longer succeed."""
+    return status_code == 200 and (body.get("data") or {}).get("status") in ("failed", "cancelled")
+
+
+def notify_payment_success(payment):
+    """Queue the payment confirmation email, never failing the caller."""
+    try:
+        from .tasks import send_payment_confirmation_email
+        send_payment_confirmation_email.delay(payment.id)
+    except Exception:
+        logger.warning("Could not queue confirmation email for payment %s", payment.id)
+
+
+def refresh_payment(payment):
+    """
+    Re-check a PENDING payment with Chapa and record any terminal outcome.
+
+    Unlike the verify endpoint, an answer that is neither success nor an
+    explicit failure leaves the payment PENDING so it can be polled again.
+    """
+    status_code, body = verify_transaction(payment.tx_ref)
+    return _record_refresh(payment, status_code, body)
+
+
+async def arefresh_payment(payment):
+    """Async ``refresh_payment``; the outcome is recorded in one thread hop."""
+    status_code, body = await averify_transaction(payment.tx_ref)
+    return await sync_to_async(_record_refresh)(payment, status_code, body)
+
+
+def _record_refresh(payment, status_code, body):
+    if is_successful(status_code, body):
+        payment.mark_success(body)
+        notify_payment_success(payment)
+    elif is_failed(status_code, body):
+        payment.mark_failed(body)
+    return payment
@@ -0,0 +1,172 @@
+"""
+Grid-cell spatial index for listing search.
+
+A listing with coordinates stores ``geocell``: its longitude and latitude
+quantised to 26 bits each and bit-interleaved into a Z-order code, the
+integer form of a geohash. Every cell of a coarser grid is then one
+contiguous range of geocell values, so a plain B-tree index finds the
+listings in a cell on sqlite and PostgreSQL alike.
+
+A search covers its bounding box with at most MAX_CELLS cells of the
+finest grid level that allows it, reads the candidates in those ranges
+together with the other filters, and computes exact distances for the
+candidates in one vectorised pass (numpy when it is installed; it is
+imported on first use to keep it out of process startup).
+"""
+import functools
+import math
+
+from django.db.models import Q
+
+BITS = 26  # per axis; about 0.6 m at the equator
+MAX_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return numpy
+
+
+def _spread(value):
+    """Move bit i of a 32-bit value to bit 2i."""
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    return (value | (value << 1)) & 0x5555555555555555
+
+
+def _quantise(value, low, span):
+    return min(max(int((value - low) / span * (1 << BITS)), 0), (1 << BITS) - 1)
+
+
+def _cell(x, y):
+    return (_spread(x) << 1) | _spread(y)
+
+
+def encode(latitude, longitude):
+    """The geocell of a point, or None when either coordinate is missing."""
+    if latitude is None or longitude is None:
+        return None
+    return _cell(_quantise(longitude, -180.0, 360.0), _quantise(latitude, -90.0, 180.0))
+
+
+def cell_ranges(boxes):
+    """
+    Merged ``[low, high)`` geocell ranges covering ``(min_lat, min_lng, max_lat, max_lng)`` boxes.
+
+    Each box is covered at the finest level where it spans at most
+    MAX_CELLS cells, so the cover is never much larger than the box.
+    """
+    ranges = []
+    for min_lat, min_lng, max_lat, max_lng in boxes:
+        x0, x1 = _quantise(min_lng, -180.0, 360.0), _quantise(max_lng, -180.0, 360.0)
+        y0, y1 = _quantise(min_lat, -90.0, 180.0), _quantise(max_lat, -90.0, 180.0)
+        drop = 0
+        while ((x1 >> drop) - (x0 >> drop) + 1) * ((y1 >> drop) - (y0 >> drop) + 1) > MAX_CELLS:
+            drop += 1
+        shift = 2 * drop
+        for x in range(x0 >> drop, (x1 >> drop) + 1):
+            for y in range(y0 >> drop, (y1 >> drop) + 1):
+                cell = _cell(x, y)
+                ranges.append((cell << shift, (cell + 1) << shift))
+
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return [tuple(r) for r in merged]
+
+
+def split_box(min_lat, min_lng, max_lat, max_lng):
+    """A box as one or two boxes that do not cross the antimeridian."""
+    if min_lng <= max_lng:
+        return [(min_lat, min_lng, max_lat, max_lng)]
+    return [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+
+
+def radius_boxes(latitude, longitude, radius_km):
+    """Boxes enclosing the circle of ``radius_km`` around a point."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - dlat, latitude + dlat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return [(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)]
+    # Widest longitude span of the circle, reached at its northern or southern edge.
+    dlng = math.degrees(math.asin(min(math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)), 1.0)))
+    if dlng >= 180.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    min_lng, max_lng = longitude - dlng, longitude + dlng
+    if min_lng < -180.0:
+        min_lng += 360.0
+    if max_lng > 180.0:
+        max_lng -= 360.0
+    return split_box(min_lat, min_lng, max_lat, max_lng)
+
+
+def distances_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from a point to many points (haversine)."""
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    np = _numpy()
+    if np is not None:
+        lats, lngs = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+        a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+    sin, cos, radians = math.sin, math.cos, math.radians
+    cos_lat = cos(lat)
+    out = []
+    for other_lat, other_lng in zip(latitudes, longitudes):
+        other_lat = radians(other_lat)
+        a = sin((other_lat - lat) / 2) ** 2 + cos_lat * cos(other_lat) * sin((radians(other_lng) - lng) / 2) ** 2
+        out.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return out
+
+
+def _in_cells(queryset, boxes):
+    condition = Q()
+    for low, high in cell_ranges(boxes):
+        condition |= Q(geocell__gte=low, geocell__lt=high)
+    return queryset.filter(condition).values_list('pk', 'latitude', 'longitude')
+
+
+def within_radius(queryset, latitude, longitude, radius_km, limit=None):
+    """
+    ``(pk, distance_km)`` for listings of ``queryset`` within ``radius_km``, nearest first.
+
+    Returns ``(matches, candidates)``, where ``candidates`` is how many
+    rows the cell lookup read.
+    """
+    rows = list(_in_cells(queryset, radius_boxes(latitude, longitude, radius_km)))
+    if not rows:
+        return [], 0
+    pks, lats, lngs = zip(*rows)
+    matches = sorted(((pk, distance) for pk, distance in zip(pks, distances_km(latitude, longitude, lats, lngs))
+                      if distance <= radius_km), key=lambda match: match[1])
+    return matches[:limit], len(rows)
+
+
+def within_box(queryset, min_lat, min_lng, max_lat, max_lng, limit=None):
+    """
+    Listings of ``queryset`` inside a box, as ``(matches, candidates)`` like ``within_radius``.
+
+    A box with ``min_lng > max_lng`` crosses the antimeridian. Matches
+    come nearest the centre of the box first; their distances are None.
+    """
+    rows = list(_in_cells(queryset, split_box(min_lat, min_lng, max_lat, max_lng)))
+    crosses = min_lng > max_lng
+    inside = [(pk, lat, lng) for pk, lat, lng in rows
+              if min_lat <= lat <= max_lat and ((lng >= min_lng or lng <= max_lng) if crosses
+                                                else min_lng <= lng <= max_lng)]
+    if not inside:
+        return [], len(rows)
+    centre_lng = (min_lng + max_lng + (360.0 if crosses else 0.0)) / 2
+    centre_lng = centre_lng - 360.0 if centre_lng > 180.0 else centre_lng
+    pks, lats, lngs = zip(*inside)
+    ranked = sorted(zip(distances_km((min_lat + max_lat) / 2, centre_lng, lats, lngs), pks))
+    return [(pk, None) for _, pk in ranked[:limit]], len(rows)
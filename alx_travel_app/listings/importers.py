@@ -0,0 +1,266 @@
+"""
+Bulk import of partner listing feeds.
+
+Feeds are CSV or JSON Lines files with one listing per row, keyed on the
+partner's ``external_id``. Rows are streamed from disk, validated a whole
+batch at a time and upserted with a single ``bulk_create`` per batch, so
+memory stays flat and no per-row serializer or query is involved.
+"""
+import csv
+import io
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+
+from . import geo
+from .models import Listing, ListingImport, NightlyRate
+
+logger = logging.getLogger(__name__)
+
+TITLE_MAX_LENGTH = Listing._meta.get_field('title').max_length
+EXTERNAL_ID_MAX_LENGTH = Listing._meta.get_field('external_id').max_length
+PRICE_MAX = Decimal('99999999.99')  # max_digits=10, decimal_places=2
+CENTS = Decimal('0.01')
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+
+# Columns written on conflict; created_at is kept from the original row.
+UPSERT_FIELDS = ['title', 'description', 'price', 'is_active', 'latitude', 'longitude', 'geocell', 'updated_at']
+
+# Keep the stored report bounded even for badly broken feeds: past
+# MAX_REPORTED_BATCHES failing batches are only counted, so the report
+# stops being rewritten with every batch.
+MAX_ERRORS_PER_BATCH = 100
+MAX_REPORTED_BATCHES = 50
+
+
+def detect_format(path):
+    """Guess the feed format from the file extension."""
+    lower = str(path).lower()
+    if lower.endswith(('.jsonl', '.ndjson')):
+        return ListingImport.Format.JSONL
+    return ListingImport.Format.CSV
+
+
+def read_rows(fileobj, fmt):
+    """
+    Yield feed rows as dicts without loading the file into memory.
+
+    A JSONL line that is not valid JSON is yielded as ``None`` so that it
+    still counts as a row and ends up in the error report.
+    """
+    if fmt == ListingImport.Format.JSONL:
+        for line in fileobj:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+    else:
+        yield from csv.DictReader(fileobj)
+
+
+def _column(rows, name):
+    return [row.get(name) if row is not None else None for row in rows]
+
+
+def _text(values):
+    return ['' if v is None else str(v).strip() for v in values]
+
+
+def _decimal(value):
+    """A Decimal rounded to cents, or None when the cell is not a finite number."""
+    try:
+        value = Decimal(str(value).strip())
+        # NaN would parse, then fail every comparison with InvalidOperation.
+        return value.quantize(CENTS) if value.is_finite() else None
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _coordinate(value):
+    """A float, None for a blank cell, or NaN when the cell is not a number."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return float('nan')
+
+
+def _flag(value):
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    return None
+
+
+def validate_batch(rows, first_row):
+    """
+    Validate a batch of raw feed rows column by column.
+
+    Returns ``(listings, errors)``: unsaved ``Listing`` instances for the
+    valid rows (the last occurrence wins when an ``external_id`` repeats
+    within the batch) and a list of ``{"row", "external_id", "errors"}``
+    dicts for the rejected ones. ``first_row`` is the 1-based feed row
+    number of ``rows[0]``.
+    """
+    external_ids = _text(_column(rows, 'external_id'))
+    titles = _text(_column(rows, 'title'))
+    raw_descriptions = _column(rows, 'description')
+    prices = [_decimal(v) if v not in (None, '') else None for v in _column(rows, 'price')]
+    flags = [_flag(v) for v in _column(rows, 'is_active')]
+    latitudes = [_coordinate(v) for v in _column(rows, 'latitude')]
+    longitudes = [_coordinate(v) for v in _column(rows, 'longitude')]
+
+    valid = {}
+    errors = []
+    for i, row in enumerate(rows):
+        row_errors = {}
+        if row is None:
+            row_errors['row'] = 'Malformed row.'
+        else:
+            ext = external_ids[i]
+            if not ext:
+                row_errors['external_id'] = 'This field is required.'
+            elif len(ext) > EXTERNAL_ID_MAX_LENGTH:
+                row_errors['external_id'] = f'Ensure this field has no more than {EXTERNAL_ID_MAX_LENGTH} characters.'
+            if not titles[i]:
+                row_errors['title'] = 'This field is required.'
+            elif len(titles[i]) > TITLE_MAX_LENGTH:
+                row_errors['title'] = f'Ensure this field has no more than {TITLE_MAX_LENGTH} characters.'
+            if raw_descriptions[i] is None:
+                row_errors['description'] = 'This field is required.'
+            price = prices[i]
+            if price is None:
+                row_errors['price'] = 'A valid number is required.'
+            elif price < 0 or price > PRICE_MAX:
+                row_errors['price'] = f'Ensure this value is between 0 and {PRICE_MAX}.'
+            if flags[i] is None:
+                row_errors['is_active'] = 'Must be a valid boolean.'
+            for name, value, limit in (('latitude', latitudes[i], 90.0), ('longitude', longitudes[i], 180.0)):
+                if value is not None and value != value:  # NaN
+                    row_errors[name] = 'A valid number is required.'
+                elif value is not None and not -limit <= value <= limit:
+                    row_errors[name] = f'Ensure this value is between -{limit:g} and {limit:g}.'
+            if (latitudes[i] is None) != (longitudes[i] is None):
+                row_errors['location'] = 'Latitude and longitude must be given together.'
+
+        if row_errors:
+            errors.append({
+                'row': first_row + i,
+                'external_id': external_ids[i] or None,
+                'errors': row_errors,
+            })
+            continue
+
+        valid[external_ids[i]] = Listing(
+            external_id=external_ids[i],
+            title=titles[i],
+            description=str(raw_descriptions[i]),
+            price=prices[i],
+            is_active=flags[i],
+            latitude=latitudes[i],
+            longitude=longitudes[i],
+            # bulk_create skips save(), which sets geocell for single rows.
+            geocell=geo.encode(latitudes[i], longitudes[i]),
+        )
+    return list(valid.values()), errors
+
+
+def upsert_listings(listings):
+    """Insert or update ``listings`` on ``external_id`` in one statement per batch."""
+    if not listings:
+        return 0
+    Listing.objects.bulk_create(
+        listings,
+        update_conflicts=True,
+        unique_fields=['external_id'],
+        update_fields=UPSERT_FIELDS,
+    )
+    # bulk_create skips post_save, so drop stale nightly rates here.
+    NightlyRate.objects.filter(
+        listing__external_id__in=[listing.external_id for listing in listings]
+    ).delete()
+    return len(listings)
+
+
+def run_import(job, fileobj=None):
+    """
+    Run (or resume) ``job`` until its feed is exhausted.
+
+    Every batch is committed together with the job's checkpoint, so a run
+    that dies part-way can be restarted and continues after the last
+    committed batch.
+    """
+    owns_file = fileobj is None
+    if owns_file:
+        fileobj = io.open(job.source, newline='', encoding='utf-8-sig')
+
+    job.status = ListingImport.Status.RUNNING
+    job.save(update_fields=['status', 'updated_at'])
+
+    try:
+        rows = read_rows(fileobj, job.format)
+        if job.rows_processed:
+            # Drain the committed prefix; parsing is cheap next to writing.
+            for _ in islice(rows, job.rows_processed):
+                pass
+
+        batch_number = job.rows_processed // job.batch_size
+        while True:
+            batch = list(islice(rows, job.batch_size))
+            if not batch:
+                break
+            batch_number += 1
+            first_row = job.rows_processed + 1
+            listings, errors = validate_batch(batch, first_row)
+
+            with transaction.atomic():
+                upserted = upsert_listings(listings)
+                job.rows_processed += len(batch)
+                job.rows_upserted += upserted
+                job.rows_failed += len(errors)
+                update_fields = ['rows_processed', 'rows_upserted', 'rows_failed', 'updated_at']
+                if errors:
+                    job.batches_failed += 1
+                    update_fields.append('batches_failed')
+                    if len(job.error_report) < MAX_REPORTED_BATCHES:
+                        job.error_report.append({
+                            'batch': batch_number,
+                            'first_row': first_row,
+                            'rows': len(batch),
+                            'failed': len(errors),
+                            'errors': errors[:MAX_ERRORS_PER_BATCH],
+                        })
+                        update_fields.append('error_report')
+                job.save(update_fields=update_fields)
+            logger.info(
+                "Import %s: batch %s committed (%s rows, %s upserted, %s failed)",
+                job.pk, batch_number, len(batch), upserted, len(errors),
+            )
+    except Exception:
+        job.status = ListingImport.Status.FAILED
+        job.save(update_fields=['status', 'updated_at'])
+        logger.exception("Import %s failed after %s rows", job.pk, job.rows_processed)
+        raise
+    finally:
+        if owns_file:
+            fileobj.close()
+
+    job.status = ListingImport.Status.COMPLETED
+    job.save(update_fields=['status', 'updated_at'])
+    return job
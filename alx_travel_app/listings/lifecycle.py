@@ -0,0 +1,86 @@
+"""
+Booking status transitions, one at a time or in batches.
+
+Every move goes through BookingQuerySet.transition, a conditional UPDATE,
+so neither a request nor a batch job can overwrite a booking that another
+process moved in the meantime. Batch jobs work in primary-key chunks of
+BOOKING_TRANSITION_BATCH_SIZE, each in its own short transaction, and use
+the (status, created_at) index to find their candidates.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking
+from .rollups import booking_deltas, bookings_deltas, queue_deltas
+
+logger = logging.getLogger(__name__)
+
+
+def cancel_booking(booking):
+    """Cancel one booking, raising ``InvalidTransition`` if it is already cancelled."""
+    with transaction.atomic():
+        booking.transition_to(Booking.Status.CANCELLED)
+        queue_deltas(booking.property_id_id, booking_deltas(booking, sign=-1))
+
+
+def _in_batches(candidates, move, batch_size, on_moved=None):
+    """
+    Apply ``move(queryset, when)`` to ``candidates`` a batch at a time.
+
+    The bookings a batch actually moved are those now carrying its
+    ``updated_at`` stamp; they are passed to ``on_moved`` inside the batch
+    transaction. Candidates a concurrent writer moved first are skipped and
+    drop out of ``candidates`` for the next batch. Returns the number moved.
+    """
+    total = 0
+    while True:
+        pks = list(candidates.order_by('created_at').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return total
+        when = timezone.now()
+        with transaction.atomic():
+            moved = move(candidates.filter(pk__in=pks), when)
+            if moved and on_moved is not None:
+                on_moved(list(Booking.objects.filter(pk__in=pks, updated_at=when)))
+        total += moved
+
+
+def _queue_cancellations(bookings):
+    for listing_id, deltas in bookings_deltas(bookings, sign=-1).items():
+        queue_deltas(listing_id, deltas)
+
+
+def expire_unpaid_bookings(cutoff=None, batch_size=None):
+    """
+    Cancel pending bookings created before ``cutoff`` that were never paid.
+
+    ``cutoff`` defaults to BOOKING_PAYMENT_TIMEOUT_MINUTES ago. Returns the
+    number of bookings cancelled.
+    """
+    cutoff = cutoff or timezone.now() - timedelta(minutes=settings.BOOKING_PAYMENT_TIMEOUT_MINUTES)
+    batch_size = batch_size or settings.BOOKING_TRANSITION_BATCH_SIZE
+    candidates = (Booking.objects.filter(status=Booking.Status.PENDING, created_at__lt=cutoff)
+                  .exclude(pk__in=Booking.objects.paid().values('pk')))
+    expired = _in_batches(candidates, lambda qs, when: qs.cancel(when), batch_size, _queue_cancellations)
+    if expired:
+        logger.info("Expired %s unpaid bookings created before %s", expired, cutoff)
+    return expired
+
+
+def confirm_paid_bookings(batch_size=None):
+    """
+    Confirm pending bookings that already have a successful payment.
+
+    Payment.mark_success confirms its booking directly; this catches the
+    ones it could not, e.g. payments linked to their booking afterwards.
+    """
+    batch_size = batch_size or settings.BOOKING_TRANSITION_BATCH_SIZE
+    candidates = Booking.objects.filter(status=Booking.Status.PENDING).paid()
+    confirmed = _in_batches(candidates, lambda qs, when: qs.confirm(when), batch_size)
+    if confirmed:
+        logger.info("Confirmed %s paid bookings", confirmed)
+    return confirmed
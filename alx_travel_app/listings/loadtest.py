@@ -0,0 +1,200 @@
+"""
+Building blocks for the ``loadtest`` management command.
+
+The API is served in-process by Django's threaded WSGI server, wrapped so
+every response carries the number of SQL queries it ran. Chapa is
+replaced by a local stub server, so the payment endpoints are exercised
+end to end without leaving the machine.
+"""
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from celery import current_app
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.test.utils import override_settings
+
+from . import gateway
+from .throttling import TokenBucketThrottle
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+
+class _StubChapaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        time.sleep(self.server.latency)
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        tx_ref = request.get('tx_ref', '')
+        self._reply({
+            'status': 'success',
+            'message': 'Hosted Link',
+            'data': {'checkout_url': f'https://checkout.example.test/{tx_ref}'},
+        })
+
+    def do_GET(self):
+        tx_ref = self.path.rstrip('/').rsplit('/', 1)[-1]
+        self._reply({
+            'status': 'success',
+            'message': 'Payment details',
+            'data': {
+                'status': 'success',
+                'tx_ref': tx_ref,
+                'reference': f'AP{abs(hash(tx_ref)) % 10 ** 10}',
+                'amount': '100.00',
+                'currency': 'ETB',
+                'created_at': '2026-01-01T00:00:00.000000Z',
+            },
+        })
+
+
+@contextmanager
+def serve_in_thread(server):
+    """Run ``server.serve_forever`` in a daemon thread for the duration of the block."""
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def stub_chapa_server(latency=0.0):
+    """A local stand-in for the Chapa API; ``latency`` seconds are added to every reply."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubChapaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    return server
+
+
+@contextmanager
+def gateway_pointed_at(base_url, max_inflight=None):
+    """Send Chapa calls to ``base_url``, optionally with ``max_inflight`` call slots."""
+    saved = gateway._inflight, gateway._blocking_pool
+    if max_inflight is not None:
+        gateway._inflight = threading.BoundedSemaphore(max_inflight)
+        gateway._blocking_pool = ThreadPoolExecutor(max_inflight, thread_name_prefix='chapa')
+    try:
+        with override_settings(CHAPA_PUBLIC_BASE=base_url):
+            yield
+    finally:
+        if max_inflight is not None:
+            gateway._blocking_pool.shutdown()
+        gateway._inflight, gateway._blocking_pool = saved
+
+
+@contextmanager
+def background_work_inline():
+    """Run Celery tasks in the request thread and keep emails in memory."""
+    eager = current_app.conf.task_always_eager
+    current_app.conf.task_always_eager = True
+    try:
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            yield
+    finally:
+        current_app.conf.task_always_eager = eager
+
+
+@contextmanager
+def throttles_lifted():
+    rates = TokenBucketThrottle.THROTTLE_RATES
+    TokenBucketThrottle.THROTTLE_RATES = {}
+    try:
+        yield
+    finally:
+        TokenBucketThrottle.THROTTLE_RATES = rates
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def counting_wsgi_app():
+    """The project WSGI app, adding an X-Query-Count header to every response."""
+    django_app = WSGIHandler()
+
+    def app(environ, start_response):
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        def counted_start_response(status, headers, exc_info=None):
+            headers.append((QUERY_COUNT_HEADER, str(count[0])))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(counter):
+            return django_app(environ, counted_start_response)
+    return app
+
+
+def api_server():
+    """A threaded WSGI server for the project on a free local port."""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietRequestHandler, allow_reuse_address=False)
+    server.daemon_threads = True
+    server.set_app(counting_wsgi_app())
+    return server
+
+
+def summarize(latencies, errors, elapsed, queries):
+    """Throughput, latency percentiles (ms) and mean queries for one scenario."""
+    ms = sorted(latency * 1000 for latency in latencies)
+    cuts = statistics.quantiles(ms, n=100, method='inclusive') if len(ms) > 1 else ms * 99
+    return {
+        'requests': len(ms),
+        'errors': errors,
+        'throughput_rps': round(len(ms) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(ms), 2) if ms else 0.0,
+        'p50_ms': round(cuts[49], 2) if ms else 0.0,
+        'p95_ms': round(cuts[94], 2) if ms else 0.0,
+        'p99_ms': round(cuts[98], 2) if ms else 0.0,
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+    }
+
+
+def regressions(baseline, current, threshold):
+    """
+    Compare two result documents; returns a list of human-readable regressions.
+
+    A scenario regresses when its p95 latency or queries per request grow
+    by more than ``threshold`` (a fraction), or its throughput drops by
+    more than that.
+    """
+    found = []
+    for name, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            found.append(f"{name}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+        if before['throughput_rps'] and now['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            found.append(f"{name}: throughput {before['throughput_rps']} -> {now['throughput_rps']} req/s")
+        if (before.get('queries_per_request') is not None and now.get('queries_per_request') is not None
+                and now['queries_per_request'] > before['queries_per_request'] * (1 + threshold)):
+            found.append(f"{name}: queries/request {before['queries_per_request']} -> "
+                         f"{now['queries_per_request']}")
+        if now['errors'] > before['errors']:
+            found.append(f"{name}: errors {before['errors']} -> {now['errors']}")
+    return found
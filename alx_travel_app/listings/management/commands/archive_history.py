@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.archive import archive_history
+
+
+class Command(BaseCommand):
+    help = 'Move finished bookings and terminal payments to the archive tables and purge old task results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help='Archive rows older than this many days')
+        parser.add_argument('--result-days', type=int, default=settings.TASK_RESULT_RETENTION_DAYS,
+                            help='Purge Celery task results older than this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        counts = archive_history(
+            days=options['days'],
+            result_days=options['result_days'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {counts['payments']} payments and {counts['bookings']} bookings, "
+            f"purged {counts['task_results']} task results"
+        ))
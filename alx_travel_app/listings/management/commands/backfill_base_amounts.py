@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.fx import backfill_base_amounts
+
+
+class Command(BaseCommand):
+    help = 'Fill base-currency amounts of payments and bookings, live and archived, that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.FX_BACKFILL_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        counts = backfill_base_amounts(batch_size=options['batch_size'])
+        for name, (filled, skipped) in counts.items():
+            line = f"Filled {filled} {name}"
+            if skipped:
+                line += f", skipped {skipped} in currencies without a rate"
+            self.stdout.write(self.style.SUCCESS(line) if not skipped else self.style.WARNING(line))
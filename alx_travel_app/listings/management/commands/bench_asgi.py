@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from decimal import Decimal
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from listings import gateway
+from listings.loadtest import (
+    background_work_inline, gateway_pointed_at, serve_in_thread, stub_chapa_server, summarize,
+    throttles_lifted,
+)
+from listings.models import Payment
+from listings.urls import payment_urls
+
+ENDPOINTS = ('verify', 'status')
+
+
+def _urlconf(use_async):
+    module = types.ModuleType(f"bench_asgi_urls_{'async' if use_async else 'sync'}")
+    module.urlpatterns = payment_urls(use_async)
+    return module
+
+
+class Command(BaseCommand):
+    help = ('Compare the payment endpoints under WSGI (sync views, a fixed pool of worker threads) '
+            'and ASGI (async views on one event loop) against a slow stubbed Chapa')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='verify')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=64, help='Concurrent clients')
+        parser.add_argument('--wsgi-threads', type=int, default=8,
+                            help='Worker threads of the simulated WSGI deployment')
+        parser.add_argument('--gateway-latency', type=float, default=250.0,
+                            help='Milliseconds the stub Chapa server waits before replying')
+        parser.add_argument('--output', help='Write results as JSON to this path')
+
+    def handle(self, *args, **options):
+        count, concurrency = options['requests'], options['concurrency']
+        self.path = f"/api/payments/{options['endpoint']}/"
+        self.prefix = f"asgi-{uuid.uuid4().hex[:8]}"
+        Payment.objects.bulk_create([
+            Payment(booking_reference=f"{self.prefix}-{mode}", tx_ref=f"{self.prefix}-{mode}-{i}",
+                    amount=Decimal('100.00'), customer_email='bench@example.com')
+            for mode in ('wsgi', 'asgi') for i in range(count)
+        ], batch_size=1000)
+
+        results = {}
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(background_work_inline())
+                stack.enter_context(throttles_lifted())
+                # The test clients send Host: testserver, as under the test runner.
+                stack.enter_context(override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']))
+                chapa = stack.enter_context(serve_in_thread(stub_chapa_server(options['gateway_latency'] / 1000)))
+                # Slots are lifted too: this measures how each mode waits, not load shedding.
+                stack.enter_context(gateway_pointed_at(f"http://127.0.0.1:{chapa.server_port}",
+                                                       max_inflight=concurrency))
+
+                with override_settings(ROOT_URLCONF=_urlconf(use_async=False)):
+                    results['wsgi'] = self.run_wsgi(count, concurrency, options['wsgi_threads'])
+                self.print_row('wsgi', results['wsgi'])
+                with override_settings(ROOT_URLCONF=_urlconf(use_async=True)):
+                    results['asgi'] = asyncio.run(self.run_asgi(count, concurrency))
+                self.print_row('asgi', results['asgi'])
+        finally:
+            Payment.objects.filter(tx_ref__startswith=f"{self.prefix}-").delete()
+
+        if results['wsgi']['throughput_rps']:
+            self.stdout.write(f"ASGI/WSGI throughput: "
+                              f"{results['asgi']['throughput_rps'] / results['wsgi']['throughput_rps']:.2f}x")
+        if gateway.httpx_module() is None:
+            self.stdout.write(self.style.WARNING(
+                "httpx is not installed: async gateway calls ran in worker threads"))
+
+        if options['output']:
+            document = {
+                'meta': {
+                    'started_at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'endpoint': options['endpoint'],
+                    'requests': count,
+                    'concurrency': concurrency,
+                    'wsgi_threads': options['wsgi_threads'],
+                    'gateway_latency_ms': options['gateway_latency'],
+                    'async_gateway_client': 'httpx' if gateway.httpx_module() else 'threads',
+                },
+                'scenarios': results,
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def tx_ref(self, mode, i):
+        return f"{self.prefix}-{mode}-{i}"
+
+    def run_wsgi(self, count, concurrency, threads):
+        """``concurrency`` clients sharing ``threads`` request slots, as a threaded WSGI server would."""
+        slots = threading.BoundedSemaphore(threads)
+        local = threading.local()
+
+        def request(i):
+            started = time.perf_counter()
+            with slots:
+                if not hasattr(local, 'client'):
+                    local.client = Client()
+                response = local.client.get(self.path, {'tx_ref': self.tx_ref('wsgi', i)})
+            return time.perf_counter() - started, response.status_code < 400
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(request, range(count)))
+        return summarize([latency for latency, _ in outcomes], sum(not ok for _, ok in outcomes),
+                         time.perf_counter() - started, [])
+
+    async def run_asgi(self, count, concurrency):
+        """``concurrency`` clients on one event loop, each request an ASGI call into the project."""
+        clients = asyncio.Semaphore(concurrency)
+
+        async def request(i):
+            # ASGIHandler gives every request its own thread for sync code; the test client does not.
+            async with clients, ThreadSensitiveContext():
+                started = time.perf_counter()
+                response = await AsyncClient().get(self.path, {'tx_ref': self.tx_ref('asgi', i)})
+                return time.perf_counter() - started, response.status_code < 400
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(request(i) for i in range(count)))
+        return summarize([latency for latency, _ in outcomes], sum(not ok for _, ok in outcomes),
+                         time.perf_counter() - started, [])
+
+    def print_row(self, name, result):
+        style = self.style.ERROR if result['errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{name:<5} {result['throughput_rps']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms  "
+            f"{result['errors']} errors"
+        ))
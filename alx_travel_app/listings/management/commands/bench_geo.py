@@ -0,0 +1,125 @@
+import random
+import statistics
+import time
+import uuid
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from listings import geo
+from listings.models import Listing
+
+# Listings cluster around cities; the rest are spread over land-ish latitudes.
+CITIES = (
+    (9.03, 38.74), (51.51, -0.13), (40.71, -74.01), (35.68, 139.69), (-33.87, 151.21),
+    (-1.29, 36.82), (48.86, 2.35), (-23.55, -46.63), (19.43, -99.13), (1.35, 103.82),
+    (64.15, -21.94), (-36.85, 174.76), (30.04, 31.24), (55.76, 37.62), (-17.71, 178.07),
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure geo search over the geocell index against a full scan (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200, help='Queries per search kind')
+        parser.add_argument('--radius', type=float, default=5.0, help='Radius of circle searches in km')
+        parser.add_argument('--box', type=float, default=0.1, help='Side of box searches in degrees')
+        parser.add_argument('--verify', type=int, default=5,
+                            help='Queries per kind to re-run as a full scan and compare')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.seed(rng, options['listings'])
+            self.stdout.write(f"seeded {options['listings']:,} listings in {time.perf_counter() - started:.1f}s")
+
+            radius, side = options['radius'], options['box']
+            queries = [(self.point(rng), Decimal(rng.randint(100, 500))) for _ in range(options['queries'])]
+            radius_runs = self.run('radius', queries, lambda qs, lat, lng: geo.within_radius(qs, lat, lng, radius))
+            box_runs = self.run('bbox', queries, lambda qs, lat, lng: geo.within_box(qs, *self.box(lat, lng, side)))
+
+            checked = options['verify']
+            self.verify('radius', queries[:checked], radius_runs, lambda lat, lng, lats, lngs: [
+                d <= radius for d in geo.distances_km(lat, lng, lats, lngs)])
+            self.verify('bbox', queries[:checked], box_runs, lambda lat, lng, lats, lngs: [
+                self.in_box(self.box(lat, lng, side), a, b) for a, b in zip(lats, lngs)])
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def wrap(lng):
+        return (lng + 180.0) % 360.0 - 180.0
+
+    def box(self, lat, lng, side):
+        """``(min_lat, min_lng, max_lat, max_lng)`` of a square centred on a point."""
+        return (lat - side / 2, self.wrap(lng - side / 2), lat + side / 2, self.wrap(lng + side / 2))
+
+    @staticmethod
+    def in_box(box, lat, lng):
+        min_lat, min_lng, max_lat, max_lng = box
+        if not min_lat <= lat <= max_lat:
+            return False
+        if min_lng > max_lng:
+            return lng >= min_lng or lng <= max_lng
+        return min_lng <= lng <= max_lng
+
+    def point(self, rng):
+        lat, lng = rng.choice(CITIES)
+        return (max(min(lat + rng.gauss(0, 0.3), 89.9), -89.9), self.wrap(lng + rng.gauss(0, 0.3)))
+
+    def seed(self, rng, count):
+        prefix = f"geo-{uuid.uuid4().hex[:8]}"
+
+        def rows():
+            for i in range(count):
+                if i % 10:
+                    lat, lng = self.point(rng)
+                else:
+                    lat, lng = rng.uniform(-60, 70), rng.uniform(-180, 180)
+                yield Listing(external_id=f"{prefix}-{i}", title=f"Listing {i}", description="Bench listing",
+                              price=Decimal(rng.randint(20, 600)), is_active=i % 8 != 0,
+                              latitude=lat, longitude=lng, geocell=geo.encode(lat, lng))
+
+        batches = rows()
+        while batch := list(islice(batches, 10000)):
+            Listing.objects.bulk_create(batch)
+
+    def run(self, kind, queries, search):
+        timings, results, candidates, runs = [], 0, 0, []
+        for (lat, lng), max_price in queries:
+            queryset = Listing.objects.filter(is_active=True, price__lte=max_price)
+            started = time.perf_counter()
+            matches, read = search(queryset, lat, lng)
+            timings.append(time.perf_counter() - started)
+            results += len(matches)
+            candidates += read
+            runs.append({pk for pk, _ in matches})
+
+        cuts = statistics.quantiles(timings, n=20) if len(timings) > 1 else timings * 19
+        self.stdout.write(
+            f"{kind:<7} {len(queries):>5} queries  p50 {cuts[9] * 1000:>8.2f}  p95 {cuts[18] * 1000:>8.2f} ms  "
+            f"{results / len(queries):>8.1f} results  {candidates / max(results, 1):>6.2f} candidates/result")
+        return runs
+
+    def verify(self, kind, queries, runs, inside):
+        """Compare the first searches with a scan of every active listing."""
+        if not queries:
+            return
+        scanned = 0.0
+        for ((lat, lng), max_price), found in zip(queries, runs):
+            started = time.perf_counter()
+            rows = list(Listing.objects.filter(is_active=True, price__lte=max_price, latitude__isnull=False)
+                        .values_list('pk', 'latitude', 'longitude'))
+            pks, lats, lngs = zip(*rows) if rows else ((), (), ())
+            expected = {pk for pk, keep in zip(pks, inside(lat, lng, lats, lngs)) if keep}
+            scanned += time.perf_counter() - started
+            if expected != found:
+                raise CommandError(f"{kind} search at ({lat:.4f}, {lng:.4f}) found {len(found)} listings, "
+                                   f"a full scan {len(expected)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind:<7} {len(queries)} searches match a full scan "
+            f"({scanned / len(queries) * 1000:.0f} ms per scan)"))
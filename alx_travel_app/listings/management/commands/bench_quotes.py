@@ -0,0 +1,116 @@
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from listings.models import Listing, SeasonalRate, StayDiscount
+from listings.pricing import (
+    CENTS, WEEKEND_NIGHTS, build_nightly_rates, quote, quote_many,
+)
+
+
+class Command(BaseCommand):
+    help = 'Measure quote throughput over the nightly rate table (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quotes', type=int, default=1000000)
+        parser.add_argument('--listings', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=100,
+                            help='Stays per quote_many call, as on a search results page')
+        parser.add_argument('--singles', type=int, default=2000,
+                            help='Single-stay quotes to time separately')
+        parser.add_argument('--days', type=int, default=120, help='Nights of rates to precompute')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.start = timezone.localdate() + timedelta(days=1)
+        days = options['days']
+        with transaction.atomic():
+            ids = self.seed(options['listings'], days)
+            started = time.perf_counter()
+            written = build_nightly_rates(ids, self.start, self.start + timedelta(days=days))
+            self.report('precompute', written, time.perf_counter() - started, 'rates')
+
+            # Search pages: one date range, a page of listings.
+            n, page_size, pages = options['quotes'], options['page_size'], []
+            while n > 0:
+                size = min(page_size, n)
+                start, end = self.random_stay(rng, days)
+                pages.append([(listing_id, start, end) for listing_id in rng.sample(ids, size)])
+                n -= size
+            started = time.perf_counter()
+            quoted = sum(len(quote_many(page)) for page in pages)
+            self.report('quote_many', quoted, time.perf_counter() - started, 'quotes')
+
+            singles = [(rng.choice(ids), *self.random_stay(rng, days)) for _ in range(options['singles'])]
+            started = time.perf_counter()
+            results = [quote(*stay) for stay in singles]
+            self.report('quote', len(singles), time.perf_counter() - started, 'quotes')
+
+            self.check_against_loop(singles, results)
+            transaction.set_rollback(True)
+
+    def random_stay(self, rng, days):
+        nights = rng.randint(1, 14)
+        start = self.start + timedelta(days=rng.randrange(days - nights))
+        return start, start + timedelta(days=nights)
+
+    def seed(self, count, days):
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        Listing.objects.bulk_create([
+            Listing(external_id=f"{prefix}-{i}", title=f"Listing {i}", description="Bench listing",
+                    price=Decimal(50 + i % 400), weekend_price=Decimal(70 + i % 400) if i % 2 else None)
+            for i in range(count)
+        ], batch_size=1000)
+        ids = list(Listing.objects.filter(external_id__gte=f"{prefix}-", external_id__lt=f"{prefix}.")
+                   .values_list('pk', flat=True))
+        SeasonalRate.objects.bulk_create([
+            SeasonalRate(listing_id=listing_id, start_date=self.start + timedelta(days=30),
+                         end_date=self.start + timedelta(days=59), price=Decimal('199.99'))
+            for listing_id in ids[::3]
+        ])
+        StayDiscount.objects.bulk_create([
+            StayDiscount(listing_id=listing_id, min_nights=min_nights, percent=percent)
+            for listing_id in ids[::2]
+            for min_nights, percent in ((7, Decimal('10')), (28, Decimal('25')))
+        ])
+        return ids
+
+    def check_against_loop(self, stays, results):
+        """Re-price the single-stay sample night by night and compare."""
+        listings = {l.pk: l for l in Listing.objects.filter(pk__in={s[0] for s in stays})}
+        seasons, discounts = defaultdict(list), defaultdict(list)
+        for season in SeasonalRate.objects.filter(listing_id__in=listings).order_by('created_at', 'id'):
+            seasons[season.listing_id].append(season)
+        for rule in StayDiscount.objects.filter(listing_id__in=listings).order_by('-min_nights'):
+            discounts[rule.listing_id].append(rule)
+
+        for (listing_id, start, end), result in zip(stays, results):
+            listing, subtotal, night = listings[listing_id], Decimal('0.00'), start
+            while night < end:
+                price = listing.price
+                if listing.weekend_price is not None and night.weekday() in WEEKEND_NIGHTS:
+                    price = listing.weekend_price
+                for season in seasons[listing_id]:
+                    if season.start_date <= night <= season.end_date:
+                        price = season.price
+                subtotal += price
+                night += timedelta(days=1)
+            nights = (end - start).days
+            rule = next((r for r in discounts[listing_id] if nights >= r.min_nights), None)
+            total = subtotal - ((subtotal * rule.percent / 100).quantize(CENTS, rounding=ROUND_HALF_UP) if rule else 0)
+            if (subtotal, total) != (result['subtotal'], result['total']):
+                raise CommandError(f"Quote mismatch for {listing_id} {start}..{end}: "
+                                   f"{result['subtotal']}/{result['total']} != {subtotal}/{total}")
+        self.stdout.write(self.style.SUCCESS(f"{len(stays)} quotes match a night-by-night loop"))
+
+    def report(self, label, count, elapsed, unit):
+        self.stdout.write(f"{label:<12} {count:>10,} {unit} in {elapsed:7.2f}s   "
+                          f"{count / elapsed:>12,.0f} {unit}/s")
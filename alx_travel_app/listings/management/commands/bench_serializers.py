@@ -0,0 +1,81 @@
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from listings.models import Booking, Listing, User
+from listings.renderers import FastJSONRenderer
+from listings.serializers import (
+    BookingSerializer, LeanBookingSerializer, LeanListingSerializer, ListingSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/s of the lean list serializers with the ModelSerializers (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows per page')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            listings, bookings = self.seed(rows)
+            self.compare('listings', rows,
+                         lambda: ListingSerializer(listings, many=True).data,
+                         lambda: LeanListingSerializer().serialize(listings))
+            self.compare('bookings', rows,
+                         lambda: BookingSerializer(bookings, many=True).data,
+                         lambda: LeanBookingSerializer().serialize(bookings))
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        user = User.objects.create(username=prefix, email=f"{prefix}@example.com")
+        Listing.objects.bulk_create([
+            Listing(external_id=f"{prefix}-{i}", title=f"Listing {i}",
+                    description="Bench listing " * 8, price=Decimal(i % 900) + Decimal('0.5'))
+            for i in range(rows)
+        ], batch_size=1000)
+        # A range on the unique external_id index, unlike LIKE on sqlite.
+        listings = Listing.objects.filter(
+            external_id__gte=f"{prefix}-", external_id__lt=f"{prefix}."
+        ).order_by('id')
+        start = date(2030, 1, 1)
+        Booking.objects.bulk_create([
+            Booking(property_id=listing, user_id=user, start_date=start + timedelta(days=i),
+                    end_date=start + timedelta(days=i + 2), total_price=listing.price * 2)
+            for i, listing in enumerate(listings)
+        ], batch_size=1000)
+        bookings = (Booking.objects.with_payment_status().filter(user_id=user)
+                    .select_related('user_id').order_by('booking_id'))
+        return listings, bookings
+
+    def best_of(self, func):
+        best, result = None, None
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def compare(self, label, rows, model_serialize, lean_serialize):
+        model_time, model_data = self.best_of(model_serialize)
+        lean_time, lean_data = self.best_of(lean_serialize)
+        model_render_time, model_bytes = self.best_of(lambda: JSONRenderer().render(model_serialize()))
+        lean_render_time, lean_bytes = self.best_of(lambda: FastJSONRenderer().render(lean_serialize()))
+
+        if model_bytes != lean_bytes:
+            raise CommandError(f"{label}: lean output differs from the ModelSerializer output")
+
+        self.stdout.write(self.style.SUCCESS(f"{label} ({rows} rows/page, output identical)"))
+        self.stdout.write(f"  serialize          model {rows / model_time:>10,.0f} rows/s   "
+                          f"lean {rows / lean_time:>10,.0f} rows/s   x{model_time / lean_time:.1f}")
+        self.stdout.write(f"  serialize+render   model {rows / model_render_time:>10,.0f} rows/s   "
+                          f"lean {rows / lean_render_time:>10,.0f} rows/s   x{model_render_time / lean_render_time:.1f}")
@@ -0,0 +1,57 @@
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from listings.gateway import gateway_slot
+from listings.throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
+
+
+class _BenchView(APIView):
+    # Unique per run so the benchmark never collides with real buckets.
+    throttle_scope = f"bench-{uuid.uuid4().hex[:8]}"
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the token-bucket throttles and the gateway slot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--clients', type=int, default=1000,
+                            help='Distinct client addresses to spread requests over')
+
+    def handle(self, *args, **options):
+        n = options['requests']
+        clients = options['clients']
+        factory = APIRequestFactory()
+        requests = [
+            factory.get('/', REMOTE_ADDR=f"10.0.{i // 256 % 256}.{i % 256}")
+            for i in range(clients)
+        ]
+        for i, request in enumerate(requests):
+            request.user = SimpleNamespace(pk=i, is_authenticated=True)
+        view = _BenchView()
+
+        for throttle_class in (IPTokenBucketThrottle, UserTokenBucketThrottle):
+            # Effectively unlimited so every check takes the admit path.
+            rates = {f"{view.throttle_scope}-{throttle_class.scope_suffix}": f"{n}/s"}
+            throttle = type(throttle_class.__name__, (throttle_class,), {'THROTTLE_RATES': rates})()
+            start = time.perf_counter()
+            for i in range(n):
+                throttle.allow_request(requests[i % clients], view)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{throttle_class.__name__:<26} {elapsed / n * 1e6:8.2f} us/request "
+                f"({n / elapsed:,.0f} checks/s, cache: {caches['default'].__class__.__name__})"
+            )
+
+        start = time.perf_counter()
+        for _ in range(n):
+            with gateway_slot():
+                pass
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{'gateway_slot':<26} {elapsed / n * 1e6:8.2f} us/call")
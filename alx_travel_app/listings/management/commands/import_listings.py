@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.importers import detect_format, run_import
+from listings.models import ListingImport
+
+
+class Command(BaseCommand):
+    help = 'Bulk upsert listings from a partner CSV or JSONL feed, keyed on external_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Feed file to import')
+        parser.add_argument('--format', choices=ListingImport.Format.values,
+                            help='Feed format (default: guessed from the extension)')
+        parser.add_argument('--batch-size', type=int, default=settings.LISTING_IMPORT_BATCH_SIZE)
+        parser.add_argument('--resume', type=int, metavar='IMPORT_ID',
+                            help='Continue an interrupted import from its last checkpoint')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                job = ListingImport.objects.get(pk=options['resume'])
+            except ListingImport.DoesNotExist:
+                raise CommandError(f"Import {options['resume']} does not exist.")
+            if job.status == ListingImport.Status.COMPLETED:
+                raise CommandError(f"Import {job.pk} has already completed.")
+            self.stdout.write(f"Resuming import {job.pk} after row {job.rows_processed}")
+        else:
+            if not options['path']:
+                raise CommandError('A feed path is required unless --resume is given.')
+            if options['batch_size'] < 1:
+                raise CommandError('--batch-size must be positive.')
+            job = ListingImport.objects.create(
+                source=options['path'],
+                format=options['format'] or detect_format(options['path']),
+                batch_size=options['batch_size'],
+            )
+
+        try:
+            run_import(job)
+        except OSError as exc:
+            raise CommandError(f"Import {job.pk} failed: {exc}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Import {job.pk} completed: {job.rows_processed} rows, "
+            f"{job.rows_upserted} upserted, {job.rows_failed} rejected"
+        ))
+        for batch in job.error_report:
+            self.stdout.write(self.style.WARNING(
+                f"  batch {batch['batch']} (rows {batch['first_row']}+): {batch['failed']} rejected"
+            ))
+        if job.batches_failed > len(job.error_report):
+            self.stdout.write(self.style.WARNING(
+                f"  and {job.batches_failed - len(job.error_report)} more batches with rejected rows"
+            ))
@@ -0,0 +1,261 @@
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from listings.loadtest import (
+    QUERY_COUNT_HEADER, api_server, background_work_inline, gateway_pointed_at, regressions,
+    serve_in_thread, stub_chapa_server, summarize, throttles_lifted,
+)
+from listings.models import Booking, Listing, Payment, User
+
+SCENARIOS = (
+    'listings', 'listing-detail', 'bookings', 'quote', 'booking-create',
+    'payment-initiate', 'payment-verify', 'payment-webhook', 'payment-status',
+)
+
+
+class Command(BaseCommand):
+    help = ('Drive the API with concurrent clients against seeded data and a stubbed Chapa; '
+            'report throughput, latency percentiles and queries per request')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated subset of: {', '.join(SCENARIOS)}")
+        parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--listings', type=int, default=200, help='Listings to seed')
+        parser.add_argument('--users', type=int, default=10, help='Users to seed')
+        parser.add_argument('--bookings-per-user', type=int, default=10)
+        parser.add_argument('--gateway-latency', type=float, default=20.0,
+                            help='Milliseconds the stub Chapa server waits before replying')
+        parser.add_argument('--keep-throttles', action='store_true',
+                            help='Leave the API throttles on (by default they are lifted)')
+        parser.add_argument('--output', help='Write results as JSON to this path')
+        parser.add_argument('--baseline',
+                            help='Results JSON from an earlier run with the same options to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative regression against --baseline (0.2 = 20%%)')
+        parser.add_argument('--keep-data', action='store_true', help='Do not delete the seeded rows')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        scenarios = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        self.rng = random.Random(options['seed'])
+        self.prefix = f"load-{uuid.uuid4().hex[:8]}"
+        self.seed_data(options['listings'], options['users'], options['bookings_per_user'])
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(background_work_inline())
+                if not options['keep_throttles']:
+                    stack.enter_context(throttles_lifted())
+                chapa = stack.enter_context(serve_in_thread(stub_chapa_server(options['gateway_latency'] / 1000)))
+                stack.enter_context(gateway_pointed_at(f"http://127.0.0.1:{chapa.server_port}"))
+                api = stack.enter_context(serve_in_thread(api_server()))
+                self.base_url = f"http://127.0.0.1:{api.server_port}"
+
+                results = {}
+                for name in scenarios:
+                    results[name] = self.run_scenario(name, options['requests'], options['concurrency'])
+                    self.print_row(name, results[name])
+        finally:
+            if not options['keep_data']:
+                self.cleanup()
+
+        document = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'scenarios': scenarios,
+                'concurrency': options['concurrency'],
+                'requests_per_scenario': options['requests'],
+                'listings': options['listings'],
+                'users': options['users'],
+                'bookings_per_user': options['bookings_per_user'],
+                'gateway_latency_ms': options['gateway_latency'],
+                'throttled': options['keep_throttles'],
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            # Later scenarios see the state earlier ones left behind, e.g. settled payments.
+            changed = sorted(key for key, value in document['meta'].items()
+                             if key != 'started_at' and baseline.get('meta', {}).get(key) != value)
+            if changed:
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline was run with different settings ({', '.join(changed)}); "
+                    "numbers may not be comparable"))
+            found = regressions(baseline, document, options['threshold'])
+            if found:
+                raise CommandError("Regressions against baseline:\n  " + "\n  ".join(found))
+            self.stdout.write(self.style.SUCCESS(
+                f"No regressions beyond {options['threshold']:.0%} against {options['baseline']}"))
+
+    # -------------------------------
+    # Seeding and environment
+    # -------------------------------
+
+    def seed_data(self, listings, users, bookings_per_user):
+        prefix = self.prefix
+        Listing.objects.bulk_create([
+            Listing(external_id=f"{prefix}-{i}", title=f"Load listing {i}", description="Load test listing",
+                    price=Decimal(40 + i % 300), weekend_price=Decimal(60 + i % 300) if i % 2 else None)
+            for i in range(listings)
+        ], batch_size=1000)
+        self.listing_ids = [str(pk) for pk in Listing.objects.filter(
+            external_id__gte=f"{prefix}-", external_id__lt=f"{prefix}.").values_list('pk', flat=True)]
+
+        User.objects.bulk_create([
+            User(username=f"{prefix}-{i}", email=f"{prefix}-{i}@example.com", password='!')
+            for i in range(users)
+        ])
+        self.users = list(User.objects.filter(username__startswith=f"{prefix}-").order_by('username'))
+
+        start = timezone.localdate() + timedelta(days=30)
+        Booking.objects.bulk_create([
+            Booking(property_id_id=self.listing_ids[(u * bookings_per_user + b) % listings], user_id=user,
+                    start_date=start + timedelta(days=3 * b), end_date=start + timedelta(days=3 * b + 2),
+                    total_price=Decimal('200.00'))
+            for u, user in enumerate(self.users)
+            for b in range(bookings_per_user)
+        ], batch_size=1000)
+        bookings = list(Booking.objects.filter(user_id__in=self.users).values_list('pk', 'user_id__email'))
+        Payment.objects.bulk_create([
+            Payment(booking_id=pk, booking_reference=str(pk), tx_ref=f"{prefix}-{i}",
+                    amount=Decimal('200.00'), customer_email=email)
+            for i, (pk, email) in enumerate(bookings)
+        ], batch_size=1000)
+        self.booking_refs = [(str(pk), email) for pk, email in bookings]
+        self.tx_refs = [f"{prefix}-{i}" for i in range(len(bookings))]
+
+        self.session_keys = []
+        for user in self.users:
+            store = SessionStore()
+            store[SESSION_KEY] = str(user.pk)
+            store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            store.create()
+            self.session_keys.append(store.session_key)
+        self.stdout.write(f"Seeded {len(self.listing_ids)} listings, {len(self.users)} users, "
+                          f"{len(bookings)} bookings and payments ({prefix})")
+
+    def cleanup(self):
+        Payment.objects.filter(tx_ref__startswith=f"{self.prefix}-").delete()
+        Payment.objects.filter(booking__user_id__in=self.users).delete()
+        User.objects.filter(pk__in=[u.pk for u in self.users]).delete()
+        Listing.objects.filter(pk__in=self.listing_ids).delete()
+        SessionStore.get_model_class().objects.filter(session_key__in=self.session_keys).delete()
+
+    # -------------------------------
+    # Scenarios
+    # -------------------------------
+
+    def build_request(self, name, i):
+        """``(method, path, kwargs)`` for request ``i`` of scenario ``name``."""
+        if name == 'listings':
+            return 'GET', '/api/property/', {}
+        if name == 'listing-detail':
+            return 'GET', f"/api/property/{self.listing_ids[i % len(self.listing_ids)]}/", {}
+        if name == 'bookings':
+            return 'GET', '/api/bookings/', {}
+        if name == 'quote':
+            start = timezone.localdate() + timedelta(days=1 + i % 60)
+            end = start + timedelta(days=1 + i % 10)
+            stays = [{'listing': listing_id, 'start_date': str(start), 'end_date': str(end)}
+                     for listing_id in self.rng.sample(self.listing_ids, min(20, len(self.listing_ids)))]
+            return 'POST', '/api/quotes/', {'json': {'stays': stays}}
+        if name == 'booking-create':
+            n = len(self.listing_ids)
+            start = timezone.localdate() + timedelta(days=400 + 2 * (i // n))
+            return 'POST', '/api/bookings/', {'json': {
+                'property_id': self.listing_ids[i % n],
+                'start_date': str(start), 'end_date': str(start + timedelta(days=1)),
+            }}
+        if name == 'payment-initiate':
+            reference, email = self.booking_refs[i % len(self.booking_refs)]
+            return 'POST', '/api/payments/initiate/', {'json': {
+                'booking_reference': reference, 'amount': '200.00', 'email': email,
+            }}
+        tx_ref = self.tx_refs[i % len(self.tx_refs)]
+        if name == 'payment-verify':
+            return 'GET', '/api/payments/verify/', {'params': {'tx_ref': tx_ref}}
+        if name == 'payment-webhook':
+            return 'POST', '/api/payments/webhook/', {'json': {'tx_ref': tx_ref}}
+        return 'GET', '/api/payments/status/', {'params': {'tx_ref': tx_ref}}
+
+    def client(self, worker):
+        """A keep-alive HTTP session logged in as one of the seeded users."""
+        session = requests.Session()
+        csrf = get_random_string(32)
+        session.cookies.set(settings.SESSION_COOKIE_NAME, self.session_keys[worker % len(self.session_keys)])
+        session.cookies.set(settings.CSRF_COOKIE_NAME, csrf)
+        session.headers['X-CSRFToken'] = csrf
+        return session
+
+    def run_scenario(self, name, count, concurrency):
+        counter = itertools.count()
+        lock = threading.Lock()
+        latencies, queries, errors = [], [], [0]
+
+        def worker(worker_id):
+            session = self.client(worker_id)
+            while True:
+                i = next(counter)
+                if i >= count:
+                    return
+                method, path, kwargs = self.build_request(name, i)
+                started = time.perf_counter()
+                try:
+                    response = session.request(method, self.base_url + path, timeout=60, **kwargs)
+                    ok = response.status_code < 400
+                except requests.RequestException:
+                    response, ok = None, False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if not ok:
+                        errors[0] += 1
+                    if response is not None and QUERY_COUNT_HEADER in response.headers:
+                        queries.append(int(response.headers[QUERY_COUNT_HEADER]))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker, w) for w in range(concurrency)]:
+                future.result()
+        return summarize(latencies, errors[0], time.perf_counter() - started, queries)
+
+    def print_row(self, name, result):
+        style = self.style.ERROR if result['errors'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{name:<17} {result['throughput_rps']:>8.1f} req/s  "
+            f"p50 {result['p50_ms']:>8.2f}  p95 {result['p95_ms']:>8.2f}  p99 {result['p99_ms']:>8.2f} ms  "
+            f"{result['queries_per_request'] or 0:>6.2f} q/req  {result['errors']} errors"
+        ))
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from listings.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-listing dashboard rollups from bookings, archived bookings and reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listing', action='append', dest='listings',
+                            help='Only rebuild this listing id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=settings.ROLLUP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_rollups(options['listings'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {rebuilt} listings"))
@@ -0,0 +1,69 @@
+import json
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from listings import profiling
+
+
+class Command(BaseCommand):
+    help = 'Show slow and token-profiled requests kept by the request profiler'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Newest entries to list')
+        parser.add_argument('--id', type=int, help='Show one entry with its queries and EXPLAIN output')
+        parser.add_argument('--json', action='store_true', help='Print raw JSON')
+        parser.add_argument('--clear', action='store_true', help='Empty the ring buffer')
+
+    def handle(self, *args, **options):
+        if not profiling.ring_is_shared():
+            raise CommandError(
+                f"The default cache ({type(caches['default']).__name__}) is local to each process, so this "
+                f"command cannot see what the web processes recorded. Set CACHE_BACKEND to a shared cache.")
+        if options['clear']:
+            profiling.clear()
+            self.stdout.write(self.style.SUCCESS("Profile ring buffer cleared"))
+            return
+
+        if options['id'] is not None:
+            entry = profiling.get(options['id'])
+            if entry is None:
+                raise CommandError(f"No profile {options['id']} in the ring buffer")
+            if options['json']:
+                self.stdout.write(json.dumps(entry, indent=2))
+            else:
+                self.print_entry(entry)
+            return
+
+        entries = profiling.recent(options['limit'])
+        if options['json']:
+            self.stdout.write(json.dumps([profiling.headline(e) for e in entries], indent=2))
+            return
+        if not entries:
+            self.stdout.write("No profiled requests recorded")
+            return
+        self.stdout.write(f"{'id':>6}  {'at':<19}  {'status':>6}  {'total':>9}  {'sql':>9}  {'queries':>7}  request")
+        for entry in entries:
+            self.stdout.write(
+                f"{entry['id']:>6}  {entry['at'][:19]:<19}  {entry['status']:>6}  "
+                f"{entry['total_ms']:>7.1f}ms  {entry['sql_ms']:>7.1f}ms  {entry['query_count']:>7}  "
+                f"{entry['method']} {entry['path']}")
+
+    def print_entry(self, entry):
+        self.stdout.write(self.style.SUCCESS(
+            f"#{entry['id']} {entry['method']} {entry['path']} -> {entry['status']} "
+            f"({entry['reason']}, {entry['at']})"))
+        self.stdout.write(f"  total {entry['total_ms']:.1f} ms, sql {entry['sql_ms']:.1f} ms "
+                          f"in {entry['query_count']} queries")
+        for name, timing in entry['spans'].items():
+            self.stdout.write(f"  {name:<32} {timing['ms']:>9.1f} ms  x{timing['count']}")
+        if entry['repeated']:
+            self.stdout.write("  repeated statements:")
+            for repeated in entry['repeated'][:10]:
+                self.stdout.write(f"    x{repeated['count']:<4} {repeated['ms']:>8.1f} ms  {repeated['sql'][:120]}")
+        self.stdout.write("  queries (slowest first):")
+        for query in sorted(entry['queries'], key=lambda q: -q['ms'])[:20]:
+            self.stdout.write(f"    {query['ms']:>8.2f} ms  {query['site'] or '?'}")
+            self.stdout.write(f"      {query['sql'][:300]}")
+            for line in query.get('explain', []):
+                self.stdout.write(f"        {line}")
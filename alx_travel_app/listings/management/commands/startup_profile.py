@@ -0,0 +1,162 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+ROLES = ('web', 'worker', 'beat')
+
+# What each process imports before it can take work; timed in a fresh interpreter.
+BOOT = {
+    'web': (
+        "from django.core.wsgi import get_wsgi_application\n"
+        "get_wsgi_application()\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+    'worker': (
+        "import django\n"
+        "django.setup()\n"
+        "from alx_travel_app.celery import app\n"
+        "app.loader.import_default_modules()\n"
+    ),
+    'beat': (
+        "import django\n"
+        "django.setup()\n"
+        "from django_celery_beat.schedulers import DatabaseScheduler\n"
+    ),
+}
+TIMED = (
+    "import time\n"
+    "started = time.perf_counter()\n"
+    "{boot}"
+    "print(time.perf_counter() - started)\n"
+)
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+def parse_importtime(output):
+    """``[(module, self_us, cumulative_us, depth)]`` from ``python -X importtime`` output."""
+    modules = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules.append((match[4], int(match[1]), int(match[2]), len(match[3]) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = ('Boot each process role in a fresh interpreter and report its startup time and '
+            'import cost per package and module')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--roles', default=','.join(ROLES),
+                            help=f"Comma-separated subset of: {', '.join(ROLES)}")
+        parser.add_argument('--role-apps', choices=('slim', 'all'), default='slim',
+                            help="Boot with each role's own apps (slim) or PROCESS_ROLE=all")
+        parser.add_argument('--repeat', type=int, default=3, help='Boots per role; the fastest is kept')
+        parser.add_argument('--top', type=int, default=10, help='Packages and modules to list per role')
+        parser.add_argument('--output', help='Write results as JSON to this path')
+        parser.add_argument('--baseline', help='Results JSON from an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative regression against --baseline (0.2 = 20%%)')
+        parser.add_argument('--min-delta', type=float, default=5.0,
+                            help='Ignore regressions smaller than this many milliseconds')
+
+    def handle(self, *args, **options):
+        roles = [r.strip() for r in options['roles'].split(',') if r.strip()]
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise CommandError(f"Unknown role(s): {', '.join(sorted(unknown))}")
+
+        results = {}
+        for role in roles:
+            results[role] = self.profile(role, options)
+            self.print_role(role, results[role], options['top'])
+
+        document = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'python': sys.version.split()[0],
+                'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+                'role_apps': options['role_apps'],
+            },
+            'roles': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            found = self.regressions(baseline, document, options['threshold'], options['min_delta'])
+            if found:
+                raise CommandError("Startup regressions against baseline:\n  " + "\n  ".join(found))
+            self.stdout.write(self.style.SUCCESS(
+                f"No regressions beyond {options['threshold']:.0%} against {options['baseline']}"))
+
+    def profile(self, role, options):
+        env = dict(os.environ, PROCESS_ROLE=role if options['role_apps'] == 'slim' else 'all')
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'alx_travel_app.settings')
+        script = TIMED.format(boot=BOOT[role])
+        best = None
+        for _ in range(max(options['repeat'], 1)):
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                  env=env, capture_output=True, text=True)
+            if proc.returncode:
+                tail = proc.stderr.strip().splitlines()[-1:] or ['no output']
+                raise CommandError(f"Booting the {role} role failed: {tail[0]}")
+            boot = float(proc.stdout.strip().splitlines()[-1])
+            if best is None or boot < best[0]:
+                best = boot, proc.stderr
+
+        boot, output = best
+        modules = parse_importtime(output)
+        packages = defaultdict(int)
+        for name, self_us, _, _ in modules:
+            packages[name.split('.')[0]] += self_us
+        top_level = sorted((m for m in modules if m[3] == 0), key=lambda m: -m[2])
+        return {
+            'boot_ms': round(boot * 1000, 1),
+            'import_ms': round(sum(self_us for _, self_us, _, _ in modules) / 1000, 1),
+            'modules': len(modules),
+            'packages': {name: round(us / 1000, 1)
+                         for name, us in sorted(packages.items(), key=lambda item: -item[1])},
+            'top_imports': {name: round(cumulative / 1000, 1)
+                            for name, _, cumulative, _ in top_level[:options['top']]},
+        }
+
+    def print_role(self, role, result, top):
+        self.stdout.write(self.style.SUCCESS(
+            f"{role}: boot {result['boot_ms']:.1f} ms, imports {result['import_ms']:.1f} ms "
+            f"across {result['modules']} modules"))
+        self.stdout.write("  packages (self time):")
+        for name, ms in list(result['packages'].items())[:top]:
+            self.stdout.write(f"    {name:<28} {ms:>8.1f} ms")
+        self.stdout.write("  top-level imports (cumulative):")
+        for name, ms in result['top_imports'].items():
+            self.stdout.write(f"    {name:<28} {ms:>8.1f} ms")
+
+    @staticmethod
+    def regressions(baseline, current, threshold, min_delta):
+        """Boot times and per-package import costs that grew beyond the threshold."""
+        def grew(before, now):
+            return now - before > min_delta and now > before * (1 + threshold)
+
+        found = []
+        for role, now in current['roles'].items():
+            before = baseline.get('roles', {}).get(role)
+            if not before:
+                continue
+            if grew(before['boot_ms'], now['boot_ms']):
+                found.append(f"{role}: boot {before['boot_ms']}ms -> {now['boot_ms']}ms")
+            for package, ms in now['packages'].items():
+                if grew(before['packages'].get(package, 0.0), ms):
+                    found.append(f"{role}: {package} {before['packages'].get(package, 0.0)}ms -> {ms}ms")
+        return found
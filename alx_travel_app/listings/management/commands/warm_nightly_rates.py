@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from listings.models import Listing
+from listings.pricing import build_nightly_rates, prune_nightly_rates
+
+
+class Command(BaseCommand):
+    help = 'Precompute nightly rates for every active listing so quotes never price on demand'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.PRICING_WARM_DAYS,
+                            help='Price this many nights ahead, starting today')
+        parser.add_argument('--batch-size', type=int, default=200, help='Listings per write batch')
+
+    def handle(self, *args, **options):
+        start = timezone.localdate()
+        end = start + timedelta(days=options['days'])
+        batch_size = options['batch_size']
+
+        pruned = prune_nightly_rates(start)
+        written = 0
+        listing_ids = Listing.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True)
+        batch = []
+        for listing_id in listing_ids.iterator(chunk_size=batch_size):
+            batch.append(listing_id)
+            if len(batch) == batch_size:
+                written += build_nightly_rates(batch, start, end)
+                batch = []
+        if batch:
+            written += build_nightly_rates(batch, start, end)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} nightly rates for {start}..{end}, pruned {pruned} past ones"
+        ))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=500)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], max_length=8)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=16)),
+                ('batch_size', models.PositiveIntegerField(default=2000)),
+                ('rows_processed', models.PositiveBigIntegerField(default=0)),
+                ('rows_upserted', models.PositiveBigIntegerField(default=0)),
+                ('rows_failed', models.PositiveBigIntegerField(default=0)),
+                ('error_report', models.JSONField(blank=True, default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='listing',
+            name='unique_created_updated_price',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=120, null=True, unique=True),
+        ),
+    ]
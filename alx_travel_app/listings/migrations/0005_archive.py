@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_listing_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('booking_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('property_id', models.UUIDField(db_index=True)),
+                ('user_id', models.UUIDField(db_index=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('tx_ref', models.CharField(max_length=120, primary_key=True, serialize=False)),
+                ('booking_reference', models.CharField(db_index=True, max_length=120)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('currency', models.CharField(max_length=8)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SUCCESS', 'Completed'), ('FAILED', 'Failed'), ('CANCELED', 'Canceled')], max_length=16)),
+                ('processor_tx_id', models.CharField(blank=True, max_length=120, null=True)),
+                ('customer_email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('gateway_summary', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['end_date'], name='booking_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['status', 'updated_at'], name='payment_status_updated_idx'),
+        ),
+    ]
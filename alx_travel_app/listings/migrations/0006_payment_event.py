@@ -0,0 +1,98 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:08
+
+from decimal import Decimal, InvalidOperation
+import json
+import zlib
+
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+KIND_FOR_STATUS = {
+    'PENDING': 'INITIALIZED',
+    'SUCCESS': 'VERIFIED',
+    'FAILED': 'FAILED',
+    'CANCELED': 'FAILED',
+}
+
+
+def copy_gateway_payloads(apps, schema_editor):
+    """Turn each payment's last stored gateway response into its first event."""
+    Payment = apps.get_model('listings', 'Payment')
+    PaymentEvent = apps.get_model('listings', 'PaymentEvent')
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Payment.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'status', 'updated_at', 'gateway_payload')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        events = []
+        for payment in batch:
+            payload = payment.gateway_payload
+            if not payload:
+                continue
+            # Non-object payloads (a list, a bare string) are kept as-is without typed fields.
+            data = payload.get('data') if isinstance(payload, dict) else None
+            if not isinstance(data, dict):
+                data = {}
+            try:
+                amount = Decimal(str(data['amount'])).quantize(Decimal('0.01'))
+            except (KeyError, InvalidOperation, ValueError):
+                amount = None
+            try:
+                gateway_created_at = parse_datetime(str(data.get('created_at') or ''))
+            except ValueError:
+                gateway_created_at = None
+            events.append(PaymentEvent(
+                payment_id=payment.pk,
+                kind=KIND_FOR_STATUS.get(payment.status, 'VERIFIED'),
+                status=payment.status,
+                reference=str(data['reference'])[:120] if data.get('reference') else None,
+                amount=amount,
+                currency=str(data.get('currency') or '')[:8],
+                gateway_created_at=gateway_created_at,
+                payload=zlib.compress(json.dumps(payload, separators=(',', ':'), default=str).encode()),
+            ))
+        PaymentEvent.objects.bulk_create(events)
+        # auto_now_add overrides created_at on insert, so date the events
+        # by their payment's last update afterwards.
+        PaymentEvent.objects.filter(payment_id__in=[payment.pk for payment in batch]).update(
+            created_at=models.Subquery(
+                Payment.objects.filter(pk=models.OuterRef('payment_id')).values('updated_at')[:1]
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('INITIALIZED', 'Initialized'), ('VERIFIED', 'Verified'), ('FAILED', 'Failed')], max_length=16)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SUCCESS', 'Completed'), ('FAILED', 'Failed'), ('CANCELED', 'Canceled')], max_length=16)),
+                ('reference', models.CharField(blank=True, db_index=True, max_length=120, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('currency', models.CharField(blank=True, default='', max_length=8)),
+                ('gateway_created_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payload', models.BinaryField(default=bytes)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='listings.payment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['payment', 'created_at'], name='payment_event_payment_idx')],
+            },
+        ),
+        migrations.RunPython(copy_gateway_payloads, migrations.RunPython.noop),
+    ]
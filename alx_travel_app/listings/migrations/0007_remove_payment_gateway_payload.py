@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_payment_event'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='payment',
+            name='gateway_payload',
+        ),
+    ]
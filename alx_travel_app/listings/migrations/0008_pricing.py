@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_remove_payment_gateway_payload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='weekend_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='StayDiscount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_nights', models.PositiveIntegerField()),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stay_discounts', to='listings.listing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SeasonalRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seasonal_rates', to='listings.listing')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NightlyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nightly_rates', to='listings.listing')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='staydiscount',
+            constraint=models.UniqueConstraint(fields=('listing', 'min_nights'), name='unique_stay_discount_per_length'),
+        ),
+        migrations.AddIndex(
+            model_name='nightlyrate',
+            index=models.Index(fields=['date'], name='nightly_rate_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='nightlyrate',
+            constraint=models.UniqueConstraint(fields=('listing', 'date'), name='unique_nightly_rate'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:31
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_pricing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingTotals',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='totals', serialize=False, to='listings.listing')),
+                ('bookings', models.IntegerField(default=0)),
+                ('booked_nights', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('occupied_nights', models.IntegerField(default=0)),
+                ('reviews', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('booked_nights', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('occupied_nights', models.IntegerField(default=0)),
+                ('reviews', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='listings.listing')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='listingdailystats',
+            constraint=models.UniqueConstraint(fields=('listing', 'date'), name='unique_listing_daily_stats'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='listings.booking'),
+        ),
+    ]
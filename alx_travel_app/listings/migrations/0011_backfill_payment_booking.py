@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:46
+
+import uuid
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def link_payments_to_bookings(apps, schema_editor):
+    """
+    Point each payment at the booking its booking_reference names.
+
+    Runs outside a migration-wide transaction: every batch is committed on
+    its own, so the payments table is only ever locked for one batch and an
+    interrupted run resumes where it stopped.
+    """
+    Payment = apps.get_model('listings', 'Payment')
+    Booking = apps.get_model('listings', 'Booking')
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Payment.objects.filter(pk__gt=last_pk, booking__isnull=True).order_by('pk')
+            .values_list('pk', 'booking_reference')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+
+        references = {}
+        for pk, reference in batch:
+            try:
+                references[pk] = uuid.UUID(reference.strip())
+            except (AttributeError, ValueError):
+                continue
+        existing = set(Booking.objects.filter(pk__in=set(references.values())).values_list('pk', flat=True))
+        links = {pk: booking_id for pk, booking_id in references.items() if booking_id in existing}
+        if not links:
+            continue
+        with transaction.atomic():
+            Payment.objects.filter(pk__in=links).update(booking_id=models.Case(
+                *[models.When(pk=pk, then=models.Value(booking_id)) for pk, booking_id in links.items()],
+                output_field=models.UUIDField(),
+            ))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('listings', '0010_payment_booking'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_payments_to_bookings, migrations.RunPython.noop),
+    ]
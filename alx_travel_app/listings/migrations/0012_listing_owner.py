@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_backfill_payment_booking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='owned_listings', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
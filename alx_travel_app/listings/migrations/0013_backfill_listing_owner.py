@@ -0,0 +1,66 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:54
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+
+def copy_owners_from_m2m(apps, schema_editor):
+    """
+    Set Listing.owner from the User.listings join table.
+
+    A listing linked to several users keeps the earliest link. Batches are
+    committed one at a time so the listings table is never locked for long.
+    """
+    User = apps.get_model('listings', 'User')
+    Listing = apps.get_model('listings', 'Listing')
+    Link = User.listings.through
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Link.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'listing_id', 'user_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+
+        owners = {}
+        for _, listing_id, user_id in batch:
+            owners.setdefault(listing_id, user_id)
+        with transaction.atomic():
+            Listing.objects.filter(pk__in=owners, owner__isnull=True).update(owner_id=models.Case(
+                *[models.When(pk=listing_id, then=models.Value(user_id)) for listing_id, user_id in owners.items()],
+                output_field=models.UUIDField(),
+            ))
+
+
+def copy_owners_to_m2m(apps, schema_editor):
+    User = apps.get_model('listings', 'User')
+    Listing = apps.get_model('listings', 'Listing')
+    Link = User.listings.through
+
+    last_pk = None
+    while True:
+        queryset = Listing.objects.filter(owner__isnull=False).order_by('pk')
+        if last_pk is not None:
+            queryset = queryset.filter(pk__gt=last_pk)
+        batch = list(queryset.values_list('pk', 'owner_id')[:BATCH_SIZE])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        Link.objects.bulk_create([Link(listing_id=pk, user_id=owner_id) for pk, owner_id in batch],
+                                 ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('listings', '0012_listing_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_owners_from_m2m, copy_owners_to_m2m),
+    ]
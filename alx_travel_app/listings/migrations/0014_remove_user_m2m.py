@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_backfill_listing_owner'),
+    ]
+
+    operations = [
+        # Booking.user_id already links users to their bookings.
+        migrations.RemoveField(
+            model_name='user',
+            name='booking',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='listings',
+        ),
+        migrations.AlterField(
+            model_name='listing',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='listings', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:47
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0016_listing_location'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='review',
+            name='unique_review_per_user_created_and_updated_at',
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reviews', to='listings.booking'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['property_id', 'created_at'], name='review_listing_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('user_id', 'booking'), name='unique_review_per_stay'),
+        ),
+    ]
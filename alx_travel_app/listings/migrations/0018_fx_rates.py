@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:12
+
+from django.db import migrations, models
+import listings.fx
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0017_review_booking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('as_of', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='currency',
+            field=models.CharField(default=listings.fx.base_currency, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='total_price_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedpayment',
+            name='amount_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='currency',
+            field=models.CharField(default=listings.fx.base_currency, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='total_price_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='amount_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='fxrate',
+            constraint=models.UniqueConstraint(fields=('currency', 'as_of'), name='unique_fx_rate_per_day'),
+        ),
+    ]
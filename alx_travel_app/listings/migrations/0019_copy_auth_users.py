@@ -0,0 +1,159 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:40
+
+import datetime
+import uuid
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+COLUMNS = ('id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name',
+           'email', 'is_staff', 'is_active', 'date_joined')
+SESSION_USER_KEY = '_auth_user_id'
+
+
+def _rows(cursor, table, columns):
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+    return cursor.fetchall()
+
+
+def _aware(value):
+    # Raw sqlite reads come back naive; they were stored in UTC.
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value is not None and settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def _copy_users(apps, cursor):
+    """Copy auth_user rows to listings.User; returns ``{auth_user id: listings.User id}``."""
+    User = apps.get_model('listings', 'User')
+    existing = dict(User.objects.values_list('username', 'id'))
+    taken_emails = {email.lower() for email in User.objects.values_list('email', flat=True)}
+
+    new_ids = {}
+    users = []
+    for row in _rows(cursor, 'auth_user', COLUMNS):
+        fields = dict(zip(COLUMNS, row))
+        old_id = fields.pop('id')
+        if fields['username'] in existing:
+            # Already moved by hand; keep that account and point the old id at it.
+            new_ids[old_id] = existing[fields['username']]
+            continue
+        email = (fields['email'] or '').strip()
+        if not email or email.lower() in taken_emails:
+            email = f"{fields['username']}@users.invalid"
+        taken_emails.add(email.lower())
+        fields.update(email=email, first_name=fields['first_name'][:30], last_name=fields['last_name'][:30],
+                      last_login=_aware(fields['last_login']), date_joined=_aware(fields['date_joined']))
+        user = User(id=uuid.uuid4(), **fields)
+        new_ids[old_id] = user.id
+        users.append(user)
+    User.objects.bulk_create(users)
+    return new_ids
+
+
+def _copy_memberships(apps, cursor, tables, new_ids):
+    User = apps.get_model('listings', 'User')
+    for table, through, column in (('auth_user_groups', User.groups.through, 'group_id'),
+                                   ('auth_user_user_permissions', User.user_permissions.through,
+                                    'permission_id')):
+        if table in tables:
+            through.objects.bulk_create([
+                through(user_id=new_ids[user_id], **{column: other_id})
+                for user_id, other_id in _rows(cursor, table, ('user_id', column)) if user_id in new_ids
+            ], ignore_conflicts=True)
+
+
+def _remap_sessions(cursor, new_ids):
+    """
+    Point signed-in sessions at the new user ids.
+
+    The session auth hash is derived from the password hash, which is
+    copied unchanged, so only the stored user id needs rewriting. Sessions
+    that cannot be decoded or whose user was not copied are deleted.
+    """
+    from django.contrib.sessions.backends.db import SessionStore
+
+    store = SessionStore()
+    new_ids = {str(old_id): str(new_id) for old_id, new_id in new_ids.items()}
+    updates, stale = [], []
+    for session_key, session_data in _rows(cursor, 'django_session', ('session_key', 'session_data')):
+        data = store.decode(session_data)
+        if SESSION_USER_KEY not in data:
+            continue
+        if str(data[SESSION_USER_KEY]) not in new_ids:
+            stale.append((session_key,))
+            continue
+        data[SESSION_USER_KEY] = new_ids[str(data[SESSION_USER_KEY])]
+        updates.append((store.encode(data), session_key))
+    cursor.executemany("UPDATE django_session SET session_data = %s WHERE session_key = %s", updates)
+    cursor.executemany("DELETE FROM django_session WHERE session_key = %s", stale)
+
+
+def _rebuild_admin_log(apps, schema_editor, cursor, new_ids):
+    """
+    Recreate django_admin_log against listings.User, keeping its history.
+
+    The table was created while its user_id referenced auth_user's
+    integer keys. Entries of users that were not copied are dropped.
+    """
+    try:
+        LogEntry = apps.get_model('admin', 'LogEntry')
+    except LookupError:  # admin is not installed
+        return
+    fields = LogEntry._meta.local_fields
+    rows = _rows(cursor, LogEntry._meta.db_table, [field.column for field in fields])
+    entries = []
+    for row in rows:
+        values = {field.attname: value for field, value in zip(fields, row)}
+        if values['user_id'] not in new_ids:
+            continue
+        values.update(user_id=new_ids[values['user_id']], action_time=_aware(values['action_time']))
+        entries.append(LogEntry(**values))
+    schema_editor.delete_model(LogEntry)
+    schema_editor.create_model(LogEntry)
+    LogEntry.objects.bulk_create(entries)
+
+
+def copy_auth_users(apps, schema_editor):
+    """
+    Move accounts from auth_user to listings.User.
+
+    AUTH_USER_MODEL switched from auth.User to listings.User. A database
+    created before the switch still holds its accounts in auth_user, and
+    Django no longer reads that table. This copies each account (password
+    hash, flags, dates, groups, permissions) to a new listings.User; a
+    username that already exists there keeps that account. An email that
+    is blank or already taken becomes ``<username>@users.invalid`` and
+    should be fixed by hand.
+
+    Rows that stored the old integer ids follow the accounts: signed-in
+    sessions are rewritten to the new ids, and django_admin_log, whose
+    user_id still references auth_user, is rebuilt against listings.User
+    with its entries. On a fresh database auth_user does not exist and
+    this does nothing.
+    """
+    connection = schema_editor.connection
+    tables = set(connection.introspection.table_names())
+    if 'auth_user' not in tables:
+        return
+    with connection.cursor() as cursor:
+        new_ids = _copy_users(apps, cursor)
+        _copy_memberships(apps, cursor, tables, new_ids)
+        if 'django_session' in tables:
+            _remap_sessions(cursor, new_ids)
+        if 'django_admin_log' in tables:
+            _rebuild_admin_log(apps, schema_editor, cursor, new_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0018_fx_rates'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_auth_users, migrations.RunPython.noop),
+    ]
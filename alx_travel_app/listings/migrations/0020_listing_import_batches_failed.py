@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+def count_reported_batches(apps, schema_editor):
+    """Earlier imports reported every failing batch, so the report length is the count."""
+    ListingImport = apps.get_model('listings', 'ListingImport')
+    for job in ListingImport.objects.exclude(error_report=[]).only('pk', 'error_report').iterator():
+        ListingImport.objects.filter(pk=job.pk).update(batches_failed=len(job.error_report))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0019_copy_auth_users'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimport',
+            name='batches_failed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_reported_batches, migrations.RunPython.noop),
+    ]
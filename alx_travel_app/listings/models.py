@@ -1,15 +1,22 @@
-from django.db import models
+from django.db import models, transaction
+import json
 import uuid
+import zlib
+from decimal import Decimal, InvalidOperation
 from django.contrib.auth.models import AbstractUser,Group, Permission
+from django.core.cache import cache
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 from django.db.models.constraints import UniqueConstraint
 
+from . import fx, geo
+
 class User(AbstractUser):
     '''Custom user model for the travel app, extending Django's AbstractUser.'''
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(unique=True)
-    booking = models.ManyToManyField('Booking', related_name='booking', blank=True)
-    listings = models.ManyToManyField('Listing', related_name='listing', blank=True)
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
     phone_number = models.CharField(
@@ -37,24 +44,184 @@ class User(AbstractUser):
 
 class Listing(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Partner-side identifier; bulk feed imports upsert on it.
+    external_id = models.CharField(max_length=120, unique=True, null=True, blank=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Friday/Saturday nightly rate; falls back to price when unset.
+    weekend_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # The host; reachable as user.listings. Bookings go through Booking.user_id.
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='listings')
+    latitude = models.FloatField(null=True, blank=True,
+                                 validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)])
+    longitude = models.FloatField(null=True, blank=True,
+                                  validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)])
+    # Z-order grid cell of (latitude, longitude) for listings.geo; set on save.
+    geocell = models.BigIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
-        constraints = [
-            UniqueConstraint(fields=['created_at', 'updated_at'], name='unique_created_updated_price')
+        indexes = [
+            # Geo search range-scans geocell; is_active is checked from the index.
+            # (sqlite renders is_active=True as a bare column, so it cannot lead.)
+            models.Index(fields=['geocell', 'is_active'], name='listing_geocell_active_idx'),
         ]
 
+    def save(self, *args, **kwargs):
+        self.geocell = geo.encode(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geocell'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """String representation of the Listing model."""
         return f"{self.title} - {self.price} - {'Active' if self.is_active else 'Inactive'}"
 
 
-class Booking(models.Model):
+class SeasonalRate(models.Model):
+    """Nightly price override for a listing between two dates (inclusive)."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='seasonal_rates')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.listing_id} {self.start_date}..{self.end_date} @ {self.price}"
+
+
+class StayDiscount(models.Model):
+    """Percentage off a stay of at least min_nights nights."""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='stay_discounts')
+    min_nights = models.PositiveIntegerField()
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['listing', 'min_nights'], name='unique_stay_discount_per_length')
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} {self.min_nights}+ nights: {self.percent}% off"
+
+
+class NightlyRate(models.Model):
+    """
+    Precomputed price of one night at a listing.
+
+    Derived from Listing.price, weekend_price and SeasonalRate by
+    listings.pricing; never edit these rows by hand.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='nightly_rates')
+    date = models.DateField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # Also the (listing, date) range index every quote sums over.
+            UniqueConstraint(fields=['listing', 'date'], name='unique_nightly_rate')
+        ]
+        indexes = [
+            # Lets the daily prune drop past nights without a full scan.
+            models.Index(fields=['date'], name='nightly_rate_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} {self.date} @ {self.price}"
+
+
+class BaseAmountMixin:
+    """
+    Keep ``base_field`` equal to ``amount_field`` in FX_BASE_CURRENCY; see listings.fx.
+
+    It is computed for a new row, a row without one yet, a full save that
+    changes the amount or currency from what was loaded, and a save whose
+    update_fields names either of them. Other saves keep the base amount,
+    and so the rate, it was written with. A currency without a rate leaves
+    it empty for ``backfill_base_amounts``.
+    """
+    amount_field = None
+    base_field = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_amount = instance._amount_and_currency()
+        return instance
+
+    def _amount_and_currency(self):
+        # __dict__ rather than getattr so a deferred field is not loaded here.
+        return self.__dict__.get(self.amount_field), self.__dict__.get('currency')
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if {self.amount_field, 'currency'} & set(update_fields):
+                kwargs['update_fields'] = {*update_fields, self.base_field}
+                self._set_base_amount()
+        elif self.amount_field in self.__dict__ and (
+                self._state.adding or getattr(self, self.base_field) is None
+                or self._amount_and_currency() != getattr(self, '_loaded_amount', None)):
+            self._set_base_amount()
+        super().save(*args, **kwargs)
+        self._loaded_amount = self._amount_and_currency()
+
+    def _set_base_amount(self):
+        try:
+            value = fx.to_base(getattr(self, self.amount_field), self.currency)
+        except fx.UnknownCurrency:
+            value = None
+        setattr(self, self.base_field, value)
+
+
+class InvalidTransition(Exception):
+    """Raised when a booking is not in a state the requested transition starts from."""
+
+
+class BookingQuerySet(models.QuerySet):
+    def with_payment_status(self):
+        """Annotate ``payment_status``: the status of the booking's latest payment, or None."""
+        latest = Payment.objects.filter(booking=models.OuterRef('pk')).order_by('-created_at', '-pk')
+        return self.annotate(payment_status=models.Subquery(latest.values('status')[:1]))
+
+    @staticmethod
+    def _paid_booking_ids():
+        return Payment.objects.filter(status=Payment.Status.SUCCESS, booking__isnull=False).values('booking_id')
+
+    def paid(self):
+        """Bookings with at least one successful payment."""
+        return self.filter(pk__in=self._paid_booking_ids())
+
+    def unpaid(self):
+        """Confirmed bookings with no successful payment."""
+        return self.filter(status=Booking.Status.CONFIRMED).exclude(pk__in=self._paid_booking_ids())
+
+    def transition(self, to, when=None):
+        """
+        Move every booking in this queryset that may legally go to ``to``.
+
+        A single conditional UPDATE (``... WHERE status IN (<sources>)``), so
+        a booking changed concurrently is simply skipped instead of being
+        overwritten. Returns the number of bookings moved. All moved rows
+        get ``updated_at = when``, which lets callers find them afterwards.
+        """
+        sources = [state for state, targets in Booking.TRANSITIONS.items() if to in targets]
+        return self.filter(status__in=sources).update(status=to, updated_at=when or timezone.now())
+
+    def confirm(self, when=None):
+        return self.transition(Booking.Status.CONFIRMED, when)
+
+    def cancel(self, when=None):
+        return self.transition(Booking.Status.CANCELLED, when)
+
+
+class Booking(BaseAmountMixin, models.Model):
     """Model representing a booking for a listing."""
     booking_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     property_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='bookings')
@@ -63,18 +230,46 @@ class Booking(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=20, choices=[
-        ('pending', 'Pending'),
-        ('confirmed', 'Confirmed'),
-        ('cancelled', 'Cancelled')
-    ], default='pending')
+    # Listing prices are in the base currency, so new bookings are too.
+    currency = models.CharField(max_length=3, default=fx.base_currency)
+    # total_price in FX_BASE_CURRENCY at the rate of the day it was written; see listings.fx.
+    total_price_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        CONFIRMED = 'confirmed', 'Confirmed'
+        CANCELLED = 'cancelled', 'Cancelled'
+
+    # Allowed moves; cancelled is final.
+    TRANSITIONS = {
+        Status.PENDING: {Status.CONFIRMED, Status.CANCELLED},
+        Status.CONFIRMED: {Status.CANCELLED},
+        Status.CANCELLED: set(),
+    }
+
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = BookingQuerySet.as_manager()
+    amount_field, base_field = 'total_price', 'total_price_base'
+
     class Meta:
         constraints = [
             UniqueConstraint(fields=['property_id', 'user_id', 'start_date', 'end_date'], name='unique_booking_dates')
         ]
+        indexes = [
+            models.Index(fields=['end_date'], name='booking_end_date_idx'),
+            # Batched expiry scans pending bookings by age.
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ]
+
+    def transition_to(self, to):
+        """Apply a guarded transition to this booking or raise ``InvalidTransition``."""
+        when = timezone.now()
+        if not Booking.objects.filter(pk=self.pk).transition(to, when):
+            current = Booking.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+            raise InvalidTransition(f"Cannot move booking from {current} to {to}.")
+        self.status, self.updated_at = to, when
 
     def __str__(self):
         return f"Booking {self.booking_id} by {self.user_id.username} from {self.start_date} to {self.end_date} - {self.status}"
@@ -85,21 +280,28 @@ class Review(models.Model):
     review_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     property_id = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='reviews')
     user_id = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
-    rating = models.PositiveIntegerField()
+    # The stay being reviewed. Null for reviews that predate it or whose booking was archived.
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='reviews')
+    rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
-            UniqueConstraint(fields=['property_id', 'user_id', 'created_at', 'updated_at'],\
-                             name='unique_review_per_user_created_and_updated_at')
+            # One review per user per stay; NULL bookings are never equal, so legacy rows are exempt.
+            UniqueConstraint(fields=['user_id', 'booking'], name='unique_review_per_stay'),
+        ]
+        indexes = [
+            # Keyset pages of a listing's reviews, newest first.
+            models.Index(fields=['property_id', 'created_at'], name='review_listing_created_idx'),
         ]
 
     def __str__(self):
         return f"Review {self.review_id} for {self.property_id.title} by {self.user_id.username} - Rating: {self.rating}"
     
-class Payment(models.Model):
+class Payment(BaseAmountMixin, models.Model):
     class Status(models.TextChoices):
         PENDING = 'PENDING', 'Pending'
         SUCCESS = 'SUCCESS', 'Completed'
@@ -107,16 +309,21 @@ class Payment(models.Model):
         CANCELED = 'CANCELED', 'Canceled'
 
     booking_reference = models.CharField(max_length=120, db_index=True)
+    # Set when booking_reference is a booking_id; cleared if that booking is deleted or archived.
+    booking = models.ForeignKey('Booking', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='payments')
     # You send tx_ref to Chapa; keep it unique to reconcile verifications.
     tx_ref = models.CharField(max_length=120, unique=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     currency = models.CharField(max_length=8, default='ETB')  # or 'USD' depending on your use-case
+    # amount in FX_BASE_CURRENCY at the rate of the day it was written; see listings.fx.
+    amount_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
     status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    amount_field, base_field = 'amount', 'amount_base'
 
-    # Raw data from Chapa for debugging/audits
+    # Current gateway state only; every raw Chapa response lives in PaymentEvent.
     checkout_url = models.URLField(blank=True, null=True)
     processor_tx_id = models.CharField(max_length=120, blank=True, null=True)  # Chapa’s internal reference if present
-    gateway_payload = models.JSONField(default=dict, blank=True)
 
     customer_email = models.EmailField(blank=True, null=True)
     customer_first_name = models.CharField(max_length=60, blank=True, null=True)
@@ -125,19 +332,252 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='payment_status_updated_idx'),
+        ]
+
+    def record_event(self, kind, payload: dict):
+        """Append a gateway response to this payment's event history."""
+        return PaymentEvent.objects.create(
+            payment=self, kind=kind, status=self.status,
+            **PaymentEvent.columns_from(payload),
+        )
+
+    @staticmethod
+    def status_cache_key(tx_ref):
+        """Cache key of the payment status endpoints' answer for a terminal payment."""
+        return f"payment-status:{tx_ref}"
+
+    def _forget_cached_status(self):
+        # After commit, so a concurrent poller cannot re-cache the old status.
+        key = self.status_cache_key(self.tx_ref)
+        transaction.on_commit(lambda: cache.delete(key))
+
     def mark_success(self, payload: dict):
         self.status = self.Status.SUCCESS
-        self.gateway_payload = payload or {}
         # Chapa verify response usually has data.reference
-        ref = (payload or {}).get('data', {}).get('reference')
+        ref = ((payload or {}).get('data') or {}).get('reference')
         if ref:
             self.processor_tx_id = ref
-        self.save(update_fields=['status', 'gateway_payload', 'processor_tx_id', 'updated_at'])
+        with transaction.atomic():
+            self.save(update_fields=['status', 'processor_tx_id', 'updated_at'])
+            self.record_event(PaymentEvent.Kind.VERIFIED, payload)
+            if self.booking_id:
+                # A no-op unless the booking is still pending.
+                Booking.objects.filter(pk=self.booking_id).confirm()
+            self._forget_cached_status()
 
     def mark_failed(self, payload: dict):
         self.status = self.Status.FAILED
-        self.gateway_payload = payload or {}
-        self.save(update_fields=['status', 'gateway_payload', 'updated_at'])
+        with transaction.atomic():
+            self.save(update_fields=['status', 'updated_at'])
+            self.record_event(PaymentEvent.Kind.FAILED, payload)
+            self._forget_cached_status()
+
+    def __str__(self):
+        return f"""{self.booking_reference} | {self.tx_ref} | {self.status}"""
+
+
+def compress_payload(payload):
+    """Serialize a gateway response compactly for PaymentEvent.payload."""
+    return zlib.compress(json.dumps(payload or {}, separators=(',', ':'), default=str).encode())
+
+
+def decompress_payload(blob):
+    if not blob:
+        return {}
+    return json.loads(zlib.decompress(bytes(blob)))
+
+
+class PaymentEventQuerySet(models.QuerySet):
+    def with_payload(self):
+        """Opt back in to loading the compressed raw bodies."""
+        return self.defer(None)
+
+
+class PaymentEventManager(models.Manager.from_queryset(PaymentEventQuerySet)):
+    def get_queryset(self):
+        # Raw bodies are for audits only; never drag them into list queries.
+        return super().get_queryset().defer('payload')
+
+
+class PaymentEvent(models.Model):
+    """Append-only record of every gateway response for a payment."""
+    class Kind(models.TextChoices):
+        INITIALIZED = 'INITIALIZED', 'Initialized'
+        VERIFIED = 'VERIFIED', 'Verified'
+        FAILED = 'FAILED', 'Failed'
+
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    # Payment status right after this event was applied.
+    status = models.CharField(max_length=16, choices=Payment.Status.choices)
+    reference = models.CharField(max_length=120, blank=True, null=True, db_index=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    currency = models.CharField(max_length=8, blank=True, default='')
+    gateway_created_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # zlib-compressed JSON of the raw gateway response.
+    payload = models.BinaryField(default=bytes)
+
+    objects = PaymentEventManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment', 'created_at'], name='payment_event_payment_idx'),
+        ]
+
+    @staticmethod
+    def columns_from(payload):
+        """Extract the typed columns and compressed body from a gateway response."""
+        data = (payload or {}).get('data')
+        data = data if isinstance(data, dict) else {}
+        try:
+            amount = Decimal(str(data['amount'])).quantize(Decimal('0.01'))
+        except (KeyError, InvalidOperation, ValueError):
+            amount = None
+        try:
+            gateway_created_at = parse_datetime(str(data.get('created_at') or ''))
+        except ValueError:
+            gateway_created_at = None
+        return {
+            'reference': (str(data['reference'])[:120] if data.get('reference') else None),
+            'amount': amount,
+            'currency': str(data.get('currency') or '')[:8],
+            'gateway_created_at': gateway_created_at,
+            'payload': compress_payload(payload),
+        }
+
+    @property
+    def raw(self):
+        """The decompressed gateway response."""
+        return decompress_payload(self.payload)
+
+    def __str__(self):
+        return f"{self.payment_id} | {self.kind} | {self.status}"
+
+
+class ListingImport(models.Model):
+    """A bulk listing feed import and its resumable checkpoint."""
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        COMPLETED = 'COMPLETED', 'Completed'
+        FAILED = 'FAILED', 'Failed'
+
+    class Format(models.TextChoices):
+        CSV = 'csv', 'CSV'
+        JSONL = 'jsonl', 'JSON Lines'
+
+    source = models.CharField(max_length=500)
+    format = models.CharField(max_length=8, choices=Format.choices)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    batch_size = models.PositiveIntegerField(default=2000)
+    # Number of feed rows already committed; a resumed run skips this many.
+    rows_processed = models.PositiveBigIntegerField(default=0)
+    rows_upserted = models.PositiveBigIntegerField(default=0)
+    rows_failed = models.PositiveBigIntegerField(default=0)
+    # Batches with rejected rows; the first importers.MAX_REPORTED_BATCHES of them are in error_report.
+    batches_failed = models.PositiveIntegerField(default=0)
+    error_report = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import {self.pk} | {self.source} | {self.status}"
+
+
+class FxRate(models.Model):
+    """Units of FX_BASE_CURRENCY one unit of ``currency`` buys, from ``as_of`` on."""
+    currency = models.CharField(max_length=3)
+    as_of = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['currency', 'as_of'], name='unique_fx_rate_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} on {self.as_of}"
+
+
+class ArchivedBooking(models.Model):
+    """Compact copy of a finished booking moved out of the live table."""
+    booking_id = models.UUIDField(primary_key=True)
+    # Plain ids rather than foreign keys: the listing or user may be deleted later.
+    property_id = models.UUIDField(db_index=True)
+    user_id = models.UUIDField(db_index=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default=fx.base_currency)
+    total_price_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived booking {self.booking_id} - {self.status}"
+
+
+class ArchivedPayment(models.Model):
+    """Compact copy of a terminal payment, still looked up by tx_ref."""
+    tx_ref = models.CharField(max_length=120, primary_key=True)
+    booking_reference = models.CharField(max_length=120, db_index=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=8)
+    amount_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=Payment.Status.choices)
+    processor_tx_id = models.CharField(max_length=120, blank=True, null=True)
+    customer_email = models.EmailField(blank=True, null=True)
+    # Only the reconciliation fields of the last gateway response.
+    gateway_summary = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"""{self.booking_reference} | {self.tx_ref} | {self.status} (archived)"""
+
+
+class ListingDailyStats(models.Model):
+    """
+    One day of dashboard counters for a listing, maintained by listings.rollups.
+
+    Bookings, booked nights and revenue are counted on the day a booking
+    was made; occupied_nights counts bookings staying over that night.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    bookings = models.IntegerField(default=0)
+    booked_nights = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    occupied_nights = models.IntegerField(default=0)
+    reviews = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['listing', 'date'], name='unique_listing_daily_stats')
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} {self.date}: {self.bookings} bookings, {self.revenue} revenue"
+
+
+class ListingTotals(models.Model):
+    """Lifetime dashboard counters for a listing, maintained by listings.rollups."""
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='totals')
+    bookings = models.IntegerField(default=0)
+    booked_nights = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    occupied_nights = models.IntegerField(default=0)
+    reviews = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
 
     def __str__(self):
-        return f"""{self.booking_reference} | {self.tx_ref} | {self.status}"""
\ No newline at end of file
+        return f"{self.listing_id}: {self.bookings} bookings, {self.revenue} revenue"
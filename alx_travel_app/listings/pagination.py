@@ -0,0 +1,18 @@
+"""
+Keyset pagination for lists that grow without bound.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class ReviewCursorPagination(CursorPagination):
+    """
+    Reviews newest first, a page at a time.
+
+    The cursor encodes the last ``created_at`` seen, so each page is one
+    range read on review_listing_created_idx and page 1,000 costs the same
+    as page 1, where an OFFSET would read and discard every earlier row.
+    """
+    ordering = '-created_at'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
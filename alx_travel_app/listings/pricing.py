@@ -0,0 +1,181 @@
+"""
+Stay pricing from precomputed nightly rates.
+
+The price of every night is materialised into NightlyRate from the
+listing's base and weekend prices and any SeasonalRate covering it, so a
+quote is a single SUM over the (listing, date) index. Rows are filled on
+demand for the nights a quote needs, can be warmed ahead of time with
+``build_nightly_rates`` and are dropped whenever the listing or its
+seasonal rates change. Length-of-stay discounts depend on the whole stay
+and are applied on top of the summed nights.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .models import Listing, NightlyRate, SeasonalRate, StayDiscount
+
+WEEKEND_NIGHTS = {4, 5}  # Friday and Saturday
+CENTS = Decimal('0.01')
+
+
+class QuoteError(Exception):
+    """Raised when a stay cannot be priced."""
+
+
+def stay_nights(start_date, end_date):
+    """Number of nights between two dates, validated against PRICING_MAX_NIGHTS."""
+    nights = (end_date - start_date).days
+    if nights < 1:
+        raise QuoteError("end_date must be after start_date.")
+    if nights > settings.PRICING_MAX_NIGHTS:
+        raise QuoteError(f"Stays are limited to {settings.PRICING_MAX_NIGHTS} nights.")
+    return nights
+
+
+def build_nightly_rates(listing_ids, start_date, end_date):
+    """
+    Materialise the nightly rates of active ``listing_ids`` for [start_date, end_date).
+
+    Seasonal rates override weekend and base prices; where seasons overlap
+    the most recently created one wins. Returns the number of rows written.
+    """
+    days = (end_date - start_date).days
+    if days < 1:
+        return 0
+    nights = [start_date + timedelta(days=i) for i in range(days)]
+    weekend = [night.weekday() in WEEKEND_NIGHTS for night in nights]
+
+    seasons = defaultdict(list)
+    for listing_id, season_start, season_end, price in (
+            SeasonalRate.objects
+            .filter(listing_id__in=listing_ids, start_date__lt=end_date, end_date__gte=start_date)
+            .order_by('created_at', 'id')
+            .values_list('listing_id', 'start_date', 'end_date', 'price')):
+        seasons[listing_id].append((season_start, season_end, price))
+
+    rates = []
+    listings = (Listing.objects.filter(pk__in=listing_ids, is_active=True)
+                .values_list('pk', 'price', 'weekend_price'))
+    for listing_id, price, weekend_price in listings:
+        if weekend_price is None:
+            prices = [price] * days
+        else:
+            prices = [weekend_price if is_weekend else price for is_weekend in weekend]
+        for season_start, season_end, season_price in seasons.get(listing_id, ()):
+            first = max((season_start - start_date).days, 0)
+            last = min((season_end - start_date).days + 1, days)
+            prices[first:last] = [season_price] * (last - first)
+        rates.extend(NightlyRate(listing_id=listing_id, date=night, price=night_price)
+                     for night, night_price in zip(nights, prices))
+
+    NightlyRate.objects.bulk_create(
+        rates,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['listing', 'date'],
+        update_fields=['price'],
+    )
+    return len(rates)
+
+
+def invalidate_nightly_rates(listing_ids):
+    """Drop the materialised rates of ``listing_ids``; they are rebuilt on the next quote."""
+    return NightlyRate.objects.filter(listing_id__in=listing_ids).delete()[0]
+
+
+def prune_nightly_rates(before):
+    """Delete nightly rates for nights before ``before``."""
+    return NightlyRate.objects.filter(date__lt=before).delete()[0]
+
+
+def _sum_rates(listing_ids, start_date, end_date):
+    rows = (NightlyRate.objects
+            .filter(listing_id__in=listing_ids, date__gte=start_date, date__lt=end_date)
+            .values('listing_id')
+            .annotate(nights=Count('id'), subtotal=Sum('price'))
+            .values_list('listing_id', 'nights', 'subtotal'))
+    return {listing_id: (nights, subtotal) for listing_id, nights, subtotal in rows}
+
+
+def _stay_discounts(listing_ids):
+    """Map listing id to its ``(min_nights, percent)`` rules, longest first."""
+    discounts = defaultdict(list)
+    for listing_id, min_nights, percent in (
+            StayDiscount.objects.filter(listing_id__in=listing_ids)
+            .order_by('listing_id', '-min_nights')
+            .values_list('listing_id', 'min_nights', 'percent')):
+        discounts[listing_id].append((min_nights, percent))
+    return discounts
+
+
+def _priced(listing_id, start_date, end_date, nights, subtotal, discounts):
+    # Sums over sqlite can come back with float noise; rates are whole cents.
+    subtotal = subtotal.quantize(CENTS)
+    percent = next((p for min_nights, p in discounts if nights >= min_nights), None)
+    discount = Decimal('0.00')
+    if percent:
+        discount = (subtotal * percent / 100).quantize(CENTS, rounding=ROUND_HALF_UP)
+    return {
+        'listing': listing_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'nights': nights,
+        'subtotal': subtotal,
+        'discount': discount,
+        'total': subtotal - discount,
+    }
+
+
+def quote_many(stays):
+    """
+    Price many ``(listing_id, start_date, end_date)`` stays at once.
+
+    Returns one dict per stay, in order. A stay that cannot be priced gets
+    an ``error`` key instead of the amounts. Stays sharing a date range, as
+    on a search results page, are summed together, so the cost is one query
+    per distinct range plus one for the discount rules.
+    """
+    stays = list(stays)
+    results = [None] * len(stays)
+    by_range = defaultdict(list)
+    for i, (listing_id, start_date, end_date) in enumerate(stays):
+        try:
+            stay_nights(start_date, end_date)
+        except QuoteError as exc:
+            results[i] = {'listing': listing_id, 'start_date': start_date,
+                          'end_date': end_date, 'error': str(exc)}
+            continue
+        by_range[(start_date, end_date)].append(i)
+
+    discounts = _stay_discounts({stays[i][0] for indexes in by_range.values() for i in indexes})
+    for (start_date, end_date), indexes in by_range.items():
+        nights = (end_date - start_date).days
+        listing_ids = {stays[i][0] for i in indexes}
+        sums = _sum_rates(listing_ids, start_date, end_date)
+        missing = [listing_id for listing_id in listing_ids if sums.get(listing_id, (0,))[0] < nights]
+        if missing:
+            build_nightly_rates(missing, start_date, end_date)
+            sums.update(_sum_rates(missing, start_date, end_date))
+
+        for i in indexes:
+            listing_id = stays[i][0]
+            found, subtotal = sums.get(listing_id, (0, None))
+            if found < nights:
+                results[i] = {'listing': listing_id, 'start_date': start_date,
+                              'end_date': end_date, 'error': "Listing not found or inactive."}
+            else:
+                results[i] = _priced(listing_id, start_date, end_date, nights, subtotal,
+                                     discounts.get(listing_id, ()))
+    return results
+
+
+def quote(listing_id, start_date, end_date):
+    """Price a single stay, raising ``QuoteError`` if it cannot be priced."""
+    result = quote_many([(listing_id, start_date, end_date)])[0]
+    if 'error' in result:
+        raise QuoteError(result['error'])
+    return result
@@ -0,0 +1,264 @@
+"""
+Opt-in per-request profiling of SQL, serializers and gateway calls.
+
+``SQLProfilingMiddleware`` profiles a request when it carries
+``X-Profile-Token: <SQL_PROFILE_TOKEN>`` or is drawn by
+``SQL_PROFILE_SAMPLE_RATE``. A profiled request records every statement
+with its duration and the project line that issued it (through
+``connection.execute_wrapper``), plus ``span()`` timings from the
+serializers, the renderer and the Chapa client, and answers with a
+``Server-Timing`` header.
+
+Requests slower than ``SQL_PROFILE_SLOW_MS``, and every request profiled
+by token, are kept in a ring buffer of the last ``SQL_PROFILE_RING_SIZE``
+entries in the default cache, with EXPLAIN output for their slowest
+queries. ``slow_requests`` and ``/api/profiling/requests/`` read it; the
+cache must be shared between processes for that, and check
+``listings.W001`` warns when it is not.
+
+With neither a token nor a sample rate configured the middleware removes
+itself at startup; otherwise an unprofiled request costs one header
+lookup and one random draw, and ``span()`` one context variable read.
+"""
+import contextvars
+import hmac
+import logging
+import random
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_PROFILE_TOKEN'
+RING_KEY = 'sqlprofile:%d'
+HEAD_KEY = 'sqlprofile:head'
+MAX_QUERIES = 500  # per request; later statements are counted but not kept
+MAX_SQL_LENGTH = 2000
+
+_current = contextvars.ContextVar('sql_profile', default=None)
+_HERE = __file__
+
+
+@contextmanager
+def span(name):
+    """
+    Time a block into the current request's profile, if it has one.
+
+    Spans are wall time, so one that evaluates a queryset includes its SQL.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_span(name, (time.perf_counter() - started) * 1000)
+
+
+def _call_site(frame, root, depth=3):
+    """
+    The innermost ``depth`` project frames above the database layer, as
+    ``path:line function`` joined by `` < `` (callee first), or None.
+    """
+    sites = []
+    while frame is not None and len(sites) < depth:
+        filename = frame.f_code.co_filename
+        if filename.startswith(root) and filename != _HERE and 'site-packages' not in filename:
+            sites.append(f"{Path(filename).relative_to(root)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return ' < '.join(sites) or None
+
+
+class Profile:
+    """Statements and spans recorded for one request."""
+
+    def __init__(self):
+        self.queries = []
+        self.query_count = 0
+        self.sql_ms = 0.0
+        self.spans = {}
+        self.root = str(settings.BASE_DIR) + '/'
+
+    def add_span(self, name, ms):
+        count, total = self.spans.get(name, (0, 0.0))
+        self.spans[name] = (count + 1, total + ms)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            self.query_count += 1
+            self.sql_ms += ms
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'sql': sql, 'params': params, 'many': many, 'ms': ms,
+                    'alias': context['connection'].alias,
+                    'site': _call_site(sys._getframe(1), self.root),
+                })
+
+    def explain(self, top):
+        """Attach EXPLAIN output to the ``top`` slowest single SELECT statements."""
+        candidates = [q for q in self.queries if not q['many'] and q['sql'].lstrip()[:6].upper() == 'SELECT']
+        for query in sorted(candidates, key=lambda q: -q['ms'])[:top]:
+            connection = connections[query['alias']]
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}", query['params'])
+                    query['explain'] = [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+            except DatabaseError as exc:
+                query['explain'] = [f"EXPLAIN failed: {exc}"]
+
+    def summary(self):
+        """JSON-friendly record of the profile; parameters are dropped as they may hold personal data."""
+        repeated = {}
+        for query in self.queries:
+            count, total = repeated.get(query['sql'], (0, 0.0))
+            repeated[query['sql']] = (count + 1, total + query['ms'])
+        return {
+            'query_count': self.query_count,
+            'sql_ms': round(self.sql_ms, 2),
+            'spans': {name: {'count': count, 'ms': round(ms, 2)} for name, (count, ms) in self.spans.items()},
+            'queries': [
+                {'sql': q['sql'][:MAX_SQL_LENGTH], 'ms': round(q['ms'], 3), 'site': q['site'],
+                 **({'explain': q['explain']} if 'explain' in q else {})}
+                for q in self.queries
+            ],
+            # Statements run more than once: the usual sign of an N+1 loop.
+            'repeated': sorted(
+                ({'sql': sql[:MAX_SQL_LENGTH], 'count': count, 'ms': round(ms, 2)}
+                 for sql, (count, ms) in repeated.items() if count > 1),
+                key=lambda r: -r['ms'],
+            ),
+        }
+
+    def server_timing(self, total_ms):
+        metrics = [f'sql;dur={self.sql_ms:.1f};desc="{self.query_count} queries"']
+        metrics += [f'{name.replace(" ", "-")};dur={ms:.1f}' for name, (_, ms) in self.spans.items()]
+        metrics.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(metrics)
+
+
+# -------------------------------
+# Ring buffer of slow requests
+# -------------------------------
+
+def ring_is_shared():
+    """Whether other processes (``slow_requests``, other workers) can read this process's ring."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+@checks.register(checks.Tags.caches)
+def check_ring_cache(app_configs, **kwargs):
+    if not settings.SQL_PROFILE_TOKEN and settings.SQL_PROFILE_SAMPLE_RATE <= 0:
+        return []
+    if ring_is_shared():
+        return []
+    return [checks.Warning(
+        f"Request profiling is enabled but the default cache ({type(caches['default']).__name__}) "
+        f"is local to each process.",
+        hint="Slow requests recorded by web processes are invisible to slow_requests and to other "
+             "workers. Set CACHE_BACKEND to a shared cache such as Redis or the database cache.",
+        id='listings.W001',
+    )]
+
+
+def record(entry):
+    """Store ``entry`` in the ring, overwriting the oldest; returns its id."""
+    cache.add(HEAD_KEY, 0, None)
+    entry_id = cache.incr(HEAD_KEY)
+    entry['id'] = entry_id
+    cache.set(RING_KEY % (entry_id % settings.SQL_PROFILE_RING_SIZE), entry, settings.SQL_PROFILE_RETENTION)
+    return entry_id
+
+
+def headline(entry):
+    """An entry without its per-query detail, for listings."""
+    return {key: value for key, value in entry.items() if key not in ('queries', 'repeated')}
+
+
+def recent(limit=None):
+    """Entries still in the ring, newest first."""
+    head, size = cache.get(HEAD_KEY) or 0, settings.SQL_PROFILE_RING_SIZE
+    ids = range(head, max(head - min(limit or size, size), 0), -1)
+    found = cache.get_many([RING_KEY % (i % size) for i in ids])
+    entries = [found.get(RING_KEY % (i % size)) for i in ids]
+    # A slot may already hold a newer entry from a racing writer.
+    return [entry for i, entry in zip(ids, entries) if entry and entry['id'] == i]
+
+
+def get(entry_id):
+    """The entry with ``entry_id`` while it is still in the ring, else None."""
+    entry = cache.get(RING_KEY % (entry_id % settings.SQL_PROFILE_RING_SIZE))
+    return entry if entry and entry['id'] == entry_id else None
+
+
+def clear():
+    """Empty the ring."""
+    head = cache.get(HEAD_KEY) or 0
+    cache.delete_many([RING_KEY % i for i in range(min(head + 1, settings.SQL_PROFILE_RING_SIZE))])
+    cache.delete(HEAD_KEY)
+
+
+class SQLProfilingMiddleware:
+    """Profile requests selected by token or sampling; see the module docstring."""
+
+    def __init__(self, get_response):
+        self.token = settings.SQL_PROFILE_TOKEN
+        self.sample_rate = settings.SQL_PROFILE_SAMPLE_RATE
+        if not self.token and self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        if not ring_is_shared():
+            logger.warning("Request profiles are kept in a per-process %s; slow_requests cannot read them.",
+                           type(caches['default']).__name__)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        supplied = request.META.get(HEADER)
+        # Bytes: compare_digest rejects str with non-ASCII characters, which a header can carry.
+        if supplied is not None and self.token and hmac.compare_digest(supplied.encode(), self.token.encode()):
+            return self.profile(request, 'token')
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return self.profile(request, 'sampled')
+        return self.get_response(request)
+
+    def profile(self, request, reason):
+        profile = Profile()
+        reset = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(reset)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        response['Server-Timing'] = profile.server_timing(total_ms)
+        if reason == 'token' or total_ms >= settings.SQL_PROFILE_SLOW_MS:
+            profile.explain(settings.SQL_PROFILE_EXPLAIN_TOP)
+            response['X-Profile-Id'] = str(record({
+                'at': timezone.now().isoformat(),
+                'method': request.method,
+                'path': request.get_full_path()[:500],
+                'status': response.status_code,
+                'reason': reason,
+                'total_ms': round(total_ms, 2),
+                **profile.summary(),
+            }))
+        return response
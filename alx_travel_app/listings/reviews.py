@@ -0,0 +1,214 @@
+"""
+Review ingestion.
+
+A review belongs to one stay (booking) and the ``unique_review_per_stay``
+index allows one per user per stay. Reviews pass a per-process filter of
+recently seen comments that catches users repeating themselves and the
+same text posted from many accounts. Imports validate rows a batch at a
+time and write them through ``ReviewBuffer`` with one ``bulk_create``
+per batch.
+"""
+import functools
+import hashlib
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, Review
+from .rollups import queue_deltas, reviews_deltas
+
+# Shorter comments ("Great stay!") repeat innocently across users.
+MIN_SPAM_LENGTH = 20
+DUPLICATE = 'You posted this review recently.'
+SPAM = 'This text was posted too many times recently.'
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _digest(*parts):
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=8).digest()
+
+
+class RecentReviewFilter:
+    """
+    Duplicate and copy-paste spam filter over recent review comments.
+
+    Keeps an LRU of 8-byte hashes of normalised comments, each with the
+    start of its window and how often it was seen in it. A user repeating
+    their own comment within ``window`` seconds is a duplicate; one text
+    seen more than ``max_copies`` times in a window, whoever wrote it, is
+    spam. Past ``size`` entries the least recently seen are evicted, so
+    memory stays around ``size`` * 150 bytes whatever the traffic. State is
+    per process, which is enough to blunt bursts without a shared store.
+    """
+
+    def __init__(self, size, window, max_copies, clock=time.monotonic):
+        self.size, self.window, self.max_copies = size, window, max_copies
+        self.clock = clock
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _hit(self, key, now):
+        """Record one sighting of ``key`` and return the sightings in its current window."""
+        entry = self._seen.pop(key, None)
+        if entry is None or now - entry[0] >= self.window:
+            entry = [now, 0]
+        entry[1] += 1
+        self._seen[key] = entry
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        return entry[1]
+
+    def check(self, user_id, comment):
+        """Remember a review; returns None if it may be stored, otherwise why not."""
+        text = _WHITESPACE.sub(' ', (comment or '').strip().lower())
+        if not text:
+            return None
+        now = self.clock()
+        with self._lock:
+            if self._hit(_digest(str(user_id), text), now) > 1:
+                return DUPLICATE
+            if len(text) >= MIN_SPAM_LENGTH and self._hit(_digest(text), now) > self.max_copies:
+                return SPAM
+        return None
+
+    def __len__(self):
+        return len(self._seen)
+
+
+@functools.lru_cache(maxsize=None)
+def review_filter():
+    """The process-wide RecentReviewFilter."""
+    return RecentReviewFilter(settings.REVIEW_FILTER_SIZE, settings.REVIEW_FILTER_WINDOW,
+                              settings.REVIEW_FILTER_MAX_COPIES)
+
+
+def stay_error(status, start_date):
+    """Why a stay cannot be reviewed yet, or None."""
+    if status != Booking.Status.CONFIRMED:
+        return 'Only confirmed stays can be reviewed.'
+    if start_date > timezone.localdate():
+        return 'A stay can be reviewed once it has started.'
+    return None
+
+
+def _booking_id(row):
+    try:
+        return str(uuid.UUID(str(row.get('booking')).strip()))
+    except ValueError:
+        return None
+
+
+def _rating(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        rating = int(str(value).strip())
+    except ValueError:
+        return None
+    return rating if 1 <= rating <= 5 else None
+
+
+def validate_reviews(rows, first_row, spam_filter=None):
+    """
+    Validate a batch of ``{"booking", "rating", "comment"}`` rows.
+
+    The reviewer and listing come from the booking, which is read for the
+    whole batch in one query. Returns ``(reviews, errors)`` like
+    ``importers.validate_batch``: unsaved ``Review`` instances and
+    ``{"row", "booking", "errors"}`` dicts for the rejected rows.
+    """
+    spam_filter = spam_filter or review_filter()
+    booking_ids = [_booking_id(row) if isinstance(row, dict) else None for row in rows]
+    stays = {}
+    for pk, user_id, listing_id, status, start_date in Booking.objects.filter(
+            pk__in={pk for pk in booking_ids if pk}
+    ).values_list('pk', 'user_id', 'property_id', 'status', 'start_date'):
+        stays[str(pk)] = (user_id, listing_id, status, start_date)
+
+    reviews, errors = [], []
+    for i, row in enumerate(rows):
+        row_errors = {}
+        if not isinstance(row, dict):
+            row_errors['row'] = 'Malformed row.'
+        else:
+            stay = stays.get(booking_ids[i])
+            if stay is None:
+                row_errors['booking'] = 'Booking not found.'
+            elif stay_error(stay[2], stay[3]):
+                row_errors['booking'] = stay_error(stay[2], stay[3])
+            rating = _rating(row.get('rating'))
+            if rating is None:
+                row_errors['rating'] = 'Ensure this value is an integer between 1 and 5.'
+            comment = row.get('comment')
+            if comment is not None and not isinstance(comment, str):
+                row_errors['comment'] = 'Not a valid string.'
+            if not row_errors:
+                reason = spam_filter.check(stay[0], comment)
+                if reason:
+                    row_errors['comment'] = reason
+
+        if row_errors:
+            errors.append({'row': first_row + i, 'booking': booking_ids[i], 'errors': row_errors})
+            continue
+        reviews.append(Review(booking_id=booking_ids[i], user_id_id=stay[0], property_id_id=stay[1],
+                              rating=rating, comment=comment))
+    return reviews, errors
+
+
+class ReviewBuffer:
+    """
+    Collect reviews and insert them ``batch_size`` at a time.
+
+    Use it as a context manager so the last partial batch is written.
+    Reviews of a stay that already has one from the same user are dropped
+    before the insert and counted in ``skipped``; ``ignore_conflicts``
+    absorbs any that race in between. bulk_create sends no post_save, so
+    rollup deltas for the written rows are queued here.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.REVIEW_IMPORT_BATCH_SIZE
+        self.pending = []
+        self.written = 0
+        self.skipped = 0
+
+    def add(self, review):
+        self.pending.append(review)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def extend(self, reviews):
+        for review in reviews:
+            self.add(review)
+
+    def flush(self):
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        # The first review of a stay within the batch wins.
+        unique = {}
+        for review in batch:
+            unique.setdefault((review.user_id_id, str(review.booking_id)), review)
+        taken = {(user_id, str(booking_id)) for user_id, booking_id in Review.objects.filter(
+            booking_id__in={booking_id for _, booking_id in unique}).values_list('user_id', 'booking_id')}
+        fresh = [review for key, review in unique.items() if key not in taken]
+        with transaction.atomic():
+            Review.objects.bulk_create(fresh, ignore_conflicts=True)
+            for listing_id, deltas in reviews_deltas(fresh).items():
+                queue_deltas(listing_id, deltas)
+        self.written += len(fresh)
+        self.skipped += len(batch) - len(fresh)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
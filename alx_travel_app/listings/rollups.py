@@ -0,0 +1,249 @@
+"""
+Per-listing dashboard rollups.
+
+ListingDailyStats keeps one row per listing and day and ListingTotals one
+lifetime row per listing. Small Celery tasks apply deltas to both as
+bookings and reviews are created or removed, so a dashboard reads a fixed
+number of rows however long the history is. A delta is applied at most
+once, which can drift if a task is lost. ``rebuild_rollups`` recomputes
+everything from the live and archived tables and runs nightly to correct
+that drift.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ArchivedBooking, Booking, Listing, ListingDailyStats, ListingTotals, Review
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('bookings', 'booked_nights', 'revenue', 'occupied_nights', 'reviews', 'rating_sum')
+CANCELLED = Booking.Status.CANCELLED
+
+
+def _as_date(value):
+    # A booking created with string dates keeps them until it is re-read.
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _booking_counts(daily, totals, created_at, start_date, end_date, total_price, sign=1):
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    total_price = Decimal(str(total_price))
+    nights = (end_date - start_date).days
+    made = daily[timezone.localdate(created_at)]
+    for counts in (made, totals):
+        counts['bookings'] += sign
+        counts['booked_nights'] += sign * nights
+        counts['revenue'] += sign * total_price
+    totals['occupied_nights'] += sign * nights
+    for i in range(nights):
+        daily[start_date + timedelta(days=i)]['occupied_nights'] += sign
+
+
+def _review_counts(daily, totals, created_at, rating, sign=1):
+    for counts in (daily[timezone.localdate(created_at)], totals):
+        counts['reviews'] += sign
+        counts['rating_sum'] += sign * rating
+
+
+def _new_counts():
+    return defaultdict(int, revenue=Decimal('0.00'))
+
+
+# -------------------------------
+# Incremental maintenance
+# -------------------------------
+
+def booking_deltas(booking, sign=1):
+    """``(daily, totals)`` deltas that add (or with ``sign=-1`` remove) a booking."""
+    daily, totals = defaultdict(_new_counts), _new_counts()
+    _booking_counts(daily, totals, booking.created_at, booking.start_date, booking.end_date,
+                    booking.total_price, sign)
+    return daily, totals
+
+
+def bookings_deltas(bookings, sign=1):
+    """Per-listing ``(daily, totals)`` deltas for many bookings, one entry per listing."""
+    by_listing = {}
+    for booking in bookings:
+        daily, totals = by_listing.setdefault(booking.property_id_id, (defaultdict(_new_counts), _new_counts()))
+        _booking_counts(daily, totals, booking.created_at, booking.start_date, booking.end_date,
+                        booking.total_price, sign)
+    return by_listing
+
+
+def review_deltas(review, sign=1):
+    """``(daily, totals)`` deltas that add (or with ``sign=-1`` remove) a review."""
+    daily, totals = defaultdict(_new_counts), _new_counts()
+    _review_counts(daily, totals, review.created_at, review.rating, sign)
+    return daily, totals
+
+
+def reviews_deltas(reviews, sign=1):
+    """Per-listing ``(daily, totals)`` deltas for many reviews, one entry per listing."""
+    by_listing = {}
+    for review in reviews:
+        daily, totals = by_listing.setdefault(review.property_id_id, (defaultdict(_new_counts), _new_counts()))
+        _review_counts(daily, totals, review.created_at, review.rating, sign)
+    return by_listing
+
+
+def _encode(counts):
+    return {field: str(value) for field, value in counts.items() if value}
+
+
+def queue_deltas(listing_id, deltas):
+    """Hand ``deltas`` to the rollup task once the current transaction commits."""
+    from .tasks import apply_rollup_deltas
+
+    daily, totals = deltas
+    args = (str(listing_id),
+            {day.isoformat(): _encode(counts) for day, counts in daily.items() if _encode(counts)},
+            _encode(totals))
+
+    def send():
+        try:
+            apply_rollup_deltas.delay(*args)
+        except Exception:
+            logger.warning("Could not queue rollup deltas for listing %s", listing_id)
+    transaction.on_commit(send)
+
+
+def _decode(counts):
+    return {field: Decimal(value) if field == 'revenue' else int(value)
+            for field, value in counts.items()}
+
+
+def apply_deltas(listing_id, daily, totals):
+    """
+    Add encoded ``daily`` and ``totals`` deltas to a listing's rollup rows.
+
+    Days that receive the same change are updated with a single UPDATE, so
+    a long stay costs a handful of queries rather than one per night.
+    """
+    daily = {date.fromisoformat(day): _decode(counts) for day, counts in daily.items()}
+    totals = _decode(totals)
+    with transaction.atomic():
+        ListingDailyStats.objects.bulk_create(
+            [ListingDailyStats(listing_id=listing_id, date=day) for day in daily],
+            ignore_conflicts=True,
+        )
+        same_change = defaultdict(list)
+        for day, counts in daily.items():
+            same_change[tuple(sorted(counts.items()))].append(day)
+        for change, days in same_change.items():
+            ListingDailyStats.objects.filter(listing_id=listing_id, date__in=days).update(
+                **{field: F(field) + value for field, value in change}
+            )
+        if totals:
+            ListingTotals.objects.bulk_create([ListingTotals(listing_id=listing_id)], ignore_conflicts=True)
+            ListingTotals.objects.filter(listing_id=listing_id).update(
+                **{field: F(field) + value for field, value in totals.items()}
+            )
+
+
+# -------------------------------
+# Full rebuild
+# -------------------------------
+
+def _rebuild_batch(listing_ids):
+    daily = defaultdict(lambda: defaultdict(_new_counts))
+    totals = defaultdict(_new_counts)
+    for model in (Booking, ArchivedBooking):
+        rows = (model.objects.filter(property_id__in=listing_ids).exclude(status=CANCELLED)
+                .values_list('property_id', 'created_at', 'start_date', 'end_date', 'total_price'))
+        for listing_id, created_at, start_date, end_date, total_price in rows.iterator():
+            _booking_counts(daily[listing_id], totals[listing_id], created_at, start_date, end_date, total_price)
+    reviews = Review.objects.filter(property_id__in=listing_ids).values_list('property_id', 'created_at', 'rating')
+    for listing_id, created_at, rating in reviews.iterator():
+        _review_counts(daily[listing_id], totals[listing_id], created_at, rating)
+
+    with transaction.atomic():
+        ListingDailyStats.objects.filter(listing_id__in=listing_ids).delete()
+        ListingTotals.objects.filter(listing_id__in=listing_ids).delete()
+        ListingDailyStats.objects.bulk_create([
+            ListingDailyStats(listing_id=listing_id, date=day, **counts)
+            for listing_id, days in daily.items()
+            for day, counts in days.items()
+        ], batch_size=1000)
+        ListingTotals.objects.bulk_create([
+            ListingTotals(listing_id=listing_id, **counts) for listing_id, counts in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+def rebuild_rollups(listing_ids=None, batch_size=None):
+    """
+    Recompute rollups from bookings, archived bookings and reviews.
+
+    Listings are processed ``batch_size`` at a time, each batch replaced in
+    one transaction. Returns the number of listings with any activity.
+    """
+    batch_size = batch_size or settings.ROLLUP_BATCH_SIZE
+    queryset = Listing.objects.order_by('pk').values_list('pk', flat=True)
+    if listing_ids is not None:
+        queryset = queryset.filter(pk__in=listing_ids)
+    rebuilt, batch = 0, []
+    for listing_id in queryset.iterator(chunk_size=batch_size):
+        batch.append(listing_id)
+        if len(batch) == batch_size:
+            rebuilt += _rebuild_batch(batch)
+            batch = []
+    if batch:
+        rebuilt += _rebuild_batch(batch)
+    logger.info("Rebuilt rollups for %s listings", rebuilt)
+    return rebuilt
+
+
+# -------------------------------
+# Dashboard reads
+# -------------------------------
+
+def _summary(counts):
+    reviews = counts['reviews']
+    return {
+        'bookings': counts['bookings'],
+        'booked_nights': counts['booked_nights'],
+        'revenue': f"{counts['revenue']:.2f}",
+        'occupied_nights': counts['occupied_nights'],
+        'reviews': reviews,
+        'average_rating': round(counts['rating_sum'] / reviews, 2) if reviews else None,
+    }
+
+
+def listing_dashboard(listing_id, days):
+    """
+    Lifetime totals plus a daily series for the last ``days`` days.
+
+    Reads one ListingTotals row and at most ``days`` ListingDailyStats rows.
+    """
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    totals = ListingTotals.objects.filter(listing_id=listing_id).values(*COUNTERS).first()
+    rows = (ListingDailyStats.objects
+            .filter(listing_id=listing_id, date__gte=start, date__lte=end)
+            .order_by('date')
+            .values('date', *COUNTERS))
+
+    window, series = _new_counts(), []
+    for row in rows:
+        day = row.pop('date')
+        for field in COUNTERS:
+            window[field] += row[field]
+        series.append({'date': day.isoformat(), **_summary(row)})
+
+    summary = _summary(window)
+    summary.update(start_date=start.isoformat(), end_date=end.isoformat(), days=days,
+                   occupancy=round(window['occupied_nights'] / days, 4))
+    return {
+        'listing': str(listing_id),
+        'totals': _summary(totals or _new_counts()),
+        'window': summary,
+        'daily': series,
+    }
@@ -2,39 +2,86 @@
 
 #Create serializers in listings/serializers.py for Listing and Booking models.
 
+from decimal import Decimal
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import  Listing, Booking, User
+from .models import  Listing, ListingImport, Booking, Review, User
+from .profiling import span
+from .reviews import stay_error
+
+
+class SparseFieldsMixin:
+    """Drop fields not listed in ``context['fields']`` (None keeps all)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.context.get('fields')
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+
+class ProfiledListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with span(f'serialize {type(self.child).__name__}'):
+            return super().data
+
+
+class ProfiledSerializerMixin:
+    """
+    Time ``.data`` into the request profile (listings.profiling).
+
+    Set ``Meta.list_serializer_class = ProfiledListSerializer`` so that
+    ``many=True`` is timed once for the whole list.
+    """
+
+    @property
+    def data(self):
+        with span(f'serialize {type(self).__name__}'):
+            return super().data
 
 
 class UserSerializer(serializers.ModelSerializer):
     first_name = serializers.CharField(max_length=255, required=False, read_only=True)
     last_name = serializers.CharField(max_length=255, required=False, read_only=True)
     phone_number = serializers.CharField(max_length=14, required=True)
+    listings = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
     class Meta:
         model = User
         fields = ('id', 'username',
                   'email', 'first_name',
                   'phone_number', 'password',
-                  'last_name'
+                  'last_name', 'listings'
                   )
         read_only_fields = ('id','password',
                             'phone_number', 'last_name',
-                            'first_name',
+                            'first_name', 'listings'
                             )  # Prevent ID modification
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(ProfiledSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     title = serializers.CharField(max_length=255, required=True)
+
+    def validate(self, data):
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("latitude and longitude must be set together.")
+        return data
+
     class Meta:
         model = Listing
-        fields = '__all__'
+        exclude = ('geocell',)
+        list_serializer_class = ProfiledListSerializer
         read_only_fields = ['id', 'created_at',
                             'updated_at','description',
                             'is_active', 'price',
                             'title','ceated_at',
-                            'updated_at'
+                            'updated_at', 'owner'
                             ]
         extra_kwargs = {
             'title': {'required': True, 'max_length': 255},
@@ -43,7 +90,15 @@ class ListingSerializer(serializers.ModelSerializer):
             'is_active': {'default': True}
         }
 
-class BookingSerializer(serializers.ModelSerializer):
+class ListingImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ListingImport
+        fields = ('id', 'source', 'format', 'status', 'batch_size',
+                  'rows_processed', 'rows_upserted', 'rows_failed', 'batches_failed',
+                  'error_report', 'created_at', 'updated_at')
+        read_only_fields = fields
+
+class BookingSerializer(ProfiledSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
         # listings = ListingSerializer(many=True, read_only=True)
         user_id = serializers.PrimaryKeyRelatedField(
             read_only=True, source='user_id.username')
@@ -58,9 +113,10 @@ class BookingSerializer(serializers.ModelSerializer):
         created_at = serializers.DateTimeField(read_only=True)
         updated_at = serializers.DateTimeField(read_only=True)
         property_id = serializers.PrimaryKeyRelatedField(
-             many=True,
-             read_only=True
+             queryset=Listing.objects.filter(is_active=True)
              )
+        # Latest payment's status, from Booking.objects.with_payment_status().
+        payment_status = serializers.CharField(read_only=True, allow_null=True)
 
 
         def validate(self, data):
@@ -76,9 +132,10 @@ class BookingSerializer(serializers.ModelSerializer):
         class Meta:
             model = Booking
             fields = '__all__'
+            list_serializer_class = ProfiledListSerializer
             read_only_fields = ['booking_id', 'created_at',
                                 'updated_at', 'status', 
-                                'property_id', 'user_id',
+                                'user_id',
                                 'total_price','user_id',
                                 'start_date','end_date',''
                                 ]
@@ -93,4 +150,208 @@ class BookingSerializer(serializers.ModelSerializer):
                      'decimal_places': 2
                      },
                 'status': {'default': 'pending'}
-            }
\ No newline at end of file
+            }
+
+
+class ReviewSerializer(ProfiledSerializerMixin, serializers.ModelSerializer):
+    user_id = serializers.CharField(read_only=True, source='user_id.username')
+    property_id = serializers.PrimaryKeyRelatedField(read_only=True)
+    booking = serializers.PrimaryKeyRelatedField(queryset=Booking.objects.all())
+    rating = serializers.IntegerField(min_value=1, max_value=5)
+
+    def validate_booking(self, booking):
+        request = self.context.get('request')
+        if request is None or booking.user_id_id != request.user.pk:
+            raise serializers.ValidationError("Booking not found.")
+        error = stay_error(booking.status, booking.start_date)
+        if error:
+            raise serializers.ValidationError(error)
+        return booking
+
+    class Meta:
+        model = Review
+        list_serializer_class = ProfiledListSerializer
+        fields = ('review_id', 'property_id', 'booking', 'user_id', 'rating', 'comment',
+                  'created_at', 'updated_at')
+        read_only_fields = ('review_id', 'created_at', 'updated_at')
+        # unique_review_per_stay is enforced by its index on insert (see ReviewViewSet.create).
+        validators = []
+
+
+class ReviewImportSerializer(serializers.Serializer):
+    # Rows are checked by reviews.validate_reviews, so a bad row does not sink the batch.
+    reviews = serializers.ListField(allow_empty=False, max_length=10000)
+
+
+class StayQuoteRequestSerializer(serializers.Serializer):
+    listing = serializers.UUIDField()
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+
+class BatchQuoteRequestSerializer(serializers.Serializer):
+    stays = StayQuoteRequestSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class ListingSearchRequestSerializer(serializers.Serializer):
+    """
+    Query of the listing geo search: a circle (``lat``, ``lng``,
+    ``radius_km``) or a box (``bbox=min_lat,min_lng,max_lat,max_lng``,
+    where ``min_lng > max_lng`` crosses the antimeridian).
+    """
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(required=False, min_value=0, max_value=500)
+    bbox = serializers.CharField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
+    is_active = serializers.BooleanField(default=True)
+    limit = serializers.IntegerField(default=50, min_value=1, max_value=500)
+
+    def validate_bbox(self, value):
+        try:
+            min_lat, min_lng, max_lat, max_lng = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("Expected min_lat,min_lng,max_lat,max_lng.")
+        if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+            raise serializers.ValidationError("Coordinates out of range.")
+        return min_lat, min_lng, max_lat, max_lng
+
+    def validate(self, data):
+        circle = [name for name in ('lat', 'lng', 'radius_km') if name in data]
+        if circle and 'bbox' in data:
+            raise serializers.ValidationError("Give either lat, lng and radius_km or bbox, not both.")
+        if 'bbox' not in data and len(circle) != 3:
+            raise serializers.ValidationError("lat, lng and radius_km are required unless bbox is given.")
+        if data.get('min_price') is not None and data.get('max_price') is not None \
+                and data['min_price'] > data['max_price']:
+            raise serializers.ValidationError("min_price must not exceed max_price.")
+        return data
+
+
+class QuoteSerializer(serializers.Serializer):
+    listing = serializers.UUIDField()
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    nights = serializers.IntegerField(required=False)
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    discount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, required=False)
+    error = serializers.CharField(required=False)
+
+# -------------------------------
+
+def _uuid(value):
+    return None if value is None else str(value)
+
+
+def _date(value):
+    return None if value is None else value.isoformat()
+
+
+def _datetime(value, tz):
+    # Same output as DRF's DateTimeField in ISO 8601 mode.
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+_datetime.needs_tz = True
+
+
+def _decimal(places):
+    quantum = Decimal(1).scaleb(-places)
+
+    def convert(value):
+        return None if value is None else f'{value.quantize(quantum):f}'
+    return convert
+
+
+class LeanSerializer:
+    """
+    Read-only serializer for list endpoints that bypasses DRF field objects.
+
+    ``fields`` is a sequence of ``(output_name, lookup, converter)``. Rows
+    are fetched with ``values_list(*lookups)`` and turned into dicts by a
+    row mapper compiled once per class, so each row costs one function call
+    instead of a ``to_representation`` call per field. The output matches
+    the corresponding ModelSerializer field for field.
+    """
+    fields = ()
+    _mappers = {}
+
+    def __init__(self, fields=None):
+        self.selected = tuple(f for f in self.fields if fields is None or f[0] in fields)
+        key = (self.__class__, tuple(f[0] for f in self.selected))
+        mapper = self._mappers.get(key)
+        if mapper is None:
+            mapper = self._mappers[key] = self._compile(self.selected)
+        self.map_row = mapper
+
+    @property
+    def lookups(self):
+        return [lookup for _, lookup, _ in self.selected]
+
+    @staticmethod
+    def _compile(selected):
+        namespace = {}
+        items = []
+        for i, (name, _, convert) in enumerate(selected):
+            if convert is None:
+                items.append(f'{name!r}: row[{i}]')
+            elif getattr(convert, 'needs_tz', False):
+                namespace[f'c{i}'] = convert
+                items.append(f'{name!r}: c{i}(row[{i}], tz)')
+            else:
+                namespace[f'c{i}'] = convert
+                items.append(f'{name!r}: c{i}(row[{i}])')
+        exec(f"def map_row(row, tz):\n    return {{{', '.join(items)}}}", namespace)
+        return namespace['map_row']
+
+    def serialize(self, queryset):
+        """Serialize a queryset (or a page of ``values_list`` rows) to dicts."""
+        if hasattr(queryset, 'values_list'):
+            queryset = queryset.values_list(*self.lookups)
+        with span(f'serialize {type(self).__name__}'):
+            map_row = self.map_row
+            tz = timezone.get_current_timezone()
+            return [map_row(row, tz) for row in queryset]
+
+
+class LeanListingSerializer(LeanSerializer):
+    """List-mode counterpart of ListingSerializer."""
+    fields = (
+        ('id', 'id', _uuid),
+        ('created_at', 'created_at', _datetime),
+        ('updated_at', 'updated_at', _datetime),
+        ('title', 'title', None),
+        ('external_id', 'external_id', None),
+        ('description', 'description', None),
+        ('price', 'price', _decimal(2)),
+        ('weekend_price', 'weekend_price', _decimal(2)),
+        ('is_active', 'is_active', None),
+        ('latitude', 'latitude', None),
+        ('longitude', 'longitude', None),
+        ('owner', 'owner_id', _uuid),
+    )
+
+
+class LeanBookingSerializer(LeanSerializer):
+    """List-mode counterpart of BookingSerializer."""
+    fields = (
+        ('booking_id', 'booking_id', _uuid),
+        ('user_id', 'user_id__username', None),
+        ('start_date', 'start_date', _date),
+        ('end_date', 'end_date', _date),
+        ('total_price', 'total_price', _decimal(2)),
+        ('status', 'status', None),
+        ('created_at', 'created_at', _datetime),
+        ('updated_at', 'updated_at', _datetime),
+        ('property_id', 'property_id', _uuid),
+        ('payment_status', 'payment_status', None),
+        ('currency', 'currency', None),
+        ('total_price_base', 'total_price_base', _decimal(2)),
+    )
@@ -0,0 +1,33 @@
+"""
+Keep derived tables (nightly rates, dashboard rollups) in step with their sources.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Booking, Listing, Review, SeasonalRate
+from .pricing import invalidate_nightly_rates
+from .rollups import booking_deltas, queue_deltas, review_deltas
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_nightly_rates([instance.pk])
+
+
+@receiver(post_save, sender=SeasonalRate)
+@receiver(post_delete, sender=SeasonalRate)
+def seasonal_rate_changed(sender, instance, **kwargs):
+    invalidate_nightly_rates([instance.listing_id])
+
+
+@receiver(post_save, sender=Booking)
+def booking_created(sender, instance, created, **kwargs):
+    if created and instance.status != Booking.Status.CANCELLED:
+        queue_deltas(instance.property_id_id, booking_deltas(instance))
+
+
+@receiver(post_save, sender=Review)
+def review_created(sender, instance, created, **kwargs):
+    if created:
+        queue_deltas(instance.property_id_id, review_deltas(instance))
@@ -5,7 +5,7 @@ from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 import logging
-from .models import Payment
+from .models import ListingImport, Payment
 
 logger = logging.getLogger(__name__)
 
@@ -102,3 +102,84 @@ def send_payment_confirmation_email(payment_id: int):
         "Thank you for booking with us!"
     )
     send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [payment.customer_email], fail_silently=True)
+
+
+@shared_task
+def import_listing_feed(import_id: int):
+    """Run or resume a bulk listing feed import."""
+    from .importers import run_import
+
+    try:
+        job = ListingImport.objects.get(pk=import_id)
+    except ListingImport.DoesNotExist:
+        return
+    if job.status == ListingImport.Status.COMPLETED:
+        return
+    run_import(job)
+
+
+@shared_task
+def archive_history():
+    """Move old bookings and payments to the archive tables and purge old task results."""
+    from .archive import archive_history as run_archive
+
+    counts = run_archive()
+    logger.info(f"Archival finished: {counts}")
+    return counts
+
+
+@shared_task
+def prune_nightly_rates():
+    """Drop materialised nightly rates for nights that have already passed."""
+    from django.utils import timezone
+    from .pricing import prune_nightly_rates as prune
+
+    pruned = prune(timezone.localdate())
+    logger.info(f"Pruned {pruned} past nightly rates")
+    return pruned
+
+
+@shared_task
+def apply_rollup_deltas(listing_id, daily, totals):
+    """Add booking/review deltas to a listing's dashboard rollups."""
+    from .rollups import apply_deltas
+
+    apply_deltas(listing_id, daily, totals)
+
+
+@shared_task
+def rebuild_rollups():
+    """Recompute every listing's dashboard rollups from the source tables."""
+    from .rollups import rebuild_rollups as rebuild
+
+    rebuilt = rebuild()
+    logger.info(f"Rebuilt dashboard rollups for {rebuilt} listings")
+    return rebuilt
+
+
+@shared_task
+def expire_unpaid_bookings():
+    """Cancel pending bookings whose payment never arrived."""
+    from .lifecycle import expire_unpaid_bookings as expire
+
+    return expire()
+
+
+@shared_task
+def confirm_paid_bookings():
+    """Confirm pending bookings that already have a successful payment."""
+    from .lifecycle import confirm_paid_bookings as confirm
+
+    return confirm()
+
+
+@shared_task
+def refresh_fx_rates():
+    """Load FX_RATES_FILE into the rate table, if one is configured."""
+    from .fx import load_rates_file
+
+    if not settings.FX_RATES_FILE:
+        return 0
+    loaded = load_rates_file(settings.FX_RATES_FILE)
+    logger.info(f"Loaded {loaded} exchange rates from {settings.FX_RATES_FILE}")
+    return loaded
@@ -1,3 +1,1300 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core import checks
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import archive, async_views, fx, gateway, geo, importers, profiling, tasks, views
+from .archive import archive_history, find_payment
+from .importers import read_rows, run_import, validate_batch
+from .lifecycle import cancel_booking, confirm_paid_bookings, expire_unpaid_bookings
+from .loadtest import gateway_pointed_at, regressions, serve_in_thread, stub_chapa_server, summarize
+from .management.commands import startup_profile
+from .models import (
+    ArchivedBooking, ArchivedPayment, Booking, FxRate, InvalidTransition, Listing, ListingDailyStats, ListingImport,
+    ListingTotals, NightlyRate, Payment, PaymentEvent, Review, SeasonalRate, StayDiscount, User,
+)
+from .pricing import QuoteError, build_nightly_rates, quote, quote_many
+from .renderers import FastJSONRenderer
+from .rollups import apply_deltas, rebuild_rollups
+from .reviews import DUPLICATE, SPAM, RecentReviewFilter, ReviewBuffer, review_filter, validate_reviews
+from .serializers import BookingSerializer, LeanBookingSerializer, LeanListingSerializer, ListingSerializer
+from .throttling import IPTokenBucketThrottle, TokenBucketThrottle, UserTokenBucketThrottle
+
+
+def make_user(name='guest', **fields):
+    return User.objects.create_user(name, f'{name}@example.com', None, **fields)
+
+
+def make_listing(owner=None, **fields):
+    fields = {'title': 'Loft', 'description': '', 'price': Decimal('100'), **fields}
+    return Listing.objects.create(owner=owner, **fields)
+
+
+def make_booking(listing, user, start, nights=2, **fields):
+    return Booking.objects.create(property_id=listing, user_id=user, start_date=start,
+                                  end_date=start + timedelta(days=nights), total_price=listing.price * nights, **fields)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Run ``migrate_to`` against rows written at ``migrate_from``, via ``setUpBeforeMigration``."""
+    migrate_from = migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('listings', self.migrate_from)])
+        executor.loader.build_graph()
+        self.setUpBeforeMigration(executor.loader.project_state([('listings', self.migrate_from)]).apps)
+        executor.migrate([('listings', self.migrate_to)])
+        executor.loader.build_graph()
+        self.apps = executor.loader.project_state([('listings', self.migrate_to)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+
+def csv_feed(*rows, header='external_id,title,description,price,is_active'):
+    return io.StringIO('\n'.join([header, *rows]) + '\n')
+
+
+class ValidateBatchTests(TestCase):
+    def test_valid_row_becomes_listing(self):
+        listings, errors = validate_batch([{
+            'external_id': ' p-1 ', 'title': 'Loft', 'description': 'Nice', 'price': '120.5',
+            'is_active': 'no', 'latitude': '9.03', 'longitude': '38.74',
+        }], first_row=1)
+        self.assertEqual(errors, [])
+        listing, = listings
+        self.assertEqual(listing.external_id, 'p-1')
+        self.assertEqual(listing.price, Decimal('120.50'))
+        self.assertFalse(listing.is_active)
+        self.assertIsNotNone(listing.geocell)
+
+    def test_rejected_rows_carry_feed_row_numbers(self):
+        rows = [
+            {'external_id': 'ok', 'title': 'A', 'description': '', 'price': '10'},
+            {'external_id': '', 'title': '', 'price': 'abc', 'is_active': 'maybe'},
+            None,
+            {'external_id': 'geo', 'title': 'B', 'description': '', 'price': '1', 'latitude': '95'},
+        ]
+        listings, errors = validate_batch(rows, first_row=11)
+        self.assertEqual([listing.external_id for listing in listings], ['ok'])
+        self.assertEqual([error['row'] for error in errors], [12, 13, 14])
+        self.assertEqual(set(errors[0]['errors']), {'external_id', 'title', 'description', 'price', 'is_active'})
+        self.assertEqual(errors[1]['errors'], {'row': 'Malformed row.'})
+        self.assertEqual(set(errors[2]['errors']), {'latitude', 'location'})
+
+    def test_non_finite_price_rejects_the_row(self):
+        rows = [{'external_id': f'x{i}', 'title': 'A', 'description': '', 'price': price}
+                for i, price in enumerate(('NaN', 'sNaN', 'Infinity', '-inf', '12.5'))]
+        listings, errors = validate_batch(rows, first_row=1)
+        self.assertEqual([listing.external_id for listing in listings], ['x4'])
+        self.assertEqual([error['errors'] for error in errors], [{'price': 'A valid number is required.'}] * 4)
+
+    def test_last_duplicate_external_id_wins(self):
+        rows = [{'external_id': 'dup', 'title': title, 'description': '', 'price': '1'} for title in 'AB']
+        listings, errors = validate_batch(rows, first_row=1)
+        self.assertEqual([listing.title for listing in listings], ['B'])
+        self.assertEqual(errors, [])
+
+    def test_malformed_jsonl_line_is_still_a_row(self):
+        rows = list(read_rows(io.StringIO('{"external_id": "a"}\nnot json\n\n[1]\n'), ListingImport.Format.JSONL))
+        self.assertEqual(rows, [{'external_id': 'a'}, None, None])
+
+
+class RunImportTests(TestCase):
+    def job(self, batch_size=2):
+        return ListingImport.objects.create(source='feed.csv', format=ListingImport.Format.CSV, batch_size=batch_size)
+
+    def test_upserts_on_external_id(self):
+        Listing.objects.create(external_id='p-1', title='Old', description='', price=1)
+        job = run_import(self.job(), csv_feed('p-1,New,d,50,yes', 'p-2,Other,d,60,yes', 'p-3,Third,d,70,no'))
+        self.assertEqual(job.status, ListingImport.Status.COMPLETED)
+        self.assertEqual((job.rows_processed, job.rows_upserted, job.rows_failed), (3, 3, 0))
+        self.assertEqual(Listing.objects.get(external_id='p-1').title, 'New')
+        self.assertEqual(Listing.objects.filter(external_id__startswith='p-').count(), 3)
+
+    def test_resume_skips_committed_rows(self):
+        job = self.job()
+        job.rows_processed = 2
+        job.save()
+        run_import(job, csv_feed('p-1,A,d,1,yes', 'p-2,B,d,1,yes', 'p-3,C,d,1,yes'))
+        self.assertEqual(list(Listing.objects.values_list('external_id', flat=True)), ['p-3'])
+        self.assertEqual(job.rows_processed, 3)
+
+    def test_error_report_is_capped_but_failures_are_counted(self):
+        with mock.patch.object(importers, 'MAX_REPORTED_BATCHES', 2):
+            job = run_import(self.job(batch_size=1), csv_feed(*[f'p-{i},T,d,bad,yes' for i in range(5)]))
+        job.refresh_from_db()
+        self.assertEqual((job.rows_failed, job.batches_failed), (5, 5))
+        self.assertEqual([batch['first_row'] for batch in job.error_report], [1, 2])
+        self.assertEqual(job.error_report[0]['errors'][0]['errors'], {'price': 'A valid number is required.'})
+
+
+class PaymentStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.view = views.PaymentStatusAPIView.as_view()
+
+    def get(self, tx_ref):
+        return self.view(APIRequestFactory().get('/api/payments/status/', {'tx_ref': tx_ref}))
+
+    def payment(self, status=Payment.Status.PENDING):
+        return Payment.objects.create(booking_reference='ref', tx_ref='tx-1', amount='100', status=status)
+
+    def test_terminal_payment_is_answered_from_cache(self):
+        self.payment(Payment.Status.SUCCESS)
+        self.assertFalse(self.get('tx-1').data['checked_gateway'])
+        with self.assertNumQueries(0):
+            response = self.get('tx-1')
+        self.assertEqual(response.data['status'], Payment.Status.SUCCESS)
+
+    def test_pending_payment_checks_gateway_once_per_interval(self):
+        self.payment()
+        pending = (200, {'status': 'success', 'data': {'status': 'pending'}})
+        with mock.patch.object(gateway, 'verify_transaction', return_value=pending) as verify:
+            self.assertTrue(self.get('tx-1').data['checked_gateway'])
+            self.assertFalse(self.get('tx-1').data['checked_gateway'])
+        self.assertEqual(verify.call_count, 1)
+        self.assertEqual(Payment.objects.get().status, Payment.Status.PENDING)
+
+    def test_gateway_success_is_recorded(self):
+        self.payment()
+        paid = (200, {'status': 'success', 'data': {'status': 'success', 'reference': 'AP1'}})
+        with mock.patch.object(gateway, 'verify_transaction', return_value=paid), \
+                mock.patch.object(gateway, 'notify_payment_success'):
+            response = self.get('tx-1')
+        self.assertEqual((response.data['status'], response.data['processor_tx_id']), (Payment.Status.SUCCESS, 'AP1'))
+
+    def test_status_change_clears_cached_answer(self):
+        payment = self.payment()
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.mark_failed({'data': {'status': 'pending'}})
+        self.assertEqual(self.get('tx-1').data['status'], Payment.Status.FAILED)
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.mark_success({'data': {'reference': 'AP2'}})
+        self.assertEqual(self.get('tx-1').data['status'], Payment.Status.SUCCESS)
+
+    def test_unknown_and_missing_tx_ref(self):
+        self.assertEqual(self.get('nope').status_code, 404)
+        self.assertEqual(self.view(APIRequestFactory().get('/api/payments/status/')).status_code, 400)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.listing = make_listing()
+
+    def payment(self, tx_ref, status, age_days):
+        payment = Payment.objects.create(booking_reference='ref', tx_ref=tx_ref, amount='100', status=status)
+        Payment.objects.filter(pk=payment.pk).update(updated_at=timezone.now() - timedelta(days=age_days))
+        return payment
+
+    def test_moves_old_terminal_payments_only(self):
+        paid = self.payment('old-paid', Payment.Status.SUCCESS, 400)
+        paid.record_event('VERIFIED', {'data': {'reference': 'AP1', 'amount': '100', 'currency': 'ETB'}})
+        self.payment('old-pending', Payment.Status.PENDING, 400)
+        self.payment('new-paid', Payment.Status.SUCCESS, 1)
+
+        counts = archive_history(days=365, batch_size=1)
+        self.assertEqual(counts['payments'], 1)
+        self.assertEqual(set(Payment.objects.values_list('tx_ref', flat=True)), {'old-pending', 'new-paid'})
+        archived = ArchivedPayment.objects.get()
+        self.assertEqual((archived.tx_ref, archived.amount_base), ('old-paid', Decimal('100.00')))
+        self.assertEqual(archived.gateway_summary['reference'], 'AP1')
+        self.assertIsInstance(find_payment('old-paid'), ArchivedPayment)
+        self.assertIsInstance(find_payment('new-paid'), Payment)
+
+    def test_moves_bookings_whose_stay_ended(self):
+        today = timezone.localdate()
+        old = make_booking(self.listing, self.user, today - timedelta(days=400))
+        make_booking(self.listing, self.user, today + timedelta(days=5))
+
+        self.assertEqual(archive_history(days=365)['bookings'], 1)
+        archived = ArchivedBooking.objects.get()
+        self.assertEqual((archived.booking_id, archived.property_id, archived.total_price),
+                         (old.booking_id, self.listing.pk, old.total_price))
+        self.assertFalse(Booking.objects.filter(pk=old.pk).exists())
+
+    def test_row_that_stops_matching_mid_chunk_stays_live(self):
+        retried = self.payment('old-failed', Payment.Status.FAILED, 400)
+        self.payment('old-paid', Payment.Status.SUCCESS, 400)
+
+        def retry_then_atomic():
+            # The gateway retries the failed payment after its pk was picked.
+            Payment.objects.filter(pk=retried.pk).update(status=Payment.Status.PENDING)
+            return transaction.atomic()
+
+        with mock.patch.object(archive, 'transaction', mock.Mock(atomic=retry_then_atomic)):
+            counts = archive_history(days=365)
+        self.assertEqual(counts['payments'], 1)
+        self.assertEqual(list(ArchivedPayment.objects.values_list('tx_ref', flat=True)), ['old-paid'])
+        self.assertEqual(Payment.objects.get().tx_ref, 'old-failed')
+
+    def test_rerun_is_a_no_op(self):
+        self.payment('old-paid', Payment.Status.FAILED, 400)
+        archive_history(days=365)
+        self.assertEqual(archive_history(days=365), {'payments': 0, 'bookings': 0, 'task_results': 0})
+
+
+class PaymentEventTests(TestCase):
+    def setUp(self):
+        self.payment = Payment.objects.create(booking_reference='ref', tx_ref='tx-1', amount='100')
+
+    def test_typed_columns_and_compressed_body(self):
+        body = {'status': 'success', 'data': {'reference': 'AP1', 'amount': '99.999', 'currency': 'ETB',
+                                              'created_at': '2026-01-01T10:00:00Z'}}
+        event = self.payment.record_event(PaymentEvent.Kind.VERIFIED, body)
+        self.assertEqual((event.reference, event.amount, event.currency), ('AP1', Decimal('100.00'), 'ETB'))
+        self.assertEqual(event.gateway_created_at.year, 2026)
+        self.assertEqual(PaymentEvent.objects.with_payload().get().raw, body)
+
+    def test_malformed_body_is_kept_without_columns(self):
+        event = self.payment.record_event(PaymentEvent.Kind.FAILED, {'data': 'oops', 'message': 'x'})
+        self.assertEqual((event.reference, event.amount, event.gateway_created_at), (None, None, None))
+        self.assertEqual(event.raw, {'data': 'oops', 'message': 'x'})
+
+    def test_body_is_deferred_by_default(self):
+        self.payment.record_event(PaymentEvent.Kind.INITIALIZED, {'data': {}})
+        self.assertIn('payload', PaymentEvent.objects.get().get_deferred_fields())
+        self.assertNotIn('payload', PaymentEvent.objects.with_payload().get().get_deferred_fields())
+
+
+class PaymentEventBackfillMigrationTests(MigrationTestCase):
+    migrate_from, migrate_to = '0005_archive', '0006_payment_event'
+
+    def setUpBeforeMigration(self, apps):
+        Payment = apps.get_model('listings', 'Payment')
+        self.paid_at = timezone.now() - timedelta(days=30)
+        payment = Payment.objects.create(booking_reference='ref', tx_ref='tx-1', amount='100', status='SUCCESS',
+                                         gateway_payload={'data': {'reference': 'AP1', 'amount': '100'}})
+        Payment.objects.filter(pk=payment.pk).update(updated_at=self.paid_at)
+        Payment.objects.create(booking_reference='ref', tx_ref='tx-2', amount='100')
+        for tx_ref, payload in (('tx-3', ['unexpected']), ('tx-4', 'Bad Gateway')):
+            Payment.objects.create(booking_reference='ref', tx_ref=tx_ref, amount='100', status='FAILED',
+                                   gateway_payload=payload)
+
+    def test_last_response_becomes_first_event_dated_by_payment(self):
+        event = self.apps.get_model('listings', 'PaymentEvent').objects.get(payment__tx_ref='tx-1')
+        self.assertEqual((event.kind, event.reference, event.amount), ('VERIFIED', 'AP1', Decimal('100.00')))
+        self.assertEqual(event.created_at, self.paid_at)
+
+    def test_non_object_payloads_are_kept_without_typed_fields(self):
+        events = self.apps.get_model('listings', 'PaymentEvent').objects.filter(payment__tx_ref__in=['tx-3', 'tx-4'])
+        self.assertEqual(
+            [(e.reference, e.amount, e.currency, json.loads(zlib.decompress(e.payload))) for e in events.order_by('id')],
+            [(None, None, '', ['unexpected']), (None, None, '', 'Bad Gateway')])
+
+
+class TokenBucketThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        self.view = mock.Mock(throttle_scope='payments')
+        rates = mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'payments-ip': '3/min', 'payments-user': '3/min'})
+        rates.start()
+        self.addCleanup(rates.stop)
+
+    def allow(self, throttle_class=IPTokenBucketThrottle, addr='10.0.0.1'):
+        throttle = throttle_class()
+        throttle.timer = lambda: self.now
+        request = Request(APIRequestFactory().get('/', REMOTE_ADDR=addr))
+        return throttle.allow_request(request, self.view), throttle
+
+    def test_burst_then_steady_refill(self):
+        self.assertEqual([self.allow()[0] for _ in range(3)], [True, True, True])
+        allowed, throttle = self.allow()
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(throttle.wait(), 20.0)
+        self.now += 20
+        self.assertTrue(self.allow()[0])
+        self.assertFalse(self.allow()[0])
+
+    def test_buckets_are_per_client(self):
+        for _ in range(3):
+            self.allow()
+        self.assertFalse(self.allow()[0])
+        self.assertTrue(self.allow(addr='10.0.0.2')[0])
+
+    def test_user_bucket_skips_anonymous_requests(self):
+        self.assertEqual([self.allow(UserTokenBucketThrottle)[0] for _ in range(5)], [True] * 5)
+
+    def test_unconfigured_scope_is_not_throttled(self):
+        self.view.throttle_scope = 'elsewhere'
+        self.assertEqual([self.allow()[0] for _ in range(5)], [True] * 5)
+
+
+class GatewaySlotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        semaphore = mock.patch.object(gateway, '_inflight', threading.BoundedSemaphore(1))
+        semaphore.start()
+        self.addCleanup(semaphore.stop)
+
+    def test_call_over_the_cap_fails_fast(self):
+        with gateway.gateway_slot():
+            with self.assertRaises(gateway.GatewayBusy):
+                with gateway.gateway_slot():
+                    pass
+        with gateway.gateway_slot():
+            pass
+
+    def test_initiate_answers_503_when_gateway_is_busy(self):
+        request = APIRequestFactory().post('/api/payments/initiate/', {
+            'booking_reference': 'ref', 'amount': '100', 'email': 'guest@example.com'}, format='json')
+        with gateway.gateway_slot():
+            response = views.InitiatePaymentAPIView.as_view()(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(gateway.GatewayBusy().retry_after))
+        self.assertEqual(Payment.objects.get().status, Payment.Status.FAILED)
+
+
+class LeanSerializerTests(TestCase):
+    """The lean list path must render the same bytes as the ModelSerializers."""
+
+    def setUp(self):
+        self.user = make_user()
+        self.listings = [
+            make_listing(owner=self.user, weekend_price=Decimal('150.5'), latitude=9.03, longitude=38.74),
+            make_listing(price=Decimal('0.5')),
+        ]
+        first = make_booking(self.listings[0], self.user, date(2030, 1, 1))
+        make_booking(self.listings[1], self.user, date(2030, 2, 1), currency='USD')
+        Payment.objects.create(booking=first, booking_reference=str(first.pk), tx_ref='tx-1', amount='200',
+                               status=Payment.Status.SUCCESS)
+
+    def assertSameBytes(self, model_data, lean_data):
+        self.assertEqual(FastJSONRenderer().render(lean_data), JSONRenderer().render(model_data))
+
+    def test_listings(self):
+        listings = Listing.objects.order_by('id')
+        self.assertSameBytes(ListingSerializer(listings, many=True).data, LeanListingSerializer().serialize(listings))
+
+    def test_bookings(self):
+        bookings = Booking.objects.with_payment_status().select_related('user_id').order_by('booking_id')
+        self.assertSameBytes(BookingSerializer(bookings, many=True).data, LeanBookingSerializer().serialize(bookings))
+
+    def test_booking_list_matches_detail(self):
+        view = views.BookingViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/api/bookings/')
+        force_authenticate(request, user=self.user)
+        listed = view(request).data
+        listed = listed.get('results', listed) if isinstance(listed, dict) else listed
+        self.assertEqual(len(listed), 2)
+        detail = views.BookingViewSet.as_view({'get': 'retrieve'})
+        for row in listed:
+            request = APIRequestFactory().get(f"/api/bookings/{row['booking_id']}/")
+            force_authenticate(request, user=self.user)
+            self.assertSameBytes(detail(request, pk=row['booking_id']).data, row)
+
+
+class CopyAuthUsersMigrationTests(MigrationTestCase):
+    """Databases created while AUTH_USER_MODEL was auth.User keep their accounts."""
+    migrate_from, migrate_to = '0018_fx_rates', '0019_copy_auth_users'
+
+    def setUpBeforeMigration(self, apps):
+        self.addCleanup(self.drop_auth_tables)
+        group = apps.get_model('auth', 'Group').objects.create(name='hosts')
+        apps.get_model('listings', 'User').objects.create(username='taken', email='dup@example.com')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE auth_user (id integer PRIMARY KEY, password varchar(128), last_login datetime NULL, "
+                "is_superuser bool, username varchar(150), first_name varchar(150), last_name varchar(150), "
+                "email varchar(254), is_staff bool, is_active bool, date_joined datetime)")
+            cursor.execute("CREATE TABLE auth_user_groups (id integer PRIMARY KEY, user_id integer, group_id integer)")
+            cursor.executemany(
+                "INSERT INTO auth_user VALUES (%s, 'hash', NULL, %s, %s, '', '', %s, %s, 1, '2026-01-01 00:00:00')",
+                [(1, True, 'admin', 'admin@example.com', True), (2, False, 'bob', '', False),
+                 (3, False, 'carol', 'dup@example.com', False), (4, False, 'taken', 'x@example.com', False)])
+            cursor.execute("INSERT INTO auth_user_groups VALUES (1, 2, %s)", [group.pk])
+            # The admin log as it was created against auth_user's integer keys.
+            cursor.execute("DROP TABLE django_admin_log")
+            cursor.execute(
+                "CREATE TABLE django_admin_log (id integer PRIMARY KEY, action_time datetime, object_id text NULL, "
+                "object_repr varchar(200), action_flag smallint, change_message text, content_type_id integer NULL, "
+                "user_id integer REFERENCES auth_user (id))")
+            cursor.executemany(
+                "INSERT INTO django_admin_log VALUES (%s, '2026-01-02 00:00:00', '1', 'Loft', 1, '', NULL, %s)",
+                [(1, 1), (2, 4)])
+            cursor.executemany(
+                "INSERT INTO django_session VALUES (%s, %s, '2099-01-01 00:00:00')",
+                [(key, SessionStore().encode(data)) for key, data in (
+                    ('bob', {'_auth_user_id': '2', '_auth_user_hash': 'h'}), ('gone', {'_auth_user_id': '99'}),
+                    ('anonymous', {'cart': 1}))])
+
+    @staticmethod
+    def drop_auth_tables():
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS auth_user_groups")
+            cursor.execute("DROP TABLE IF EXISTS auth_user")
+
+    def test_accounts_are_copied(self):
+        User = self.apps.get_model('listings', 'User')
+        users = {user.username: user for user in User.objects.all()}
+        self.assertEqual(set(users), {'admin', 'bob', 'carol', 'taken'})
+        self.assertEqual(users['taken'].email, 'dup@example.com')
+        self.assertTrue(users['admin'].is_superuser and users['admin'].password == 'hash')
+        self.assertEqual(users['bob'].email, 'bob@users.invalid')
+        self.assertEqual(users['carol'].email, 'carol@users.invalid')
+        self.assertEqual(list(users['bob'].groups.values_list('name', flat=True)), ['hosts'])
+
+    def test_sessions_and_admin_log_follow_the_accounts(self):
+        users = dict(self.apps.get_model('listings', 'User').objects.values_list('username', 'id'))
+        sessions = {key: SessionStore().decode(data) for key, data in
+                    Session.objects.values_list('session_key', 'session_data')}
+        self.assertEqual(sessions, {'bob': {'_auth_user_id': str(users['bob']), '_auth_user_hash': 'h'},
+                                    'anonymous': {'cart': 1}})
+        self.assertEqual(list(LogEntry.objects.order_by('pk').values_list('pk', 'user_id', 'object_repr')),
+                         [(1, users['admin'], 'Loft'), (2, users['taken'], 'Loft')])
+        LogEntry.objects.create(user_id=users['bob'], action_time=timezone.now(), action_flag=2, change_message='')
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.listing = make_listing(owner=self.user, description='x' * 500)
+
+    def call(self, action, query='', **kwargs):
+        request = APIRequestFactory().get(f'/api/listings/{query}')
+        force_authenticate(request, user=self.user)
+        return views.ListingViewSet.as_view({'get': action})(request, **kwargs)
+
+    def test_list_keeps_requested_fields_in_schema_order(self):
+        response = self.call('list', '?fields=title,id')
+        rows = response.data.get('results', response.data) if isinstance(response.data, dict) else response.data
+        self.assertEqual(list(rows[0]), ['id', 'title'])
+
+    def test_exclude_drops_fields(self):
+        response = self.call('retrieve', '?exclude=description,owner', pk=self.listing.pk)
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('owner', response.data)
+        self.assertEqual(response.data['title'], 'Loft')
+
+    def test_detail_reads_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.call('retrieve', '?fields=id,title', pk=self.listing.pk)
+        self.assertEqual(dict(response.data), {'id': str(self.listing.pk), 'title': 'Loft'})
+        select = next(q['sql'] for q in queries if 'listings_listing' in q['sql'])
+        self.assertNotIn('"description"', select)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.call('list', '?fields=title,secret')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', str(response.data['fields']))
+
+
+class QuoteTests(TestCase):
+    # 2030-01-03 is a Thursday, so a three-night stay covers Friday and Saturday.
+    start, end = date(2030, 1, 3), date(2030, 1, 6)
+
+    def setUp(self):
+        self.listing = make_listing(weekend_price=Decimal('150'))
+
+    def test_weekend_nights_use_weekend_price(self):
+        result = quote(self.listing.pk, self.start, self.end)
+        self.assertEqual((result['nights'], result['total']), (3, Decimal('400.00')))
+
+    def test_latest_season_overrides_and_discount_applies(self):
+        SeasonalRate.objects.create(listing=self.listing, start_date=self.start, end_date=self.end, price='80')
+        SeasonalRate.objects.create(listing=self.listing, start_date=self.start, end_date=self.start, price='60')
+        StayDiscount.objects.create(listing=self.listing, min_nights=3, percent='10')
+        result = quote(self.listing.pk, self.start, self.end)
+        self.assertEqual(result['subtotal'], Decimal('220.00'))
+        self.assertEqual((result['discount'], result['total']), (Decimal('22.00'), Decimal('198.00')))
+
+    def test_listing_change_drops_materialised_rates(self):
+        quote(self.listing.pk, self.start, self.end)
+        self.listing.price = Decimal('120')
+        self.listing.save()
+        self.assertFalse(NightlyRate.objects.filter(listing=self.listing).exists())
+        self.assertEqual(quote(self.listing.pk, self.start, self.end)['total'], Decimal('420.00'))
+
+    def test_warm_rates_cost_one_query_per_range(self):
+        other = make_listing()
+        build_nightly_rates([self.listing.pk, other.pk], self.start, self.end)
+        with self.assertNumQueries(2):
+            results = quote_many([(self.listing.pk, self.start, self.end), (other.pk, self.start, self.end)])
+        self.assertEqual([r['total'] for r in results], [Decimal('400.00'), Decimal('300.00')])
+
+    def test_unpriceable_stays(self):
+        inactive = make_listing(is_active=False)
+        results = quote_many([(self.listing.pk, self.end, self.start), (inactive.pk, self.start, self.end)])
+        self.assertEqual([r['error'] for r in results],
+                         ["end_date must be after start_date.", "Listing not found or inactive."])
+        with self.assertRaises(QuoteError):
+            quote(self.listing.pk, self.start, self.start + timedelta(days=365))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.guest = make_user()
+        self.listing = make_listing(owner=self.owner)
+        self.today = timezone.localdate()
+
+    def book(self, **fields):
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay', side_effect=apply_deltas), \
+                self.captureOnCommitCallbacks(execute=True):
+            return make_booking(self.listing, self.guest, self.today, **fields)
+
+    def rollup_rows(self):
+        daily = ListingDailyStats.objects.order_by('date').values_list('date', 'bookings', 'occupied_nights', 'revenue')
+        totals = ListingTotals.objects.values_list('bookings', 'booked_nights', 'revenue')
+        return list(daily), list(totals)
+
+    def dashboard(self, user, days='7'):
+        request = APIRequestFactory().get(f'/api/listings/{self.listing.pk}/dashboard/', {'days': days})
+        force_authenticate(request, user=user)
+        return views.ListingViewSet.as_view({'get': 'dashboard'})(request, pk=self.listing.pk)
+
+    def test_incremental_deltas_match_rebuild(self):
+        self.book()
+        self.book(nights=3)
+        incremental = self.rollup_rows()
+        self.assertEqual(incremental[1], [(2, 5, Decimal('500.00'))])
+        rebuild_rollups()
+        self.assertEqual(self.rollup_rows(), incremental)
+
+    def test_booking_created_with_string_fields(self):
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay', side_effect=apply_deltas), \
+                self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(property_id=self.listing, user_id=self.guest, start_date='2030-01-01',
+                                   end_date='2030-01-03', total_price='200')
+        self.assertEqual(self.rollup_rows()[1], [(1, 2, Decimal('200.00'))])
+
+    def test_cancelled_booking_is_not_counted(self):
+        self.book(status=Booking.Status.CANCELLED)
+        self.assertEqual(self.rollup_rows(), ([], []))
+
+    def test_dashboard_window(self):
+        self.book()
+        response = self.dashboard(self.owner)
+        self.assertEqual(response.status_code, 200)
+        window = response.data['window']
+        self.assertEqual((window['bookings'], window['revenue'], window['occupied_nights']), (1, '200.00', 1))
+        self.assertEqual(response.data['totals']['occupied_nights'], 2)
+
+    def test_dashboard_is_for_the_owner(self):
+        self.assertEqual(self.dashboard(self.guest).status_code, 403)
+        self.assertEqual(self.dashboard(self.owner, days='0').status_code, 400)
+
+
+class UpdateBookingTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.listing = make_listing(owner=self.user)
+        self.booking = make_booking(self.listing, self.user, date(2030, 1, 1))
+
+    def call(self, action, data, user=None):
+        method = 'patch' if action == 'update_booking' else 'delete'
+        request = getattr(APIRequestFactory(), method)(f'/api/listings/{self.listing.pk}/{action}/', data,
+                                                      format='json')
+        force_authenticate(request, user=user or self.user)
+        return views.ListingViewSet.as_view({method: action})(request, pk=self.listing.pk)
+
+    def patch(self, data, user=None):
+        return self.call('update_booking', data, user)
+
+    def test_new_dates_are_requoted_and_move_rollups(self):
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.patch({'id': str(self.booking.pk), 'end_date': '2030-01-04'})
+        self.assertEqual((response.status_code, response.data['total_price']), (200, '300.00'))
+        self.booking.refresh_from_db()
+        self.assertEqual((self.booking.end_date, self.booking.total_price), (date(2030, 1, 4), Decimal('300')))
+        self.assertEqual([call.args[2]['booked_nights'] for call in delay.call_args_list], ['-2', '3'])
+
+    def test_unchanged_stay_keeps_its_price(self):
+        Booking.objects.filter(pk=self.booking.pk).update(total_price=Decimal('150'))
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.patch({'id': str(self.booking.pk), 'start_date': '2030-01-01'})
+        self.assertEqual((response.status_code, response.data['total_price']), (200, '150.00'))
+        delay.assert_not_called()
+
+    def test_clash_with_another_booking_is_a_conflict(self):
+        make_booking(self.listing, self.user, date(2030, 2, 1))
+        response = self.patch({'id': str(self.booking.pk), 'start_date': '2030-02-01', 'end_date': '2030-02-03'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).start_date, date(2030, 1, 1))
+
+    def test_only_the_guest_or_staff(self):
+        data = {'id': str(self.booking.pk), 'end_date': '2030-01-04'}
+        self.assertEqual(self.patch(data, user=make_user('other')).status_code, 403)
+        self.assertEqual(self.call('delete_booking', data, user=make_user('another')).status_code, 403)
+        self.assertEqual(self.patch(data, user=make_user('staff', is_staff=True)).status_code, 200)
+
+    def test_booking_endpoint_requotes_too(self):
+        request = APIRequestFactory().patch(f'/api/bookings/{self.booking.pk}/', {'end_date': '2030-01-05'},
+                                            format='json')
+        force_authenticate(request, user=self.user)
+        response = views.BookingViewSet.as_view({'patch': 'partial_update'})(request, pk=self.booking.pk)
+        self.assertEqual((response.status_code, response.data['total_price']), (200, '400.00'))
+
+    def test_missing_or_unknown_booking(self):
+        other = make_booking(make_listing(), self.user, date(2030, 1, 1))
+        self.assertEqual(self.patch({'end_date': '2030-01-04'}).status_code, 400)
+        self.assertEqual(self.patch({'id': 'nope'}).status_code, 400)
+        self.assertEqual(self.patch({'id': str(other.pk), 'end_date': '2030-01-04'}).status_code, 404)
+
+
+class CreateBookingTests(TestCase):
+    def test_duplicate_stay_is_a_conflict(self):
+        user = make_user()
+        listing = make_listing(owner=user)
+        make_booking(listing, user, date(2030, 1, 1))
+        request = APIRequestFactory().post('/api/bookings/', {
+            'property_id': str(listing.pk), 'start_date': '2030-01-01', 'end_date': '2030-01-03'}, format='json')
+        force_authenticate(request, user=user)
+        with mock.patch.object(views.send_booking_confirmation_email, 'delay') as delay:
+            response = views.BookingViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Booking.objects.count(), 1)
+        delay.assert_not_called()
+
+
+class PaymentBookingTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        listing = make_listing()
+        self.paid = make_booking(listing, self.user, date(2030, 1, 1), status=Booking.Status.CONFIRMED)
+        self.unpaid = make_booking(listing, self.user, date(2030, 2, 1), status=Booking.Status.CONFIRMED)
+
+    def pay(self, booking, tx_ref, status):
+        return Payment.objects.create(booking=booking, booking_reference=str(booking.pk), tx_ref=tx_ref,
+                                      amount='200', status=status)
+
+    def test_payment_status_is_the_latest_payment(self):
+        self.pay(self.paid, 'tx-1', Payment.Status.FAILED)
+        self.pay(self.paid, 'tx-2', Payment.Status.SUCCESS)
+        statuses = dict(Booking.objects.with_payment_status().values_list('pk', 'payment_status'))
+        self.assertEqual(statuses, {self.paid.pk: Payment.Status.SUCCESS, self.unpaid.pk: None})
+
+    def test_paid_and_unpaid(self):
+        self.pay(self.paid, 'tx-1', Payment.Status.SUCCESS)
+        self.pay(self.unpaid, 'tx-2', Payment.Status.FAILED)
+        self.assertEqual(list(Booking.objects.paid()), [self.paid])
+        self.assertEqual(list(Booking.objects.unpaid()), [self.unpaid])
+
+    def test_deleting_booking_keeps_payment(self):
+        payment = self.pay(self.paid, 'tx-1', Payment.Status.SUCCESS)
+        reference = payment.booking_reference
+        self.paid.delete()
+        payment.refresh_from_db()
+        self.assertEqual((payment.booking_id, payment.booking_reference), (None, reference))
+
+
+class PaymentBookingBackfillMigrationTests(MigrationTestCase):
+    migrate_from, migrate_to = '0010_payment_booking', '0011_backfill_payment_booking'
+
+    def setUpBeforeMigration(self, apps):
+        User, Listing, Booking, Payment = (apps.get_model('listings', name)
+                                           for name in ('User', 'Listing', 'Booking', 'Payment'))
+        user = User.objects.create(username='guest', email='guest@example.com')
+        listing = Listing.objects.create(title='Loft', description='', price='100')
+        booking = Booking.objects.create(property_id=listing, user_id=user, start_date=date(2030, 1, 1),
+                                         end_date=date(2030, 1, 3), total_price='200')
+        self.booking_id = booking.pk
+        for tx_ref, reference in (('tx-1', f' {booking.pk} '), ('tx-2', 'not-a-uuid'),
+                                  ('tx-3', '00000000-0000-0000-0000-000000000000'), ('tx-4', str(booking.pk))):
+            Payment.objects.create(booking_reference=reference, tx_ref=tx_ref, amount='200')
+        # One payment per batch, so every batch boundary is crossed.
+        module = importlib.import_module('listings.migrations.0011_backfill_payment_booking')
+        patcher = mock.patch.object(module, 'BATCH_SIZE', 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_payments_are_linked_by_reference(self):
+        Payment = self.apps.get_model('listings', 'Payment')
+        links = dict(Payment.objects.values_list('tx_ref', 'booking_id'))
+        self.assertEqual(links, {'tx-1': self.booking_id, 'tx-2': None, 'tx-3': None, 'tx-4': self.booking_id})
+
+
+class ListingOwnerTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.other = make_user('other')
+        self.listing = make_listing(owner=self.user)
+
+    def call(self, viewset, actions, user, **kwargs):
+        request = APIRequestFactory().get('/api/')
+        force_authenticate(request, user=user)
+        return viewset.as_view(actions)(request, **kwargs)
+
+    def test_users_see_only_themselves_with_owned_listings(self):
+        response = self.call(views.UserViewset, {'get': 'list'}, self.user)
+        rows = response.data.get('results', response.data) if isinstance(response.data, dict) else response.data
+        self.assertEqual([(row['username'], row['listings']) for row in rows], [('guest', [self.listing.pk])])
+
+    def test_listing_exposes_owner(self):
+        response = self.call(views.ListingViewSet, {'get': 'retrieve'}, self.other, pk=self.listing.pk)
+        self.assertEqual(response.data['owner'], self.user.pk)
+
+    def test_deleting_owner_keeps_listing(self):
+        self.user.delete()
+        self.listing.refresh_from_db()
+        self.assertIsNone(self.listing.owner)
+
+
+class ListingOwnerBackfillMigrationTests(MigrationTestCase):
+    migrate_from, migrate_to = '0012_listing_owner', '0013_backfill_listing_owner'
+
+    def setUpBeforeMigration(self, apps):
+        User, Listing = apps.get_model('listings', 'User'), apps.get_model('listings', 'Listing')
+        self.first, self.second = (User.objects.create(username=name, email=f'{name}@example.com')
+                                   for name in ('first', 'second'))
+        self.shared, self.orphan = (Listing.objects.create(title=title, description='', price='100')
+                                    for title in ('shared', 'orphan'))
+        self.first.listings.add(self.shared)
+        self.second.listings.add(self.shared)
+
+    def test_earliest_link_becomes_owner(self):
+        Listing = self.apps.get_model('listings', 'Listing')
+        owners = dict(Listing.objects.values_list('title', 'owner_id'))
+        self.assertEqual(owners, {'shared': self.first.pk, 'orphan': None})
+
+    def test_reverse_restores_links_from_owner(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('listings', self.migrate_from)])
+        executor.loader.build_graph()
+        User = executor.loader.project_state([('listings', self.migrate_from)]).apps.get_model('listings', 'User')
+        links = {user.username: [listing.title for listing in user.listings.all()] for user in User.objects.all()}
+        self.assertEqual(links, {'first': ['shared'], 'second': ['shared']})
+
+
+class BookingTransitionTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.listing = make_listing()
+        self.starts = (date(2030, 1, 1) + timedelta(days=7 * i) for i in range(100))
+
+    def booking(self, status=Booking.Status.PENDING, age=None):
+        booking = make_booking(self.listing, self.user, next(self.starts), status=status)
+        if age is not None:
+            Booking.objects.filter(pk=booking.pk).update(created_at=timezone.now() - age)
+        return booking
+
+    def pay(self, booking):
+        Payment.objects.create(booking=booking, booking_reference=str(booking.pk), tx_ref=f'tx-{booking.pk}',
+                               amount='200', status=Payment.Status.SUCCESS)
+
+    def test_only_allowed_moves_succeed(self):
+        for source in Booking.Status:
+            for target in Booking.Status:
+                with self.subTest(source=source, target=target):
+                    booking = self.booking(source)
+                    if target in Booking.TRANSITIONS[source]:
+                        booking.transition_to(target)
+                    else:
+                        with self.assertRaises(InvalidTransition):
+                            booking.transition_to(target)
+                    booking.refresh_from_db()
+                    self.assertEqual(booking.status, target if target in Booking.TRANSITIONS[source] else source)
+
+    def test_stale_instance_does_not_overwrite_concurrent_move(self):
+        booking = self.booking()
+        stale = Booking.objects.get(pk=booking.pk)
+        booking.transition_to(Booking.Status.CANCELLED)
+        with self.assertRaisesMessage(InvalidTransition, 'from cancelled to confirmed'):
+            stale.transition_to(Booking.Status.CONFIRMED)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, Booking.Status.CANCELLED)
+
+    def test_queryset_transition_skips_ineligible_rows(self):
+        when = timezone.now() - timedelta(minutes=1)
+        pending, confirmed, cancelled = (self.booking(status) for status in Booking.Status)
+        self.assertEqual(Booking.objects.confirm(when), 1)
+        self.assertEqual(Booking.objects.cancel(when), 2)
+        self.assertEqual(set(Booking.objects.filter(updated_at=when).values_list('pk', flat=True)),
+                         {pending.pk, confirmed.pk})
+        cancelled.refresh_from_db()
+        self.assertNotEqual(cancelled.updated_at, when)
+
+    def test_cancel_queues_rollup_removal(self):
+        booking = self.booking()
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            cancel_booking(booking)
+        self.assertEqual(delay.call_args.args[2]['bookings'], '-1')
+        with self.assertRaises(InvalidTransition), self.captureOnCommitCallbacks(execute=True):
+            cancel_booking(booking)
+        self.assertEqual(delay.call_count, 1)
+
+    def test_cancel_endpoint_answers_conflict_when_already_cancelled(self):
+        booking = self.booking(Booking.Status.CANCELLED)
+        request = APIRequestFactory().post(f'/api/bookings/{booking.pk}/cancel/')
+        force_authenticate(request, user=self.user)
+        response = views.BookingViewSet.as_view({'post': 'cancel'})(request, pk=booking.pk)
+        self.assertEqual(response.status_code, 409)
+
+    def test_expire_cancels_old_unpaid_pending_bookings_in_batches(self):
+        old = [self.booking(age=timedelta(days=1)) for _ in range(3)]
+        paid = self.booking(age=timedelta(days=1))
+        self.pay(paid)
+        recent = self.booking()
+        confirmed = self.booking(Booking.Status.CONFIRMED, age=timedelta(days=1))
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_unpaid_bookings(batch_size=2), 3)
+        statuses = dict(Booking.objects.values_list('pk', 'status'))
+        self.assertEqual({statuses[b.pk] for b in old}, {Booking.Status.CANCELLED})
+        self.assertEqual([statuses[b.pk] for b in (paid, recent, confirmed)],
+                         [Booking.Status.PENDING, Booking.Status.PENDING, Booking.Status.CONFIRMED])
+        self.assertEqual(sum(int(call.args[2]['bookings']) for call in delay.call_args_list), -3)
+
+    def test_confirm_paid_bookings(self):
+        paid, unpaid = self.booking(), self.booking()
+        self.pay(paid)
+        self.assertEqual(confirm_paid_bookings(batch_size=1), 1)
+        self.assertEqual(Booking.objects.get(pk=paid.pk).status, Booking.Status.CONFIRMED)
+        self.assertEqual(Booking.objects.get(pk=unpaid.pk).status, Booking.Status.PENDING)
+
+    def test_successful_payment_confirms_only_pending_booking(self):
+        pending, cancelled = self.booking(), self.booking(Booking.Status.CANCELLED)
+        for booking in (pending, cancelled):
+            Payment.objects.create(booking=booking, booking_reference=str(booking.pk), tx_ref=f'tx-{booking.pk}',
+                                   amount='200').mark_success({'data': {}})
+        self.assertEqual(Booking.objects.get(pk=pending.pk).status, Booking.Status.CONFIRMED)
+        self.assertEqual(Booking.objects.get(pk=cancelled.pk).status, Booking.Status.CANCELLED)
+
+
+class LoadTestTests(TestCase):
+    def test_summary_percentiles(self):
+        summary = summarize([i / 1000 for i in range(1, 101)], errors=2, elapsed=2.0, queries=[3, 5])
+        self.assertEqual((summary['requests'], summary['throughput_rps'], summary['errors']), (100, 50.0, 2))
+        self.assertEqual((summary['p50_ms'], summary['p95_ms'], summary['queries_per_request']), (50.5, 95.05, 4))
+
+    def test_single_sample_and_no_queries(self):
+        summary = summarize([0.01], errors=0, elapsed=0.01, queries=[])
+        self.assertEqual((summary['p99_ms'], summary['queries_per_request']), (10.0, None))
+
+    def test_regressions_beyond_threshold(self):
+        before = {'scenarios': {'list': {'p95_ms': 10, 'throughput_rps': 100, 'queries_per_request': 2,
+                                         'errors': 0}}}
+        now = {'scenarios': {'list': {'p95_ms': 10.5, 'throughput_rps': 80, 'queries_per_request': 3, 'errors': 1},
+                             'new': {'p95_ms': 1, 'throughput_rps': 1, 'errors': 0}}}
+        found = regressions(before, now, threshold=0.1)
+        self.assertEqual([line.split(' ')[1] for line in found], ['throughput', 'queries/request', 'errors'])
+
+    def test_gateway_calls_reach_the_stub(self):
+        with serve_in_thread(stub_chapa_server()) as server, \
+                gateway_pointed_at(f'http://127.0.0.1:{server.server_port}', max_inflight=1):
+            status, body = gateway.initialize_transaction({'tx_ref': 'tx-1'})
+            self.assertEqual((status, body['data']['checkout_url']), (200, 'https://checkout.example.test/tx-1'))
+            status, body = gateway.verify_transaction('tx-1')
+            self.assertEqual((status, body['data']['tx_ref']), (200, 'tx-1'))
+            with gateway.gateway_slot(), self.assertRaises(gateway.GatewayBusy):
+                gateway.verify_transaction('tx-1')
+
+
+class AsyncPaymentViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for target, attribute, value in ((gateway, '_inflight', threading.BoundedSemaphore(1)),
+                                         (gateway, 'httpx_module', mock.Mock(return_value=None))):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.booking = make_booking(make_listing(), make_user(), date(2030, 1, 1))
+        self.body = {'booking_reference': str(self.booking.pk), 'amount': '200', 'email': 'guest@example.com'}
+
+    def initiate_async(self):
+        request = AsyncRequestFactory().post('/api/payments/initiate/', self.body, content_type='application/json')
+        return async_to_sync(async_views.InitiatePaymentView.as_view())(request)
+
+    def test_matches_sync_view(self):
+        reply = (200, {'status': 'success', 'data': {'checkout_url': 'https://checkout.example.test/x'}})
+        with mock.patch.object(gateway, '_initialize', return_value=reply) as initialize:
+            response = self.initiate_async()
+            sync_response = views.InitiatePaymentAPIView.as_view()(
+                APIRequestFactory().post('/api/payments/initiate/', self.body, format='json'))
+        sync_response.render()
+        self.assertEqual(response.status_code, 201)
+        bodies = [json.loads(r.content) for r in (response, sync_response)]
+        self.assertEqual(*[{k: v for k, v in body.items() if k != 'tx_ref'} for body in bodies])
+        payload = initialize.call_args_list[0].args[0]
+        self.assertEqual((payload['amount'], payload['currency']), ('200.00', fx.base_currency()))
+        self.assertEqual(Payment.objects.filter(booking=self.booking).count(), 2)
+
+    def test_busy_gateway_is_shed_before_the_pool(self):
+        with mock.patch.object(gateway, '_initialize') as initialize, gateway.gateway_slot():
+            response = self.initiate_async()
+        self.assertEqual((response.status_code, response['Retry-After']),
+                         (503, str(gateway.GatewayBusy().retry_after)))
+        initialize.assert_not_called()
+        self.assertEqual(Payment.objects.get().status, Payment.Status.FAILED)
+
+    def test_pool_call_releases_its_slot(self):
+        self.assertEqual(asyncio.run(gateway._in_pool(lambda: threading.current_thread().name)).split('_')[0],
+                         'chapa')
+        with gateway.gateway_slot():
+            pass
+
+
+class StartupTests(TestCase):
+    HEAVY = ('requests', 'httpx', 'rest_framework', 'drf_yasg', 'django.contrib.admin', 'listings.async_views')
+
+    def boot(self, role):
+        """Modules from HEAVY that booting ``role`` imported, in a fresh interpreter."""
+        report = f"import sys\nprint(','.join(['-', *(m for m in {self.HEAVY!r} if m in sys.modules)]))\n"
+        script = startup_profile.BOOT[role] + report
+        env = dict(os.environ, PROCESS_ROLE=role, DJANGO_SETTINGS_MODULE='alx_travel_app.settings')
+        proc = subprocess.run([sys.executable, '-c', script], env=env, cwd=settings.BASE_DIR,
+                              capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        return set(proc.stdout.strip().splitlines()[-1].split(',')[1:])
+
+    def test_worker_boot_imports_no_web_stack(self):
+        self.assertEqual(self.boot('worker'), set())
+
+    def test_web_boot_skips_optional_packages(self):
+        # DRF itself pulls in requests and the admin module; the admin app is not installed.
+        self.assertEqual(self.boot('web') & {'httpx', 'drf_yasg', 'listings.async_views'}, set())
+
+    def test_parse_importtime(self):
+        output = ("import time: self [us] | cumulative | imported package\n"
+                  "import time:       120 |        300 |   json.decoder\n"
+                  "import time:       180 |        480 | json\n")
+        self.assertEqual(startup_profile.parse_importtime(output),
+                         [('json.decoder', 120, 300, 1), ('json', 180, 480, 0)])
+
+    def test_regressions_ignore_small_deltas(self):
+        before = {'roles': {'web': {'boot_ms': 100.0, 'packages': {'django': 40.0, 'listings': 2.0}}}}
+        now = {'roles': {'web': {'boot_ms': 104.0, 'packages': {'django': 60.0, 'listings': 4.0, 'httpx': 9.0}}}}
+        found = startup_profile.Command.regressions(before, now, threshold=0.2, min_delta=5.0)
+        self.assertEqual(found, ['web: django 40.0ms -> 60.0ms', 'web: httpx 0.0ms -> 9.0ms'])
+
+
+class GeoSearchTests(TestCase):
+    # Clusters around ordinary places, the antimeridian and a pole.
+    CENTRES = ((9.03, 38.74), (-17.7, 179.9), (-17.7, -179.9), (89.5, 10.0), (0.0, 0.0))
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        points = [(max(min(lat + rng.uniform(-3, 3), 90.0), -90.0), (lng + rng.uniform(-3, 3) + 540) % 360 - 180)
+                  for lat, lng in cls.CENTRES for _ in range(60)]
+        Listing.objects.bulk_create(
+            Listing(title=f'L{i}', description='', price=Decimal('100'), is_active=i % 7 != 0,
+                    latitude=lat, longitude=lng, geocell=geo.encode(lat, lng))
+            for i, (lat, lng) in enumerate(points))
+        Listing.objects.create(title='Nowhere', description='', price=Decimal('100'))
+        cls.points = {pk: (lat, lng) for pk, lat, lng in
+                      Listing.objects.filter(is_active=True, geocell__isnull=False)
+                      .values_list('pk', 'latitude', 'longitude')}
+
+    def haversine(self, lat1, lng1, lat2, lng2):
+        lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+        return 2 * geo.EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+    def test_radius_matches_brute_force(self):
+        active = Listing.objects.filter(is_active=True)
+        for lat, lng in self.CENTRES:
+            for radius in (5, 150, 400):
+                with self.subTest(lat=lat, lng=lng, radius=radius):
+                    expected = {pk for pk, point in self.points.items() if self.haversine(lat, lng, *point) <= radius}
+                    matches, candidates = geo.within_radius(active, lat, lng, radius)
+                    self.assertEqual({pk for pk, _ in matches}, expected)
+                    self.assertEqual([d for _, d in matches], sorted(d for _, d in matches))
+                    self.assertGreaterEqual(candidates, len(expected))
+
+    def test_box_matches_brute_force_across_the_antimeridian(self):
+        active = Listing.objects.filter(is_active=True)
+        for box in ((7.0, 37.0, 11.0, 40.0), (-20.0, 178.0, -15.0, -178.0), (88.0, -180.0, 90.0, 180.0)):
+            min_lat, min_lng, max_lat, max_lng = box
+            crosses = min_lng > max_lng
+            expected = {pk for pk, (lat, lng) in self.points.items()
+                        if min_lat <= lat <= max_lat
+                        and ((lng >= min_lng or lng <= max_lng) if crosses else min_lng <= lng <= max_lng)}
+            with self.subTest(box=box):
+                matches, _ = geo.within_box(active, *box)
+                self.assertEqual({pk for pk, _ in matches}, expected)
+                self.assertTrue(expected)
+
+    def test_cover_stays_close_to_the_box(self):
+        box = (9.0, 38.7, 9.1, 38.8)
+        ranges = geo.cell_ranges([box])
+        self.assertLessEqual(len(ranges), geo.MAX_CELLS)
+        cover = sum(high - low for low, high in ranges)
+        cells_per_degree2 = (1 << geo.BITS) ** 2 / (360.0 * 180.0)
+        self.assertLess(cover, 16 * 0.1 * 0.1 * cells_per_degree2)
+
+    def test_geocell_follows_coordinates(self):
+        listing = make_listing(latitude=9.03, longitude=38.74)
+        self.assertEqual(listing.geocell, geo.encode(9.03, 38.74))
+        listing.latitude = listing.longitude = None
+        listing.save(update_fields=['latitude', 'longitude'])
+        self.assertIsNone(Listing.objects.get(pk=listing.pk).geocell)
+
+    def test_search_endpoint(self):
+        user = make_user()
+        request = APIRequestFactory().get('/api/listings/search/',
+                                          {'lat': 9.03, 'lng': 38.74, 'radius_km': 150, 'limit': 3, 'fields': 'id'})
+        force_authenticate(request, user=user)
+        response = views.ListingViewSet.as_view({'get': 'search'})(request)
+        self.assertEqual(response.status_code, 200)
+        distances = [row['distance_km'] for row in response.data]
+        self.assertEqual((len(distances), distances), (3, sorted(distances)))
+        self.assertEqual(set(response.data[0]), {'id', 'distance_km'})
+
+
+class RecentReviewFilterTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.filter = RecentReviewFilter(size=100, window=60, max_copies=2, clock=lambda: self.now)
+
+    def test_user_repeating_a_comment_is_a_duplicate_until_the_window_ends(self):
+        self.assertIsNone(self.filter.check('u1', 'Great stay!'))
+        self.assertEqual(self.filter.check('u1', '  GREAT   stay! '), DUPLICATE)
+        self.assertIsNone(self.filter.check('u2', 'Great stay!'))
+        self.now = 61
+        self.assertIsNone(self.filter.check('u1', 'Great stay!'))
+
+    def test_long_text_from_many_users_is_spam(self):
+        text = 'Visit my site for cheap flights now'
+        self.assertEqual([self.filter.check(f'u{i}', text) for i in range(4)], [None, None, SPAM, SPAM])
+        self.assertEqual([self.filter.check(f'v{i}', 'Lovely!') for i in range(4)], [None] * 4)
+
+    def test_memory_is_bounded(self):
+        for i in range(500):
+            self.filter.check('u1', f'comment number {i} that is long enough')
+        self.assertEqual(len(self.filter), 100)
+
+
+class ReviewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        review_filter.cache_clear()
+        self.addCleanup(review_filter.cache_clear)
+        self.user = make_user()
+        self.listing = make_listing()
+        self.stay = make_booking(self.listing, self.user, date(2020, 1, 1), status=Booking.Status.CONFIRMED)
+
+    def create(self, data, user=None):
+        request = APIRequestFactory().post('/api/reviews/', data, format='json')
+        force_authenticate(request, user=user or self.user)
+        return views.ReviewViewSet.as_view({'post': 'create'})(request)
+
+    def test_rows_are_checked_per_row(self):
+        pending = make_booking(self.listing, self.user, date(2020, 2, 1))
+        future = make_booking(self.listing, self.user, date(2099, 1, 1), status=Booking.Status.CONFIRMED)
+        rows = [{'booking': str(self.stay.pk), 'rating': '5', 'comment': 'Lovely'},
+                {'booking': str(pending.pk), 'rating': 4},
+                {'booking': str(future.pk), 'rating': 4},
+                {'booking': 'nope', 'rating': 9, 'comment': 3},
+                'not a row']
+        reviews, errors = validate_reviews(rows, first_row=11, spam_filter=RecentReviewFilter(10, 60, 3))
+        self.assertEqual([(r.user_id_id, r.property_id_id, r.rating) for r in reviews],
+                         [(self.user.pk, self.listing.pk, 5)])
+        self.assertEqual([(e['row'], sorted(e['errors'])) for e in errors],
+                         [(12, ['booking']), (13, ['booking']), (14, ['booking', 'comment', 'rating']), (15, ['row'])])
+
+    def test_buffer_skips_reviewed_stays_and_queues_rollups(self):
+        other = make_booking(self.listing, self.user, date(2020, 3, 1), status=Booking.Status.CONFIRMED)
+        Review.objects.create(booking=self.stay, user_id=self.user, property_id=self.listing, rating=3)
+        with mock.patch.object(tasks.apply_rollup_deltas, 'delay') as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            with ReviewBuffer(batch_size=2) as buffer:
+                buffer.extend(Review(booking=booking, user_id=self.user, property_id=self.listing, rating=5)
+                              for booking in (self.stay, other, other))
+        self.assertEqual((buffer.written, buffer.skipped), (1, 2))
+        self.assertEqual(Review.objects.filter(booking=other).count(), 1)
+        self.assertEqual(sum(int(call.args[2]['reviews']) for call in delay.call_args_list), 1)
+
+    def test_one_review_per_stay(self):
+        data = {'booking': str(self.stay.pk), 'rating': 5, 'comment': 'Lovely'}
+        self.assertEqual(self.create(data).status_code, 201)
+        data['comment'] = 'Still lovely'
+        self.assertEqual(self.create(data).status_code, 409)
+
+    def test_only_own_started_stays(self):
+        response = self.create({'booking': str(self.stay.pk), 'rating': 5}, user=make_user('other'))
+        self.assertEqual(response.status_code, 400)
+        future = make_booking(self.listing, self.user, date(2099, 1, 1), status=Booking.Status.CONFIRMED)
+        response = self.create({'booking': str(future.pk), 'rating': 5})
+        self.assertEqual(response.data['booking'], ['A stay can be reviewed once it has started.'])
+
+    def test_listing_reviews_newest_first(self):
+        for i, start in enumerate((date(2020, 3, 1), date(2020, 4, 1))):
+            booking = make_booking(self.listing, self.user, start, status=Booking.Status.CONFIRMED)
+            Review.objects.create(booking=booking, user_id=self.user, property_id=self.listing, rating=i + 1)
+        request = APIRequestFactory().get('/api/reviews/', {'listing': str(self.listing.pk)})
+        force_authenticate(request, user=make_user('reader'))
+        response = views.ReviewViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual([row['rating'] for row in response.data['results']], [2, 1])
+
+
+@override_settings(SQL_PROFILE_TOKEN='s3cret', SQL_PROFILE_SAMPLE_RATE=0, SQL_PROFILE_SLOW_MS=10_000,
+                   SQL_PROFILE_RING_SIZE=3)
+class SQLProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_listing()
+        with self.assertLogs('listings.profiling', 'WARNING'):
+            self.middleware = profiling.SQLProfilingMiddleware(self.view)
+
+    @staticmethod
+    def view(request):
+        with profiling.span('serialize Listing'):
+            for _ in range(2):
+                list(Listing.objects.all())
+        return HttpResponse('ok')
+
+    def get(self, token=None):
+        headers = {} if token is None else {'HTTP_X_PROFILE_TOKEN': token}
+        return self.middleware(RequestFactory().get('/api/listings/', **headers))
+
+    def test_token_request_is_recorded_with_explain(self):
+        response = self.get('s3cret')
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        self.assertIn('serialize-Listing;dur=', response['Server-Timing'])
+        entry = profiling.get(int(response['X-Profile-Id']))
+        self.assertEqual((entry['reason'], entry['query_count'], entry['spans']['serialize Listing']['count']),
+                         ('token', 2, 1))
+        self.assertEqual(entry['repeated'][0]['count'], 2)
+        self.assertTrue(entry['queries'][0]['explain'])
+        self.assertIn('listings/tests.py', entry['queries'][0]['site'])
+
+    def test_wrong_or_non_ascii_token_is_not_profiled(self):
+        for token in (None, 'wrong', 's3crét'):
+            with self.subTest(token=token):
+                response = self.get(token)
+                self.assertNotIn('Server-Timing', response)
+        self.assertEqual(profiling.recent(), [])
+
+    def test_ring_keeps_the_newest_entries(self):
+        ids = [int(self.get('s3cret')['X-Profile-Id']) for _ in range(5)]
+        self.assertEqual([entry['id'] for entry in profiling.recent()], ids[:1:-1])
+        self.assertIsNone(profiling.get(ids[0]))
+        self.assertNotIn('queries', profiling.headline(profiling.get(ids[-1])))
+
+    @override_settings(SQL_PROFILE_TOKEN='')
+    def test_middleware_removes_itself_when_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.SQLProfilingMiddleware(self.view)
+        self.assertEqual(profiling.check_ring_cache(None), [])
+
+    def test_process_local_cache_is_flagged(self):
+        self.assertEqual([w.id for w in profiling.check_ring_cache(None)], ['listings.W001'])
+        self.assertIn('listings.W001', [w.id for w in checks.run_checks(tags=[checks.Tags.caches])])
+        with self.assertRaisesMessage(CommandError, 'local to each process'):
+            call_command('slow_requests')
+
+    def test_slow_requests_reads_a_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+            self.assertEqual(profiling.check_ring_cache(None), [])
+            entry_id = int(self.get('s3cret')['X-Profile-Id'])
+            out = io.StringIO()
+            call_command('slow_requests', '--json', stdout=out)
+            self.assertEqual([entry['id'] for entry in json.loads(out.getvalue())], [entry_id])
+
+
+class FxTests(TestCase):
+    def setUp(self):
+        fx.invalidate()
+        self.addCleanup(fx.invalidate)
+        fx.load_rates({'as_of': '2026-01-01', 'rates': {'USD': '100', 'JPY': '1000'}})
+        fx.load_rates({'as_of': '2026-06-01', 'rates': {'usd': '120'}})
+        self.user = make_user()
+        self.listing = make_listing()
+
+    def test_rate_of_the_day(self):
+        self.assertEqual(fx.rate('usd', date(2026, 3, 1)), Decimal('100'))
+        self.assertEqual(fx.rate('USD', date(2026, 6, 1)), Decimal('120'))
+        self.assertEqual(fx.rate('USD', date(2025, 1, 1)), Decimal('100'))
+        self.assertEqual(fx.rate('USD'), Decimal('120'))
+        self.assertEqual(fx.rate(fx.base_currency()), 1)
+        with self.assertRaises(fx.UnknownCurrency):
+            fx.rate('GBP')
+        self.assertEqual(fx.to_base('0.005', 'USD', date(2026, 3, 1)), Decimal('0.50'))
+
+    def test_table_is_read_once_per_ttl(self):
+        fx.rates()
+        with self.assertNumQueries(0):
+            fx.rate('USD')
+        FxRate.objects.all().delete()
+        self.assertEqual(fx.rate('USD'), Decimal('120'))
+
+    def test_parse_amount(self):
+        self.assertEqual(fx.parse_amount(' 10.5 ', 'usd'), (Decimal('10.5'), 'USD'))
+        for amount in ('0', '-1', '10.555', 'abc', 'NaN', 'Infinity', ''):
+            with self.subTest(amount=amount), self.assertRaisesMessage(fx.FxError, 'positive number'):
+                fx.parse_amount(amount, 'USD')
+        # Too many digits for Payment.amount, for the decimal context, and for amount_base once converted.
+        for amount, currency in (('10000000000', 'USD'), ('1e30', 'USD'), ('9999999999', 'JPY')):
+            with self.subTest(amount=amount), self.assertRaisesMessage(fx.FxError, 'too large'):
+                fx.parse_amount(amount, currency)
+        with self.assertRaises(fx.UnknownCurrency):
+            fx.parse_amount('10', 'GBP')
+
+    def test_load_rates_rejects_bad_documents(self):
+        with self.assertRaises(fx.FxError):
+            fx.load_rates({'base': 'USD', 'rates': {'EUR': '1'}})
+        with self.assertRaises(fx.FxError):
+            fx.load_rates({'rates': {'EUR': '-1'}})
+
+    def test_base_amount_follows_amount_and_currency(self):
+        booking = make_booking(self.listing, self.user, date(2030, 1, 1), currency='USD')
+        self.assertEqual(booking.total_price_base, Decimal('24000.00'))
+        fx.load_rates({'as_of': timezone.localdate().isoformat(), 'rates': {'USD': '150'}})
+
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.status = Booking.Status.CONFIRMED
+        booking.save()
+        self.assertEqual(Booking.objects.get(pk=booking.pk).total_price_base, Decimal('24000.00'))
+
+        booking.total_price = Decimal('100')
+        booking.save()
+        self.assertEqual(Booking.objects.get(pk=booking.pk).total_price_base, Decimal('15000.00'))
+
+        booking.currency = fx.base_currency()
+        booking.save(update_fields=['currency'])
+        self.assertEqual(Booking.objects.get(pk=booking.pk).total_price_base, Decimal('100.00'))
+
+        booking.currency = 'GBP'
+        booking.save()
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).total_price_base)
+
+    def test_backfill_uses_the_creation_date_rate(self):
+        paid = Payment.objects.create(booking_reference='ref', tx_ref='tx-1', amount='10', currency='USD')
+        odd = Payment.objects.create(booking_reference='ref', tx_ref='tx-2', amount='10', currency='GBP')
+        march = timezone.make_aware(datetime(2026, 3, 1, 12))
+        Payment.objects.update(amount_base=None, created_at=march)
+        result = fx.backfill_base_amounts(batch_size=1)
+        self.assertEqual((result['payments'], result['bookings']), ((1, 1), (0, 0)))
+        self.assertEqual(Payment.objects.get(pk=paid.pk).amount_base, Decimal('1000.00'))
+        self.assertIsNone(Payment.objects.get(pk=odd.pk).amount_base)
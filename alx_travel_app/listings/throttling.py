@@ -0,0 +1,83 @@
+"""
+Token-bucket throttles for the payment and booking endpoints.
+
+Buckets live in the default cache, so limits are shared by every web
+process once CACHES points at a shared backend such as Redis. Each check
+costs one cache read and, when the request is admitted, one cache write.
+"""
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket keyed on ``view.throttle_scope`` plus a per-class suffix.
+
+    A rate of ``"20/min"`` means a bucket of 20 tokens refilled at 20 per
+    minute. The bucket is stored as its "theoretical arrival time" (GCRA),
+    a single float per client, instead of DRF's per-request history list.
+    Concurrent requests racing on the same key can over-admit by at most
+    the number of racers, which is acceptable for load protection.
+    """
+    scope_attr = 'throttle_scope'
+    scope_suffix = None
+    cache_format = 'bucket_%(scope)s_%(ident)s'
+
+    def __init__(self):
+        # The rate depends on the view's scope, so resolve it in allow_request.
+        pass
+
+    def get_ident_for(self, request):
+        raise NotImplementedError('.get_ident_for() must be overridden')
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_for(request)
+        if ident is None:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        base_scope = getattr(view, self.scope_attr, None)
+        if not base_scope:
+            return True
+        self.scope = f"{base_scope}-{self.scope_suffix}"
+        self.rate = self.THROTTLE_RATES.get(self.scope)
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        interval = self.duration / self.num_requests
+        tat = max(self.cache.get(self.key, now), now)
+        allowed_at = tat + interval - self.duration
+        if now < allowed_at:
+            self.retry_in = allowed_at - now
+            return False
+
+        new_tat = tat + interval
+        self.cache.set(self.key, new_tat, int(new_tat - now) + 1)
+        return True
+
+    def wait(self):
+        return getattr(self, 'retry_in', None)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Per-user bucket; anonymous requests are left to the IP bucket."""
+    scope_suffix = 'user'
+
+    def get_ident_for(self, request):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """Per-client-address bucket, applied to every request."""
+    scope_suffix = 'ip'
+
+    def get_ident_for(self, request):
+        return self.get_ident(request)
@@ -1,17 +1,42 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 from listings import views
-from listings.views import InitiatePaymentAPIView, VerifyPaymentAPIView, ChapaWebhookAPIView
+from listings.views import ProfiledRequestsAPIView, QuoteAPIView
 
 router = routers.DefaultRouter()
 router.register(r'bookings', views.BookingViewSet, basename='bookings')
 router.register(r'property', views.ListingViewSet, basename='property')
 router.register(r'user', views.UserViewset, basename='user')
+router.register(r'reviews', views.ReviewViewSet, basename='reviews')
+
+
+def payment_urls(use_async=False):
+    """The Chapa payment routes, served by the async views when ``use_async``."""
+    if use_async:
+        from listings import async_views
+
+        initiate, verify, status, webhook = (
+            async_views.InitiatePaymentView, async_views.VerifyPaymentView,
+            async_views.PaymentStatusView, async_views.ChapaWebhookView,
+        )
+    else:
+        initiate, verify, status, webhook = (
+            views.InitiatePaymentAPIView, views.VerifyPaymentAPIView,
+            views.PaymentStatusAPIView, views.ChapaWebhookAPIView,
+        )
+    return [
+        path('api/payments/initiate/', initiate.as_view(), name='payments-initiate'),
+        path('api/payments/verify/', verify.as_view(), name='payments-verify'),
+        path('api/payments/status/', status.as_view(), name='payments-status'),
+        path('api/payments/webhook/', webhook.as_view(), name='payments-webhook'),
+    ]
+
 
 urlpatterns = [
     path('api/', include(router.urls)),
     path('api-auth/', include('rest_framework.urls')),  # <-- COMMA ADDED
-    path('api/payments/initiate/', InitiatePaymentAPIView.as_view(), name='payments-initiate'),
-    path('api/payments/verify/', VerifyPaymentAPIView.as_view(), name='payments-verify'),
-    path('api/payments/webhook/', ChapaWebhookAPIView.as_view(), name='payments-webhook'),
+    path('api/quotes/', QuoteAPIView.as_view(), name='quotes'),
+    path('api/profiling/requests/', ProfiledRequestsAPIView.as_view(), name='profiling-requests'),
+    *payment_urls(settings.PAYMENT_VIEWS_ASYNC),
 ]
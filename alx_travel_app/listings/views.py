@@ -1,85 +1,264 @@
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework import mixins, viewsets, status
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 import uuid
-import requests
 
-from .models import Booking, Listing, User, Payment
-from .serializers import BookingSerializer, ListingSerializer, UserSerializer
-from .tasks import send_booking_confirmation_email
+from . import fx, gateway, geo, profiling
+from .archive import find_payment
+from .importers import detect_format
+from .lifecycle import cancel_booking
+from .models import (
+    ArchivedPayment, Booking, InvalidTransition, Listing, ListingImport, User, Payment, PaymentEvent,
+    Review,
+)
+from .pagination import ReviewCursorPagination
+from .pricing import QuoteError, quote, quote_many
+from .reviews import ReviewBuffer, review_filter, validate_reviews
+from .rollups import booking_deltas, listing_dashboard, queue_deltas, review_deltas
+from .serializers import (
+    BatchQuoteRequestSerializer, BookingSerializer, LeanBookingSerializer,
+    LeanListingSerializer, ListingImportSerializer, ListingSearchRequestSerializer, ListingSerializer,
+    QuoteSerializer, ReviewImportSerializer, ReviewSerializer, StayQuoteRequestSerializer,
+    UserSerializer,
+)
+from .tasks import import_listing_feed, send_booking_confirmation_email
+from .throttling import IPTokenBucketThrottle, UserTokenBucketThrottle
 import logging
 
+logger = logging.getLogger(__name__)
+
 # -------------------------------
 # User, Booking, Listing ViewSets
 # -------------------------------
 
+class FieldProjectionMixin:
+    """
+    Sparse fieldsets via ``?fields=a,b`` and ``?exclude=c``.
+
+    The available field names are those of ``lean_serializer_class``. The
+    selection trims the serializer output and is pushed down into the
+    queryset with ``only()`` so unrequested columns are never read.
+    """
+    lean_serializer_class = None
+
+    def get_requested_fields(self):
+        """Selected output field names in schema order, or None for all of them."""
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = self._parse_requested_fields()
+        return self._requested_fields
+
+    def _parse_requested_fields(self):
+        if self.lean_serializer_class is None or self.request is None or self.request.method != 'GET':
+            return None
+        params = self.request.query_params
+        fields = {f.strip() for f in params.get('fields', '').split(',') if f.strip()}
+        exclude = {f.strip() for f in params.get('exclude', '').split(',') if f.strip()}
+        if not fields and not exclude:
+            return None
+
+        available = [name for name, _, _ in self.lean_serializer_class.fields]
+        unknown = (fields | exclude).difference(available)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        return [name for name in available
+                if (not fields or name in fields) and name not in exclude]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        selected = self.get_requested_fields()
+        if selected is None or self.action == 'list':
+            # The lean list path projects with values_list() itself.
+            return queryset
+        lookups = [lookup for name, lookup, _ in self.lean_serializer_class.fields
+                   if name in selected and lookup not in queryset.query.annotations]
+        related = {lookup.split('__')[0] for lookup in lookups if '__' in lookup}
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*lookups)
+
+
+class LeanListMixin(FieldProjectionMixin):
+    """
+    Serve the list action through ``lean_serializer_class``.
+
+    Rows are read with ``values_list`` and mapped straight to dicts, which
+    skips model instantiation and per-field DRF serialization while
+    producing the same JSON as ``serializer_class``.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if self.lean_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        lean = self.lean_serializer_class(fields=self.get_requested_fields())
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*lean.lookups)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(lean.serialize(page))
+        return Response(lean.serialize(queryset))
+
+
 class UserViewset(viewsets.ModelViewSet):
-    queryset = User.objects.all()
+    # Owned listing ids come from one indexed owner_id IN (...) query per page.
+    queryset = User.objects.prefetch_related(
+        Prefetch('listings', queryset=Listing.objects.only('id', 'owner'))
+    )
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
-    lookup_field = 'bookings'
-    lookup_field = 'listings'
+
+    def get_queryset(self):
+        """
+        Staff see every user; everyone else only themselves
+        """
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(pk=self.request.user.pk)
 
 
+class BookingConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'You already have a booking for this stay.'
+    default_code = 'conflict'
 
-class BookingViewSet(viewsets.ModelViewSet):
-    queryset = Booking.objects.all()
+
+def save_booking_update(serializer):
+    """
+    Save a validated BookingSerializer update.
+
+    When the listing or dates change the stay is re-priced by the quote
+    engine and its dashboard rollups move from the old stay to the new
+    one. Raises ValidationError for a stay that cannot be priced and
+    BookingConflict for one that duplicates another booking.
+    """
+    booking, data = serializer.instance, serializer.validated_data
+    stay = (booking.property_id_id, booking.start_date, booking.end_date)
+    new_stay = (data['property_id'].pk if 'property_id' in data else stay[0],
+                data.get('start_date', stay[1]), data.get('end_date', stay[2]))
+    if new_stay == stay:
+        return serializer.save()
+
+    try:
+        price = quote(*new_stay)['total']
+    except QuoteError as exc:
+        raise ValidationError({'detail': str(exc)})
+    removed = booking_deltas(booking, sign=-1)
+    try:
+        with transaction.atomic():
+            booking = serializer.save(total_price=price)
+            if booking.status != Booking.Status.CANCELLED:
+                queue_deltas(stay[0], removed)
+                queue_deltas(booking.property_id_id, booking_deltas(booking))
+    except IntegrityError:
+        raise BookingConflict()
+    return booking
+
+
+class BookingViewSet(LeanListMixin, viewsets.ModelViewSet):
+    queryset = Booking.objects.with_payment_status()
     serializer_class = BookingSerializer
+    lean_serializer_class = LeanBookingSerializer
     permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'bookings'
     logger = logging.getLogger(__name__)
 
+    def get_throttles(self):
+        # Only booking creation fans out to the broker; reads stay unthrottled.
+        if self.action == 'create':
+            return super().get_throttles()
+        return []
+
     def create(self, request, *args, **kwargs):
         """
-        Create a new booking and trigger email notification
+        Create a new booking priced by the quote engine and trigger email notification
         """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            price = quote(data['property_id'].pk, data['start_date'], data['end_date'])
+        except QuoteError as exc:
+            raise ValidationError({'detail': str(exc)})
+
+        try:
+            with transaction.atomic():
+                booking = serializer.save(user_id=request.user, total_price=price['total'])
+        except IntegrityError:
+            raise BookingConflict()
         try:
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            booking = serializer.save(user=request.user)
             send_booking_confirmation_email.delay(
-                booking_id=booking.id,
+                booking_id=str(booking.booking_id),
                 user_email=request.user.email,
                 user_name=request.user.get_full_name() or request.user.username,
-                listing_title=booking.listing.title,
-                check_in_date=booking.check_in_date.strftime('%Y-%m-%d'),
-                check_out_date=booking.check_out_date.strftime('%Y-%m-%d')
-            )
-            self.logger.info(f"Booking created and email task queued for booking {booking.id}")
-            headers = self.get_success_headers(serializer.data)
-            return Response(
-                {
-                    'message': 'Booking created successfully. Confirmation email will be sent shortly.',
-                    'booking': serializer.data
-                },
-                status=status.HTTP_201_CREATED,
-                headers=headers
+                listing_title=booking.property_id.title,
+                check_in_date=booking.start_date.strftime('%Y-%m-%d'),
+                check_out_date=booking.end_date.strftime('%Y-%m-%d')
             )
+            self.logger.info(f"Booking created and email task queued for booking {booking.booking_id}")
         except Exception as e:
-            self.logger.error(f"Error creating booking: {str(e)}")
-            return Response(
-                {'error': 'Failed to create booking'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            self.logger.error(f"Could not queue confirmation email for booking {booking.booking_id}: {str(e)}")
+        headers = self.get_success_headers(serializer.data)
+        return Response(
+            {
+                'message': 'Booking created successfully. Confirmation email will be sent shortly.',
+                'booking': serializer.data
+            },
+            status=status.HTTP_201_CREATED,
+            headers=headers
+        )
 
     def get_queryset(self):
         """
         Filter bookings for the current user
         """
-        return self.queryset.filter(user=self.request.user)
+        return super().get_queryset().filter(user_id=self.request.user)
 
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """
+        Cancel a pending or confirmed booking
+        """
+        booking = self.get_object()
+        try:
+            cancel_booking(booking)
+        except InvalidTransition as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(booking).data, status=status.HTTP_200_OK)
+
+    def perform_update(self, serializer):
+        save_booking_update(serializer)
 
-class ListingViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        if instance.status != Booking.Status.CANCELLED:
+            queue_deltas(instance.property_id_id, booking_deltas(instance, sign=-1))
+        instance.delete()
+
+
+class ListingViewSet(LeanListMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing listing instances.
     """
     serializer_class = ListingSerializer
+    lean_serializer_class = LeanListingSerializer
     queryset = Listing.objects.all()
     permission_classes = [IsAuthenticated]
-    lookup_field = 'property'
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
 
     @action(detail=False, methods=['post'])
     def create_listing(self, request):
@@ -88,69 +267,334 @@ class ListingViewSet(viewsets.ModelViewSet):
         """
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            serializer.save(owner=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Listings near a point or inside a box, nearest first.
+
+        ``?lat=&lng=&radius_km=`` searches a circle and adds ``distance_km``
+        to each result; ``?bbox=min_lat,min_lng,max_lat,max_lng`` searches a
+        box. ``min_price``, ``max_price``, ``is_active`` (default true) and
+        ``limit`` apply to both, as do ``fields`` and ``exclude``.
+        """
+        query = ListingSearchRequestSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        queryset = Listing.objects.filter(is_active=params['is_active'])
+        if params.get('min_price') is not None:
+            queryset = queryset.filter(price__gte=params['min_price'])
+        if params.get('max_price') is not None:
+            queryset = queryset.filter(price__lte=params['max_price'])
+        if 'bbox' in params:
+            matches, _ = geo.within_box(queryset, *params['bbox'], limit=params['limit'])
+        else:
+            matches, _ = geo.within_radius(queryset, params['lat'], params['lng'], params['radius_km'],
+                                           limit=params['limit'])
+
+        lean = self.lean_serializer_class(fields=self.get_requested_fields())
+        # pk rides at the end of each row, past the columns the mapper reads.
+        rows = list(Listing.objects.filter(pk__in=[pk for pk, _ in matches]).values_list(*lean.lookups, 'pk'))
+        by_pk = {row[-1]: item for row, item in zip(rows, lean.serialize(rows))}
+        results = []
+        for pk, distance in matches:
+            item = by_pk[pk]
+            if distance is not None:
+                item['distance_km'] = round(distance, 3)
+            results.append(item)
+        return Response(results, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser],
+            permission_classes=[IsAdminUser])
+    def import_feed(self, request):
+        """
+        Accept a partner CSV/JSONL feed and import it in the background.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in ListingImport.Format.values:
+            return Response({'detail': f'Unsupported format: {fmt}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        import_dir = settings.LISTING_IMPORT_DIR
+        import_dir.mkdir(parents=True, exist_ok=True)
+        path = import_dir / f"{uuid.uuid4().hex}.{fmt}"
+        with open(path, 'wb') as dest:
+            for chunk in upload.chunks():
+                dest.write(chunk)
+
+        job = ListingImport.objects.create(
+            source=str(path),
+            format=fmt,
+            batch_size=settings.LISTING_IMPORT_BATCH_SIZE,
+        )
+        import_listing_feed.delay(job.pk)
+        return Response(ListingImportSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def import_status(self, request):
+        """
+        Report progress and the per-batch error report of a feed import.
+        """
+        job_id = request.query_params.get('id', '')
+        job = ListingImport.objects.filter(pk=job_id).first() if job_id.isdigit() else None
+        if job is None:
+            return Response({'detail': 'Import not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ListingImportSerializer(job).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'])
+    def dashboard(self, request, pk=None):
+        """
+        Earnings, occupancy and rating rollups for a listing, for its owner or staff.
+
+        ``?days=`` (default 30) sets the length of the daily series; the
+        response reads the same number of rows whatever the history length.
+        """
+        days = request.query_params.get('days', '30')
+        if not days.isdigit() or not 1 <= int(days) <= settings.DASHBOARD_MAX_DAYS:
+            return Response({'detail': f'days must be between 1 and {settings.DASHBOARD_MAX_DAYS}.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        listing = self.get_object()
+        if listing.owner_id != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied('Only the listing owner can view its dashboard.')
+        return Response(listing_dashboard(listing.pk, int(days)), status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'])
     def retrieve_bookings(self, request, pk=None):
         """
         Retrieve all bookings for a specific listing.
         """
         listing = self.get_object()
-        bookings = listing.bookings.all()
+        bookings = listing.bookings.with_payment_status()
         serializer = BookingSerializer(bookings, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def _guest_booking(self, request, listing):
+        """
+        The listing's booking named by ``request.data['id']``, as ``(booking, None)``,
+        or ``(None, error response)``. Only its guest or staff may act on it.
+        """
+        try:
+            booking_id = uuid.UUID(str(request.data.get('id')))
+        except ValueError:
+            return None, Response({'id': ['A valid booking id is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        booking = listing.bookings.with_payment_status().filter(booking_id=booking_id).first()
+        if booking is None:
+            return None, Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        if booking.user_id_id != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied('Only the guest who made a booking can change it.')
+        return booking, None
+
     @action(detail=True, methods=['put', 'patch'])
     def update_booking(self, request, pk=None):
         """
-        Update a booking for a specific listing.
+        Update a booking for a specific listing, for its guest or staff.
+
+        New dates or a new listing are re-priced like a new booking.
         """
-        listing = self.get_object()
-        booking = listing.bookings.filter(id=request.data['id']).first()
-        if booking:
-            serializer = BookingSerializer(booking, data=request.data, partial=True)
-            if serializer.is_valid():
-                serializer.save()
-                return Response(serializer.data, status=status.HTTP_200_OK)
+        booking, error = self._guest_booking(request, self.get_object())
+        if error:
+            return error
+        serializer = BookingSerializer(booking, data=request.data, partial=True, context={'request': request})
+        if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        save_booking_update(serializer)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['delete'])
     def delete_booking(self, request, pk=None):
         """
-        Delete a booking for a specific listing.
+        Delete a booking for a specific listing, for its guest or staff.
         """
-        listing = self.get_object()
-        booking = listing.bookings.filter(id=request.data['id']).first()
-        if booking:
-            booking.delete()
-            return Response({'message': 'Booking deleted'}, status=status.HTTP_204_NO_CONTENT)
-        return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        booking, error = self._guest_booking(request, self.get_object())
+        if error:
+            return error
+        if booking.status != Booking.Status.CANCELLED:
+            queue_deltas(booking.property_id_id, booking_deltas(booking, sign=-1))
+        booking.delete()
+        return Response({'message': 'Booking deleted'}, status=status.HTTP_204_NO_CONTENT)
+
+
+class ReviewViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                    mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Reviews of stays, one per user per booking.
+
+    ``?listing=<id>`` lists a listing's reviews newest first in cursor
+    pages; without it the list holds the current user's own reviews.
+    """
+    queryset = Review.objects.select_related('user_id')
+    serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'reviews'
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return super().get_throttles()
+        return []
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            listing = self.request.query_params.get('listing')
+            if not listing:
+                return queryset.filter(user_id=self.request.user)
+            try:
+                return queryset.filter(property_id=uuid.UUID(listing))
+            except ValueError:
+                raise ValidationError({'listing': 'Must be a valid UUID.'})
+        if self.action == 'destroy' and not self.request.user.is_staff:
+            return queryset.filter(user_id=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        """
+        Review a stay of the current user, once it is confirmed and has started.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        reason = review_filter().check(request.user.pk, data.get('comment'))
+        if reason:
+            return Response({'comment': [reason]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                serializer.save(user_id=request.user, property_id_id=data['booking'].property_id_id)
+        except IntegrityError:
+            return Response({'detail': 'You have already reviewed this stay.'}, status=status.HTTP_409_CONFLICT)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        queue_deltas(instance.property_id_id, review_deltas(instance, sign=-1))
+        instance.delete()
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser])
+    def import_reviews(self, request):
+        """
+        Import ``{"reviews": [{"booking", "rating", "comment"}, ...]}`` in bulk.
+
+        Rows are validated and written a batch at a time; rejected rows
+        come back in ``errors`` and stays that already have a review are
+        counted as ``skipped``.
+        """
+        payload = ReviewImportSerializer(data=request.data)
+        payload.is_valid(raise_exception=True)
+        rows = payload.validated_data['reviews']
+        batch_size = settings.REVIEW_IMPORT_BATCH_SIZE
+        errors = []
+        with ReviewBuffer(batch_size) as buffer:
+            for start in range(0, len(rows), batch_size):
+                reviews, batch_errors = validate_reviews(rows[start:start + batch_size], start + 1)
+                buffer.extend(reviews)
+                errors.extend(batch_errors)
+        return Response({
+            'received': len(rows),
+            'written': buffer.written,
+            'skipped': buffer.skipped,
+            'rejected': len(errors),
+            'errors': errors[:100],
+        }, status=status.HTTP_200_OK)
+
+
+# -------------------------------
+# Request profiling
+# -------------------------------
+
+class ProfiledRequestsAPIView(APIView):
+    """
+    Slow and token-profiled requests from the profiling ring buffer.
+
+    GET lists the newest entries without per-query detail (``?limit=``,
+    default 50); ``?id=`` returns one entry with its statements, call
+    sites and EXPLAIN output.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        entry_id = request.query_params.get('id')
+        if entry_id is not None:
+            entry = profiling.get(int(entry_id)) if entry_id.isdigit() else None
+            if entry is None:
+                return Response({'detail': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(entry)
+        limit = request.query_params.get('limit', '50')
+        limit = int(limit) if limit.isdigit() and int(limit) > 0 else 50
+        return Response([profiling.headline(entry) for entry in profiling.recent(limit)])
+
+
+# -------------------------------
+# Quotes
+# -------------------------------
+
+class QuoteAPIView(APIView):
+    """
+    Price stays from the nightly rate table.
+
+    GET prices one stay (``?listing=&start_date=&end_date=``); POST prices
+    a batch such as a page of search results (``{"stays": [...]}``).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        stay = StayQuoteRequestSerializer(data=request.query_params)
+        stay.is_valid(raise_exception=True)
+        try:
+            data = stay.validated_data
+            result = quote(data['listing'], data['start_date'], data['end_date'])
+        except QuoteError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response(QuoteSerializer(result).data)
+
+    def post(self, request):
+        batch = BatchQuoteRequestSerializer(data=request.data)
+        batch.is_valid(raise_exception=True)
+        results = quote_many(
+            (stay['listing'], stay['start_date'], stay['end_date'])
+            for stay in batch.validated_data['stays']
+        )
+        return Response({"quotes": QuoteSerializer(results, many=True).data})
 
 
 # -------------------------------
 # Chapa Payment Integration Views
 # -------------------------------
 
-CHAPA_INIT_URL = f"{settings.CHAPA_PUBLIC_BASE}/v1/transaction/initialize"
-CHAPA_VERIFY_URL = f"{settings.CHAPA_PUBLIC_BASE}/v1/transaction/verify"
-DEFAULT_TIMEOUT = 20  # seconds
+def gateway_busy_response(exc):
+    """503 telling the client when to retry after load shedding."""
+    return Response(
+        {"detail": "Payment gateway is busy. Please retry shortly."},
+        status=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 
 class InitiatePaymentAPIView(APIView):
     """
     Initialize a payment for a booking using Chapa.
     """
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'payments'
+
     def post(self, request):
         data = request.data
         for field in ["booking_reference", "amount", "email"]:
             if not data.get(field):
                 return Response({"detail": f"{field} is required."}, status=400)
 
+        try:
+            amount, currency = fx.parse_amount(data["amount"], data.get("currency", fx.base_currency()))
+        except fx.FxError as exc:
+            return Response({"detail": str(exc)}, status=400)
+
         booking_reference = str(data["booking_reference"])
-        amount = str(data["amount"])
-        currency = data.get("currency", "ETB")
         email = data["email"]
         first_name = data.get("first_name", "")
         last_name = data.get("last_name", "")
@@ -158,9 +602,13 @@ class InitiatePaymentAPIView(APIView):
         callback_url = settings.CHAPA_CALLBACK_URL
 
         tx_ref = f"{booking_reference}-{uuid.uuid4().hex[:10]}"
+        try:
+            booking = Booking.objects.filter(pk=uuid.UUID(booking_reference)).first()
+        except ValueError:
+            booking = None
 
         payload = {
-            "amount": amount,
+            "amount": f"{amount:f}",
             "currency": currency,
             "email": email,
             "first_name": first_name,
@@ -171,12 +619,8 @@ class InitiatePaymentAPIView(APIView):
         if callback_url:
             payload["callback_url"] = callback_url
 
-        headers = {
-            "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-            "Content-Type": "application/json",
-        }
-
         payment = Payment.objects.create(
+            booking=booking,
             booking_reference=booking_reference,
             tx_ref=tx_ref,
             amount=amount,
@@ -188,17 +632,19 @@ class InitiatePaymentAPIView(APIView):
         )
 
         try:
-            resp = requests.post(CHAPA_INIT_URL, json=payload, headers=headers, timeout=DEFAULT_TIMEOUT)
-            data_resp = resp.json()
+            status_code, data_resp = gateway.initialize_transaction(payload)
+        except gateway.GatewayBusy as exc:
+            payment.mark_failed({"error": str(exc), "when": "initialize_shed"})
+            return gateway_busy_response(exc)
         except Exception as exc:
             payment.mark_failed({"error": str(exc), "when": "initialize_exception"})
             return Response({"detail": "Failed to contact payment gateway."}, status=502)
 
-        if resp.status_code == 200 and data_resp.get("status") == "success":
+        if status_code == 200 and data_resp.get("status") == "success":
             checkout_url = data_resp.get("data", {}).get("checkout_url")
             payment.checkout_url = checkout_url
-            payment.gateway_payload = data_resp
-            payment.save(update_fields=["checkout_url", "gateway_payload", "updated_at"])
+            payment.save(update_fields=["checkout_url", "updated_at"])
+            payment.record_event(PaymentEvent.Kind.INITIALIZED, data_resp)
             return Response({
                 "message": "Payment initialized.",
                 "tx_ref": tx_ref,
@@ -213,35 +659,38 @@ class VerifyPaymentAPIView(APIView):
     """
     Verify a payment using Chapa.
     """
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'payments'
+
     def get(self, request):
         tx_ref = request.query_params.get("tx_ref")
         if not tx_ref:
             return Response({"detail": "tx_ref is required."}, status=400)
 
-        try:
-            payment = Payment.objects.get(tx_ref=tx_ref)
-        except Payment.DoesNotExist:
+        payment = find_payment(tx_ref)
+        if payment is None:
             return Response({"detail": "Payment not found."}, status=404)
-
-        headers = {
-            "Authorization": f"Bearer {settings.CHAPA_SECRET_KEY}",
-            "Content-Type": "application/json",
-        }
+        if isinstance(payment, ArchivedPayment):
+            # Archived payments are terminal; there is nothing left to verify.
+            return Response({
+                "message": "Payment already settled.",
+                "status": payment.status,
+                "booking_reference": payment.booking_reference,
+                "amount": str(payment.amount),
+                "currency": payment.currency,
+                "processor_tx_id": payment.processor_tx_id,
+            })
 
         try:
-            resp = requests.get(f"{CHAPA_VERIFY_URL}/{tx_ref}", headers=headers, timeout=DEFAULT_TIMEOUT)
-            data_resp = resp.json()
+            status_code, data_resp = gateway.verify_transaction(tx_ref)
+        except gateway.GatewayBusy as exc:
+            return gateway_busy_response(exc)
         except Exception as exc:
             return Response({"detail": "Verification error.", "error": str(exc)}, status=502)
 
-        if resp.status_code == 200 and data_resp.get("status") == "success" and data_resp.get("data", {}).get("status") == "success":
+        if gateway.is_successful(status_code, data_resp):
             payment.mark_success(data_resp)
-            # Optional: Celery email task
-            try:
-                from .tasks import send_payment_confirmation_email
-                send_payment_confirmation_email.delay(payment.id)
-            except Exception:
-                pass
+            gateway.notify_payment_success(payment)
             return Response({
                 "message": "Payment verified successfully.",
                 "status": payment.status,
@@ -259,6 +708,54 @@ class VerifyPaymentAPIView(APIView):
         }, status=400)
 
 
+class PaymentStatusAPIView(APIView):
+    """
+    Cheap payment status read for polling clients.
+
+    Terminal payments are answered from the cache or the database. Chapa
+    is only consulted for PENDING payments, and at most once per
+    PAYMENT_VERIFY_MIN_INTERVAL seconds for a given tx_ref.
+    """
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = 'payment-status'
+
+    def get(self, request):
+        tx_ref = request.query_params.get("tx_ref")
+        if not tx_ref:
+            return Response({"detail": "tx_ref is required."}, status=400)
+
+        cache_key = Payment.status_cache_key(tx_ref)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return Response({**cached, "checked_gateway": False})
+
+        payment = find_payment(tx_ref)
+        if payment is None:
+            return Response({"detail": "Payment not found."}, status=404)
+
+        checked_gateway = False
+        if payment.status == Payment.Status.PENDING:
+            # cache.add is atomic: only the first poller in each interval wins the gateway call.
+            if cache.add(f"payment-verify-gate:{tx_ref}", True, timeout=settings.PAYMENT_VERIFY_MIN_INTERVAL):
+                checked_gateway = True
+                try:
+                    gateway.refresh_payment(payment)
+                except Exception as exc:
+                    logger.warning("Status refresh for %s failed: %s", tx_ref, exc)
+
+        body = {
+            "tx_ref": payment.tx_ref,
+            "status": payment.status,
+            "booking_reference": payment.booking_reference,
+            "amount": str(payment.amount),
+            "currency": payment.currency,
+            "processor_tx_id": payment.processor_tx_id,
+        }
+        if payment.status != Payment.Status.PENDING:
+            cache.set(cache_key, body, timeout=settings.PAYMENT_STATUS_CACHE_TTL)
+        return Response({**body, "checked_gateway": checked_gateway})
+
+
 class ChapaWebhookAPIView(APIView):
     """
     Optional webhook for Chapa callback.